@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import functools
+import glob
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pyarrow.parquet as pq
+
+import main
+import src.indexer as indexer
+import src.metrics as metrics
+import src.segments as segments
+from bench.mock_server import MockConfig, serve
+
+# crawl throughput against bench/mock_server.py, nothing touches the real apis
+# python -m bench.crawl --latency-ms 50 --error-rate 0.01 --rate-limit 200
+# python -m bench.crawl cast_warpcast --extract-workers 0,1,2,4 for extraction scaling
+# each scenario runs in a fresh temp dir (main.py uses relative queue/ data/ paths)
+
+SCENARIOS = [
+    "user_warpcast",
+    "user_searchcaster",
+    "user_ensdata",
+    "cast_warpcast",
+    "reaction_warpcast",
+    "refresh_user",
+    "refresh_cast",
+    "refresh_all",
+    "user_ensdata_rerun",
+    "user_warpcast_revalidate",
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return int(s.getsockname()[1])
+
+
+def start_server(config: MockConfig) -> multiprocessing.Process:
+    # separate process, so server cpu and memory don't pollute the crawler numbers
+    port = free_port()
+    process = multiprocessing.Process(target=serve, args=(config, port), daemon=True)
+    process.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+
+    base = f"http://127.0.0.1:{port}"
+    indexer.UrlMaker.warpcast_url = f"{base}/v2"
+    indexer.UrlMaker.searchcaster_url = f"{base}/api"
+    indexer.UrlMaker.ensdata_url = f"{base}/ens"
+    return process
+
+
+def timed_requests(latencies: List[float]) -> Callable[..., Awaitable[Any]]:
+    fetch = indexer.Fetcher.fetch
+
+    @functools.wraps(fetch)
+    async def _timed(url: str, key: Any = None, kind: Any = None) -> Any:
+        t = time.perf_counter()
+        try:
+            return await fetch(url, key, kind)
+        finally:
+            latencies.append(time.perf_counter() - t)
+
+    return _timed
+
+
+def count_records(pattern: str) -> int:
+    # queues, sealed segments included
+    queues = {p.removesuffix(".segments") for p in glob.glob(pattern + "*")}
+    return sum(segments.read(q).count(b"\n") for q in queues if q.endswith(".ndjson"))
+
+
+def count_rows(file_path: str) -> int:
+    # merged parquet, refresh_cast prunes the queue segments it merged
+    if not os.path.exists(file_path):
+        return 0
+    return int(pq.ParquetFile(file_path).metadata.num_rows)
+
+
+async def run_scenario(name: str, config: MockConfig) -> None:
+    fids = list(range(1, config.n_users + 1))
+    if name == "user_warpcast":
+        await indexer.BatchFetcher.user_warpcast(fids, out="queue/out.ndjson")
+    elif name == "user_searchcaster":
+        await indexer.BatchFetcher.user_searchcaster(fids, out="queue/out.ndjson")
+    elif name == "user_ensdata":
+        rng = np.random.default_rng(config.seed)
+        addrs = ["0x" + rng.bytes(20).hex() for _ in fids]
+        await indexer.BatchFetcher.user_ensdata(addrs, out="queue/out.ndjson")
+    elif name == "cast_warpcast":
+        await indexer.BatchFetcher.cast_warpcast(out="queue/out.ndjson")
+    elif name == "reaction_warpcast":
+        hashes: List[Tuple[str, Optional[str]]] = [
+            (f"0x{i:040x}", None) for i in range(config.n_casts)
+        ]
+        await indexer.BatchFetcher.reaction_warpcast(hashes, out="queue/out.ndjson")
+    elif name == "refresh_user":
+        await main.refresh_user()
+    elif name == "refresh_cast":
+        await main.refresh_cast()
+    elif name == "refresh_all":
+        await main.refresh_all()
+    elif name == "user_ensdata_rerun":  # forced refresh inside the ttl, cache hits
+        await run_scenario("user_ensdata", config)
+        await run_scenario("user_ensdata", config)
+    elif name == "user_warpcast_revalidate":  # forced refresh after the ttl, 304s
+        await run_scenario("user_warpcast", config)
+        ttl = indexer.Fetcher.cache_ttl
+        indexer.Fetcher.cache_ttl = {kind: 1e-9 for kind in ttl}
+        try:
+            await run_scenario("user_warpcast", config)
+        finally:
+            indexer.Fetcher.cache_ttl = ttl
+
+
+def bench(name: str, config: MockConfig, extract_workers: int = 0) -> Dict[str, Any]:
+    latencies: List[float] = []
+    indexer.ExtractPool.workers = extract_workers
+    if extract_workers:
+        # pay the process spawn and imports before the clock starts
+        pool = indexer.ExtractPool.start()
+        list(pool.map(indexer.ExtractPool.lines, [[]] * extract_workers * 4))
+    metrics.registry.reset()
+    cwd = os.getcwd()
+    original = indexer.Fetcher.fetch
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.makedirs("queue")
+        os.makedirs("data")
+        indexer.Fetcher.fetch = timed_requests(latencies)  # type: ignore
+        indexer.Fetcher.cache = None  # a fresh http cache in the temp dir
+        indexer.BatchFetcher.seen_keys = None  # and a fresh seen-set
+        t = time.perf_counter()
+        try:
+            asyncio.run(run_scenario(name, config))
+        finally:
+            elapsed = time.perf_counter() - t
+            indexer.Fetcher.fetch = original  # type: ignore
+            indexer.ExtractPool.shutdown()
+            if indexer.Fetcher.cache is not None:
+                indexer.Fetcher.cache.close()
+                indexer.Fetcher.cache = None
+            indexer.BatchFetcher.close_seen_set()
+            os.chdir(cwd)
+        records = count_records(os.path.join(tmp, "queue", "*.ndjson"))
+        records += count_rows(os.path.join(tmp, "data", "casts.parquet"))
+
+    ms = np.array(latencies) * 1000
+    return {
+        "scenario": name,
+        "extract_workers": extract_workers,
+        "seconds": round(elapsed, 3),
+        "requests": len(latencies),
+        "requests_per_s": round(len(latencies) / elapsed, 1),
+        "records": records,
+        "records_per_s": round(records / elapsed, 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2) if len(ms) else None,
+        "p99_ms": round(float(np.percentile(ms, 99)), 2) if len(ms) else None,
+        "retries": metrics.registry.total("crawl_retries_total"),
+        "rejected": metrics.registry.total("crawl_records_rejected_total"),
+        "network_requests": metrics.registry.total("crawl_requests_total"),
+        "cache_hits": metrics.registry.total("crawl_cache_total", result="hit"),
+        "cache_304s": metrics.registry.total("crawl_cache_total", result="revalidated"),
+        # linux reports kilobytes, it's the peak of the whole process so far
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024),
+    }
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description="crawler benchmark on a mock api")
+    parser.add_argument("scenarios", nargs="*", help=f"default: {' '.join(SCENARIOS)}")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=0)
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--casts", type=int, default=5000)
+    parser.add_argument("--pause", type=float, default=0.0, help="BatchFetcher.pause")
+    parser.add_argument("--backoff", type=float, default=0.05, help="Fetcher.backoff")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument(
+        "--extract-workers",
+        default="0",
+        help="ExtractPool sizes to compare, comma separated, 0 = on the event loop",
+    )
+    parser.add_argument("--out", help="write results as json to this file")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    config = MockConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        retry_after=args.retry_after,
+        n_users=args.users,
+        n_casts=args.casts,
+    )
+    indexer.BatchFetcher.pause = args.pause
+    indexer.Fetcher.backoff = args.backoff
+    indexer.Fetcher.max_retries = args.max_retries
+
+    server = start_server(config)
+    try:
+        results = [
+            bench(name, config, int(workers))
+            for name in args.scenarios or SCENARIOS
+            for workers in args.extract_workers.split(",")
+        ]
+    finally:
+        server.terminate()
+
+    for result in results:
+        print(json.dumps(result))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"config": config.model_dump(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,218 @@
+import asyncio
+import hashlib
+import json
+import random
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+import pydantic
+from aiohttp import web
+
+# local stand-in for warpcast, searchcaster and ensdata, responses are synthetic
+# but deterministic (seeded by fid / cast index) so runs are comparable
+# python -m bench.mock_server [port] to run it on its own
+
+T0 = 1690848000000  # 2023-08-01, newest cast
+
+
+class MockConfig(pydantic.BaseModel):
+    latency_ms: float = 20.0
+    jitter_ms: float = 10.0
+    error_rate: float = 0.0  # fraction of requests answered with a 500
+    rate_limit: int = 0  # requests per second before 429s, 0 = unlimited
+    retry_after: float = 0.2  # seconds, sent with every 429
+    n_users: int = 2000
+    n_casts: int = 5000
+    cast_interval_ms: int = 60 * 1000
+    max_reactions: int = 40
+    reaction_page: int = 25
+    seed: int = 0
+    etags: bool = True  # user / profile / ens responses carry an ETag, honor 304s
+
+
+def fake_address(rng: random.Random) -> str:
+    return "0x" + "".join(rng.choice("0123456789abcdef") for _ in range(40))
+
+
+def make_user(config: MockConfig, fid: int) -> Dict[str, Any]:
+    rng = random.Random(config.seed * 1000003 + fid)
+    user: Dict[str, Any] = {
+        "user": {
+            "fid": fid,
+            "username": f"user{fid}",
+            "displayName": f"User {fid}",
+            "pfp": {
+                "url": f"https://i.example/{fid}.png",
+                "verified": rng.random() < 0.1,
+            },
+            "profile": {
+                "bio": {"text": "gm " * rng.randint(0, 20)},
+                "location": {
+                    "placeId": f"place{rng.randint(0, 50)}",
+                    "description": "",
+                },
+            },
+            "followingCount": rng.randint(0, 2000),
+            "followerCount": int(rng.paretovariate(1.2) * 10),
+            "activeOnFcNetwork": rng.random() < 0.3,
+        },
+        "collectionsOwned": [{"id": f"col{rng.randint(0, 9)}"}] if fid % 7 == 0 else [],
+    }
+    if fid > 1:  # the api leaves the key out rather than sending null
+        user["inviter"] = {"fid": rng.randint(1, fid - 1)}
+    return user
+
+
+def make_profile(config: MockConfig, fid: int) -> Dict[str, Any]:
+    rng = random.Random(config.seed * 1000033 + fid)
+    return {
+        "body": {
+            "id": fid,
+            "address": fake_address(rng),
+            "registeredAt": T0 - fid * 3600 * 1000,
+        },
+        "connectedAddress": fake_address(rng) if rng.random() < 0.5 else None,
+    }
+
+
+def make_cast(config: MockConfig, i: int) -> Dict[str, Any]:
+    rng = random.Random(config.seed * 1000037 + i)
+    author = min(int(rng.paretovariate(1.1)), config.n_users)
+    channel = rng.random() < 0.2
+    parent = i + rng.randint(1, 50) if rng.random() < 0.4 else None
+    cast: Dict[str, Any] = {
+        "hash": f"0x{i:040x}",
+        "threadHash": f"0x{(parent or i):040x}",
+        "parentHash": f"0x{parent:040x}" if parent else None,
+        "author": {"fid": author},
+        "text": " ".join(
+            rng.choice(["gm", "frens", "eth", "build", "ship"]) for _ in range(8)
+        ),
+        "timestamp": T0 - i * config.cast_interval_ms,
+        "embeds": (
+            {"images": [{"sourceUrl": f"https://i.example/{i}.jpg"}]}
+            if rng.random() < 0.1
+            else {}
+        ),
+        "mentions": (
+            [{"fid": rng.randint(1, config.n_users)}] if rng.random() < 0.1 else []
+        ),
+        "tags": (
+            [{"type": "channel", "id": f"channel{i % 30}", "name": f"Channel {i % 30}"}]
+            if channel
+            else []
+        ),
+    }
+    if channel:
+        cast["parentSource"] = {"url": f"chain://channel/{i % 30}"}
+    return cast
+
+
+def make_reactions(config: MockConfig, cast_hash: str) -> List[Dict[str, Any]]:
+    i = int(cast_hash, 16)
+    rng = random.Random(config.seed * 1000039 + i)
+    n = int(min(rng.paretovariate(1.0) - 1, config.max_reactions))
+    return [
+        {
+            "type": "like" if rng.random() < 0.8 else "recast",
+            "hash": f"0x{i:020x}{j:020x}",
+            "timestamp": T0 - i * config.cast_interval_ms + (j + 1) * 1000,
+            "castHash": cast_hash,
+            "reactor": {"fid": rng.randint(1, config.n_users)},
+        }
+        for j in range(n)
+    ]
+
+
+def make_app(config: MockConfig) -> web.Application:
+    window: Dict[int, int] = {}  # second -> requests seen, for the rate limit
+    rng = random.Random(config.seed)
+
+    @web.middleware
+    async def behavior(
+        request: web.Request,
+        handler: Callable[[web.Request], Awaitable[web.StreamResponse]],
+    ) -> web.StreamResponse:
+        second = int(time.time())
+        window[second] = window.get(second, 0) + 1
+        window.pop(second - 2, None)
+        delay = config.latency_ms + rng.uniform(-1, 1) * config.jitter_ms
+        await asyncio.sleep(max(delay, 0) / 1000)
+
+        if config.rate_limit and window[second] > config.rate_limit:
+            headers = {"Retry-After": str(config.retry_after)}
+            body = {"errors": ["rate limited"]}
+            return web.json_response(body, status=429, headers=headers)
+        if rng.random() < config.error_rate:
+            return web.json_response({"errors": ["internal error"]}, status=500)
+        return await handler(request)
+
+    def conditional(request: web.Request, data: Any) -> web.Response:
+        # the payloads are deterministic, so the etag is just a hash of the body
+        body = json.dumps(data)
+        if not config.etags:
+            return web.json_response(text=body)
+        etag = '"' + hashlib.md5(body.encode()).hexdigest() + '"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.json_response(text=body, headers={"ETag": etag})
+
+    async def user(request: web.Request) -> web.Response:
+        fid = int(request.query["fid"])
+        if fid > config.n_users:
+            return web.json_response({"errors": ["not found"]}, status=404)
+        return conditional(request, {"result": make_user(config, fid)})
+
+    async def recent_users(request: web.Request) -> web.Response:
+        return web.json_response({"result": {"users": [{"fid": config.n_users}]}})
+
+    async def recent_casts(request: web.Request) -> web.Response:
+        limit = int(request.query.get("limit", 25))
+        offset = int(request.query.get("cursor", 0))
+        end = min(offset + limit, config.n_casts)
+        casts = [make_cast(config, i) for i in range(offset, end)]
+        data: Dict[str, Any] = {"result": {"casts": casts}}
+        if end < config.n_casts:
+            data["next"] = {"cursor": str(end)}
+        return web.json_response(data)
+
+    async def cast_reactions(request: web.Request) -> web.Response:
+        reactions = make_reactions(config, request.query["castHash"])
+        offset = int(request.query.get("cursor", 0))
+        end = offset + config.reaction_page
+        data: Dict[str, Any] = {"result": {"reactions": reactions[offset:end]}}
+        if end < len(reactions):
+            data["next"] = {"cursor": str(end)}
+        return web.json_response(data)
+
+    async def profiles(request: web.Request) -> web.Response:
+        fid = int(request.query["fid"])
+        return conditional(request, [make_profile(config, fid)])
+
+    async def ensdata(request: web.Request) -> web.Response:
+        address = request.match_info["address"]
+        rng = random.Random(address)
+        if rng.random() < 0.3:
+            return web.json_response({"message": f"{address} not found"}, status=404)
+        return conditional(
+            request, {"address": address, "ens": f"{address[2:8]}.eth", "twitter": None}
+        )
+
+    app = web.Application(middlewares=[behavior])
+    app.router.add_get("/v2/user", user)
+    app.router.add_get("/v2/recent-users", recent_users)
+    app.router.add_get("/v2/recent-casts", recent_casts)
+    app.router.add_get("/v2/cast-reactions", cast_reactions)
+    app.router.add_get("/api/profiles", profiles)
+    app.router.add_get("/ens/{address}", ensdata)
+    return app
+
+
+def serve(config: MockConfig, port: int) -> None:
+    quiet = lambda *args: None  # no startup banner
+    web.run_app(make_app(config), host="127.0.0.1", port=port, print=quiet)
+
+
+if __name__ == "__main__":
+    serve(MockConfig(), int(sys.argv[1]) if len(sys.argv) > 1 else 8787)
@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+# cold start of the cli, each command is run in a fresh interpreter
+# python -m bench.startup --repeats 10
+# "heavy" lists the big third party packages the command ended up importing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ["pandas", "pyarrow", "duckdb", "aiohttp", "pydantic", "sqlalchemy", "numpy"]
+
+
+def commands(tmp: str) -> Dict[str, List[str]]:
+    sql = os.path.join(tmp, "query.sql")
+    with open(sql, "w") as f:
+        f.write("SELECT 42 AS answer")
+    return {
+        "help": ["--help"],
+        "query": ["query", sql],
+        "query_parquet": ["query", sql, "--out", os.path.join(tmp, "q.parquet")],
+        "pipeline_list": ["pipeline", "--list"],
+        "import_indexer": ["-c", "import src.indexer"],
+    }
+
+
+def imported(args: List[str]) -> List[str]:
+    # -X importtime writes "import time: self | cumulative | name" to stderr
+    cmd = [sys.executable, "-X", "importtime"]
+    cmd += args if args[0] == "-c" else ["main.py"] + args
+    out = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True).stderr
+    names = {line.split("|")[-1].strip() for line in out.splitlines() if "|" in line}
+    return [name for name in HEAVY if name in names]
+
+
+def measure(args: List[str], repeats: int) -> Dict[str, Any]:
+    cmd = [sys.executable] + (args if args[0] == "-c" else ["main.py"] + args)
+    walls = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        subprocess.run(cmd, cwd=ROOT, capture_output=True, check=True)
+        walls.append(time.perf_counter() - t)
+    return {
+        "median_s": round(statistics.median(walls), 3),
+        "min_s": round(min(walls), 3),
+        "heavy": imported(args),
+    }
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description="cli startup benchmark")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--out", help="write results as json to this file")
+    args = parser.parse_args()
+
+    baseline = measure(["-c", "pass"], args.repeats)["median_s"]
+    results: Dict[str, Any] = {"python": baseline}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, cmd in commands(tmp).items():
+            results[name] = measure(cmd, args.repeats)
+            print(json.dumps({"command": name, **results[name]}))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    run()
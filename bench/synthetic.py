@@ -0,0 +1,277 @@
+import argparse
+import io
+import os
+from typing import Dict
+
+import duckdb
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+import pydantic
+
+# synthetic hub data shaped like the replicator tables (see src/postgres_dtype.md),
+# only the columns the pipelines touch:
+# - power-law authorship and reacting (a few fids do most of the casting)
+# - reply trees, replies point at recent casts and inherit their thread
+# - embeds as the replicator's text column, images and links mixed
+# - diurnal activity so frequency_heatmap has something to show
+# python -m bench.synthetic --scale 0.1 --parquet data/synthetic --postgres $PG_URL
+
+
+class SyntheticConfig(pydantic.BaseModel):
+    users: int = 20000
+    casts: int = 500000
+    reactions_per_cast: float = 4.0
+    follows_per_user: float = 30.0
+    days: int = 31
+    start: int = 1688169600000  # 2023-07-01 utc
+    alpha: float = 1.1  # zipf exponent of activity per fid
+    reply_rate: float = 0.4
+    embed_rate: float = 0.3
+    seed: int = 0
+
+    def scaled(self, scale: float) -> "SyntheticConfig":
+        users = max(int(self.users * scale), 100)
+        casts = max(int(self.casts * scale), 1000)
+        return self.model_copy(update={"users": users, "casts": casts})
+
+
+# np.where's fill for nullable object columns (its stubs don't take a bare None)
+NULL = np.array(None, dtype=object)
+
+
+def zipf_weights(
+    rng: np.random.Generator, n: int, alpha: float
+) -> npt.NDArray[np.float64]:
+    # rank-based so the heavy fids are spread over the id range, not fid 1..k
+    weights = 1.0 / np.arange(1, n + 1) ** alpha
+    rng.shuffle(weights)
+    p: npt.NDArray[np.float64] = weights / weights.sum()
+    return p
+
+
+def random_hashes(rng: np.random.Generator, n: int) -> npt.NDArray[np.object_]:
+    raw = np.frombuffer(rng.bytes(20 * n), dtype="S20")
+    return np.array([bytes(h) for h in raw], dtype=object)
+
+
+def timestamps(
+    rng: np.random.Generator, config: SyntheticConfig, n: int
+) -> npt.NDArray[np.int64]:
+    # uniform day, hour-of-day weighted towards us evenings (utc)
+    hour_weights = 1 + 0.8 * np.sin((np.arange(24) - 8) / 24 * 2 * np.pi)
+    hours = rng.choice(24, size=n, p=hour_weights / hour_weights.sum())
+    days = rng.integers(0, config.days, size=n)
+    ms = rng.integers(0, 3600 * 1000, size=n)
+    t: npt.NDArray[np.int64] = config.start + days * 86400000 + hours * 3600000 + ms
+    return t
+
+
+def embeds(rng: np.random.Generator, n: int, rate: float) -> npt.NDArray[np.object_]:
+    kinds = rng.choice(4, size=n, p=[1 - rate, rate * 0.5, rate * 0.35, rate * 0.15])
+    templates = np.array(
+        [
+            "[]",
+            "[{'url': 'https://i.imgur.com/%d.png'}]",
+            "[{'url': 'https://example.com/post/%d'}]",
+            "[{'url': 'https://i.imgur.com/%d.jpg'}, {'url': 'https://zora.co/%d'}]",
+        ],
+        dtype=object,
+    )
+    out = templates[kinds]
+    ids = np.arange(n)
+    return np.array(
+        [t % ((i,) * t.count("%d")) for t, i in zip(out, ids)], dtype=object
+    )
+
+
+def generate(config: SyntheticConfig) -> Dict[str, pd.DataFrame]:
+    rng = np.random.default_rng(config.seed)
+    fids = np.arange(1, config.users + 1)
+    author_p = zipf_weights(rng, config.users, config.alpha)
+    reactor_p = zipf_weights(rng, config.users, config.alpha * 0.8)
+
+    # casts, sorted by time so "earlier cast" is just a smaller index
+    n = config.casts
+    ts = np.sort(timestamps(rng, config, n))
+    authors = rng.choice(fids, size=n, p=author_p)
+    hashes = random_hashes(rng, n)
+
+    parent_idx = np.arange(n) - rng.geometric(1 / 500, size=n)
+    is_reply = (rng.random(n) < config.reply_rate) & (parent_idx >= 0)
+    parent_idx = np.where(is_reply, parent_idx, -1)
+    casts = pd.DataFrame(
+        {
+            "id": np.arange(1, n + 1),
+            "timestamp": pd.to_datetime(ts, unit="ms"),
+            "fid": authors,
+            "hash": hashes,
+            "parent_hash": np.where(is_reply, hashes[parent_idx], NULL),
+            "parent_fid": pd.array(
+                np.where(is_reply, authors[parent_idx], 0), dtype="Int64"
+            ),
+            "parent_url": np.where(
+                ~is_reply & (rng.random(n) < 0.15),
+                np.char.add("chain://channel/", rng.integers(0, 40, n).astype(str)),
+                NULL,
+            ),
+            "text": np.char.add("gm synthetic cast ", np.arange(n).astype(str)),
+            "embeds": embeds(rng, n, config.embed_rate),
+            "deleted_at": pd.NaT,
+        }
+    )
+    casts.loc[~is_reply, "parent_fid"] = pd.NA
+
+    # reactions, popular authors get more of them and most arrive within hours
+    m = int(n * config.reactions_per_cast)
+    popularity = author_p[authors - 1] * rng.pareto(1.5, size=n)
+    targets = rng.choice(n, size=m, p=popularity / popularity.sum())
+    delay = rng.exponential(6 * 3600 * 1000, size=m).astype(np.int64)
+    reactions = pd.DataFrame(
+        {
+            "id": np.arange(1, m + 1),
+            "timestamp": pd.to_datetime(ts[targets] + delay, unit="ms"),
+            "fid": rng.choice(fids, size=m, p=reactor_p),
+            "reaction_type": rng.choice([1, 2], size=m, p=[0.8, 0.2]).astype(np.int16),
+            "hash": random_hashes(rng, m),
+            "target_hash": hashes[targets],
+            "target_fid": authors[targets],
+            "deleted_at": pd.NaT,
+        }
+    )
+
+    user_data = pd.DataFrame(
+        {
+            "fid": fids,
+            "type": np.full(config.users, 6, dtype=np.int16),
+            "value": np.char.add("user", fids.astype(str)),
+            "timestamp": pd.to_datetime(config.start, unit="ms"),
+        }
+    )
+
+    k = int(config.users * config.follows_per_user)
+    links = pd.DataFrame(
+        {
+            "fid": rng.choice(fids, size=k, p=reactor_p),
+            "target_fid": rng.choice(fids, size=k, p=author_p),
+            "type": "follow",
+            "timestamp": pd.to_datetime(timestamps(rng, config, k), unit="ms"),
+            "deleted_at": pd.NaT,
+        }
+    )
+    links = links[links["fid"] != links["target_fid"]]
+    links = links.drop_duplicates(subset=["fid", "target_fid"])
+
+    return {
+        "casts": casts,
+        "reactions": reactions,
+        "user_data": user_data,
+        "links": links,
+    }
+
+
+# ======================================================================================
+# loaders
+# ======================================================================================
+
+
+def to_parquet(tables: Dict[str, pd.DataFrame], root: str) -> None:
+    os.makedirs(root, exist_ok=True)
+    for name, df in tables.items():
+        df.to_parquet(os.path.join(root, f"{name}.parquet"), index=False)
+
+
+def to_duckdb(tables: Dict[str, pd.DataFrame], file_path: str) -> None:
+    con = duckdb.connect(file_path)
+    for name, df in tables.items():
+        con.register("_df", df)
+        con.execute(f"CREATE OR REPLACE TABLE {name} AS SELECT * FROM _df")
+        con.unregister("_df")
+    con.close()
+
+
+POSTGRES_DDL = {
+    "casts": """
+        id bigint PRIMARY KEY, timestamp timestamp, fid bigint, hash bytea,
+        parent_hash bytea, parent_fid bigint, parent_url text, text text,
+        embeds text, deleted_at timestamp
+    """,
+    "reactions": """
+        id bigint PRIMARY KEY, timestamp timestamp, fid bigint,
+        reaction_type smallint, hash bytea, target_hash bytea, target_fid bigint,
+        deleted_at timestamp
+    """,
+    "user_data": "fid bigint, type smallint, value text, timestamp timestamp",
+    "links": """
+        fid bigint, target_fid bigint, type text, timestamp timestamp,
+        deleted_at timestamp
+    """,
+}
+
+POSTGRES_INDEXES = [
+    "CREATE INDEX ON casts (timestamp)",
+    "CREATE INDEX ON casts (hash)",
+    "CREATE INDEX ON casts (parent_hash)",
+    "CREATE INDEX ON reactions (timestamp)",
+    "CREATE INDEX ON reactions (target_hash)",
+    "CREATE INDEX ON user_data (fid, type)",
+    "CREATE INDEX ON links (timestamp)",
+]
+
+
+def to_postgres(
+    tables: Dict[str, pd.DataFrame], pg_url: str, chunk: int = 200000
+) -> None:
+    # COPY in csv chunks, bytea goes over as \x hex text
+    import psycopg2
+
+    con = psycopg2.connect(pg_url)
+    with con, con.cursor() as cur:
+        for name, df in tables.items():
+            cur.execute(f"DROP TABLE IF EXISTS {name}")
+            cur.execute(f"CREATE TABLE {name} ({POSTGRES_DDL[name]})")
+            df = df.copy()
+            for column in df.columns:
+                if df[column].dtype == object and isinstance(
+                    df[column].dropna().iloc[0] if df[column].notna().any() else "",
+                    bytes,
+                ):
+                    df[column] = df[column].map(
+                        lambda b: "\\x" + b.hex() if b is not None else None
+                    )
+            for i in range(0, len(df), chunk):
+                buffer = io.StringIO()
+                df.iloc[i : i + chunk].to_csv(buffer, index=False, header=False)
+                buffer.seek(0)
+                columns = ", ".join(df.columns)
+                copy = f"COPY {name} ({columns}) FROM STDIN WITH (FORMAT csv)"
+                cur.copy_expert(copy, buffer)
+        for index in POSTGRES_INDEXES:
+            cur.execute(index)
+        cur.execute("ANALYZE")
+    con.close()
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description="synthetic farcaster data")
+    parser.add_argument("--scale", type=float, default=1.0, help="x users and casts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--parquet", help="directory to write <table>.parquet to")
+    parser.add_argument("--duckdb", help="duckdb database file")
+    parser.add_argument("--postgres", help="postgres url, tables are replaced")
+    args = parser.parse_args()
+
+    config = SyntheticConfig(seed=args.seed).scaled(args.scale)
+    tables = generate(config)
+    for name, df in tables.items():
+        print(f"synthetic: {name} {len(df)} rows")
+    if args.parquet:
+        to_parquet(tables, args.parquet)
+    if args.duckdb:
+        to_duckdb(tables, args.duckdb)
+    if args.postgres:
+        to_postgres(tables, args.postgres)
+
+
+if __name__ == "__main__":
+    run()
@@ -1,15 +1,29 @@
+import argparse
 import asyncio
 import os
 import sys
+import time
+from typing import TYPE_CHECKING, Any, Callable, Coroutine, Dict, List, Optional
 
-import src.indexer as indexer
+import src.metrics as metrics
+import src.profiler as profiler
+import src.utils as utils
+
+# only stdlib-weight modules up here; pandas, duckdb, aiohttp and friends are
+# imported by the subcommand that needs them (`query` never loads pandas),
+# bench/startup.py keeps an eye on it
+if TYPE_CHECKING:
+    import pandas as pd
 
 # ======================================================================================
 # refresher
 # ======================================================================================
 
 
+@profiler.profile
 async def refresh_user() -> None:
+    import src.indexer as indexer
+
     quwf = "queue/user_warpcast.ndjson"
     qusf = "queue/user_searchcaster.ndjson"
     quef = "queue/user_ensdata.ndjson"
@@ -23,56 +37,332 @@ async def refresh_user() -> None:
         os.remove(qusf)  # uncomment to renew searchcaster data
 
     # TODO: caller UX is still bad, so much timeout!
-    fids = indexer.QueueProducer.user_warpcast(quwf, uf)
+    # the duckdb scans run on the async duckdb pool and the pandas steps in threads,
+    # so the other refreshes keep fetching when this runs under refresh_all
+    fids = await indexer.QueueProducer.user_warpcast_async(quwf, uf)
     await indexer.BatchFetcher.user_warpcast(fids=fids, n=100, out=quwf)
-    fids = indexer.QueueProducer.user_searchcaster(quwf, qusf)
+    fids = await indexer.QueueProducer.user_searchcaster_async(quwf, qusf)
     await indexer.BatchFetcher.user_searchcaster(fids=fids, n=125, out=qusf)
-    addrs = indexer.QueueProducer.user_ensdata(qusf, quef)
+    addrs = await indexer.QueueProducer.user_ensdata_async(qusf, quef)
     await indexer.BatchFetcher.user_ensdata(addrs, n=50, out=quef)
-    df = indexer.Merger.user(quwf, qusf, uf)
-    df.to_parquet(uf, index=False)
+    # joined in duckdb and written straight to parquet, bounded memory; the merged
+    # segments are pruned, see Merger.user_segments
+    await asyncio.to_thread(indexer.Merger.user_segments, quwf, qusf, uf)
 
 
+@profiler.profile
 async def refresh_cast() -> None:
+    import pandas as pd
+
+    import src.channel as channel
+    import src.indexer as indexer
+    import src.search as search
+    import src.segments as segments
+    import src.timeindex as timeindex
+
     cf = "data/casts.parquet"
+    rf = "data/reactions.parquet"
     qf = "queue/cast_warpcast.ndjson"
 
     # edit this cursor to continue from a certain point
     # None means refresh latest until the tail of casts in database
     cursor = None
-    await indexer.BatchFetcher.cast_warpcast(cursor)
-    df = indexer.Merger.cast(qf, cf)
-    df.to_parquet(cf, index=False)
+    channels = channel.ChannelIndex("data/fip2.ndjson")
+    await indexer.BatchFetcher.cast_warpcast(cursor, channels=channels)
+    # only the segments queued since the last merge, marked consumed once written
+    pending = await asyncio.to_thread(segments.seal, qf)
+    df = await asyncio.to_thread(indexer.Merger.cast, pending, cf)
+    await asyncio.to_thread(timeindex.write, df, cf)
+    # only the channels the new casts are in get their partition rewritten
+    queued = await asyncio.to_thread(indexer.read_ndjson, pending)
+    touched = set(queued["channel_id"].dropna()) if "channel_id" in queued else set()
+    store = channel.ChannelStore("data/casts_by_channel")
+    await asyncio.to_thread(store.write, df, touched)
+    index = search.SearchIndex("data/search")
+    await asyncio.to_thread(index.add, df)
+    # the new casts' reactions may be stored already, order_by="reactions" ranks
+    # on these counts
+    if os.path.exists(rf):
+        reactions = await asyncio.to_thread(pd.read_parquet, rf, ["target_hash"])
+        counts = reactions["target_hash"].value_counts()
+        await asyncio.to_thread(index.set_reaction_counts, counts)
+    segments.consume(pending)
+    segments.prune(qf)
 
 
+@profiler.profile
 async def refresh_reactions() -> None:
+    import src.indexer as indexer
+    import src.search as search
+    import src.segments as segments
+    import src.timeindex as timeindex
+
     cf = "data/casts.parquet"
+    rf = "data/reactions.parquet"
+    qf = "queue/reaction_warpcast.ndjson"
     t1 = indexer.TimeConverter.ago_to_unixms(factor="days", units=60)
     t2 = indexer.TimeConverter.ms_now()
-    hashes = indexer.QueueProducer.reaction_warpcast(t1, t2, cf)
+    hashes = await asyncio.to_thread(
+        indexer.QueueProducer.reaction_warpcast, t1, t2, cf
+    )
     await indexer.BatchFetcher.reaction_warpcast(hashes)
+    # merged like the daemon does it, the activity / cohort pipelines read rf
+    pending = await asyncio.to_thread(segments.seal, qf)
+    df = await asyncio.to_thread(indexer.Merger.reaction, pending, rf)
+    await asyncio.to_thread(timeindex.write, df, rf)
+    counts = df["target_hash"].value_counts() if len(df) else {}
+    index = search.SearchIndex("data/search")
+    await asyncio.to_thread(index.set_reaction_counts, counts)
+    segments.consume(pending)
+    segments.prune(qf)
+
+
+async def instrumented(refresh: Coroutine[Any, Any, None]) -> None:
+    import src.indexer as indexer
+
+    # METRICS_PORT serves /metrics while the refresh runs, data/metrics.prom is
+    # written either way (also when the refresh dies halfway)
+    port = os.getenv("METRICS_PORT")
+    runner = await metrics.serve(int(port)) if port else None
+    try:
+        await refresh
+    finally:
+        indexer.BatchFetcher.close_seen_set()
+        metrics.registry.write_prometheus("data/metrics.prom")
+        metrics.event("summary", hosts=metrics.registry.summary())
+        if runner is not None:
+            await runner.cleanup()
+
+
+async def refresh_all() -> None:
+    # one event loop, so the three crawls overlap their waiting on the apis; casts
+    # and users are written atomically, so reactions never see a half written file
+    await asyncio.gather(refresh_user(), refresh_cast(), refresh_reactions())
+
+
+REFRESHES: Dict[str, Callable[[], Coroutine[Any, Any, None]]] = {
+    "user": refresh_user,
+    "cast": refresh_cast,
+    "reaction": refresh_reactions,
+    "all": refresh_all,
+}
+
+
+async def serve(args: argparse.Namespace) -> None:
+    import src.daemon as daemon
+
+    config = daemon.DaemonConfig(
+        poll_interval=args.poll,
+        user_interval=args.users,
+        reaction_interval=args.reactions,
+        compact_interval=args.compact,
+    )
+    await daemon.Daemon(config).run()
+
+
+# ======================================================================================
+# pipelines
+# ======================================================================================
+
+FORMATS = ["parquet", "csv", "arrow", "print"]
+
+
+def parse_time(value: str) -> int:
+    # YYYY-MM-DD (utc midnight) or unix ms
+    if value.isdigit():
+        return int(value)
+    year, month, day = (int(x) for x in value.split("-"))
+    return utils.TimeConverter.ymd_to_unixms(year, month, day)
+
+
+def write_output(df: "pd.DataFrame", file_path: str, format: str) -> None:
+    if format == "print":
+        print(df.to_string())
+        return
+
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    tmp_path = f"{file_path}.tmp"
+    if format == "parquet":
+        df.to_parquet(tmp_path, index=False)
+    elif format == "csv":
+        df.to_csv(tmp_path, index=False)
+    elif format == "arrow":
+        import pyarrow as pa
+
+        write_arrow(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+    os.replace(tmp_path, file_path)
+
+
+def write_arrow(table: Any, file_path: str) -> None:
+    # arrow ipc file, pa.ipc.open_file / pd.read_feather read it back
+    import pyarrow as pa
 
+    with pa.OSFile(file_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
 
-def main() -> None:
-    if len(sys.argv) < 2:
-        print("Usage: python main.py --refresh-user, --refresh-cast, or --query")
-        sys.exit(1)
-
-    option = sys.argv[1]
-    if option == "--refresh-user":
-        asyncio.run(refresh_user())
-    elif option == "--refresh-cast":
-        asyncio.run(refresh_cast())
-    elif option == "--refresh-reaction":
-        asyncio.run(refresh_reactions())
-    elif option == "--query":
-        filename = sys.argv[2] if len(sys.argv) > 2 else "query.sql"
-        with open(filename, "r") as file:
-            query = file.read()
-        print(indexer.execute_query_df(query))
+
+def run_pipelines(args: argparse.Namespace) -> None:
+    import src.data_piplines as data_piplines
+
+    names = args.names or data_piplines.DASHBOARD
+    unknown = set(names) - set(data_piplines.PIPELINES)
+    if unknown:
+        available = ", ".join(data_piplines.PIPELINES)
+        raise SystemExit(f"unknown pipelines: {', '.join(unknown)} ({available})")
+
+    results = data_piplines.run_pipelines(names, args.start, args.end, args.workers)
+    ext = "arrow" if args.format == "arrow" else args.format
+    for name in names:
+        file_path = os.path.join(args.out_dir, f"{name}.{ext}")
+        write_output(results[name], file_path, args.format)
+        if args.format != "print":
+            print(f"{name}: {len(results[name])} rows -> {file_path}")
+
+
+def run_query(args: argparse.Namespace) -> None:
+    # straight on duckdb: printing uses its own renderer and files are written by
+    # COPY, so a quick query doesn't pay for importing pandas
+    import duckdb
+
+    with open(args.file, "r") as file:
+        query = file.read().strip().rstrip(";")
+    con = duckdb.connect(database=":memory:")
+    t = time.perf_counter()
+    if args.out is None:
+        relation = con.sql(query)
+        print(relation)
+        rows = None
+    elif args.format == "arrow":
+        table = con.execute(query).arrow()
+        write_arrow(table, args.out)
+        rows = table.num_rows
     else:
-        print("Invalid option. Use --refresh-user, --refresh-cast, or --query")
-        sys.exit(1)
+        options = "FORMAT PARQUET" if args.format == "parquet" else "HEADER"
+        copied = con.execute(f"COPY ({query}) TO '{args.out}' ({options})").fetchone()
+        rows = copied[0] if copied else None
+    if profiler.enabled():
+        seconds = time.perf_counter() - t
+        profiler.record_query(
+            "duckdb", query, seconds, rows, profiler.explain_duckdb(con)
+        )
+
+
+def run_search(args: argparse.Namespace) -> None:
+    import src.search as search
+
+    index = search.SearchIndex(args.root)
+    df = index.search(
+        args.query,
+        author_fid=args.author,
+        channel_id=args.channel,
+        t_from=args.start,
+        t_until=args.end,
+        k=args.k,
+        order_by=args.order_by,
+    )
+    write_output(df, args.out or "", "print" if args.out is None else args.format)
+
+
+# ======================================================================================
+# cli
+# ======================================================================================
+
+# the old single flag interface still works, it's rewritten to the subcommands
+LEGACY = {
+    "--refresh-user": ["refresh", "user"],
+    "--refresh-cast": ["refresh", "cast"],
+    "--refresh-reaction": ["refresh", "reaction"],
+    "--refresh-all": ["refresh", "all"],
+    "--query": ["query"],
+}
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="main.py")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="write a timing / memory / query plan report to profiles/",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    refresh = commands.add_parser("refresh", help="crawl the apis into queue/, data/")
+    refresh.add_argument("target", choices=list(REFRESHES))
+
+    query = commands.add_parser("query", help="run a duckdb sql file")
+    query.add_argument("file", nargs="?", default="query.sql")
+    query.add_argument("--out", help="write the result here instead of printing")
+    query.add_argument("--format", choices=FORMATS[:3], default="parquet")
+
+    find = commands.add_parser("search", help="search the indexed casts")
+    find.add_argument("query", nargs="?", default="", help='terms, "a phrase"')
+    find.add_argument("--author", type=int, help="author fid")
+    find.add_argument("--channel", help="channel id")
+    find.add_argument("--start", type=parse_time)
+    find.add_argument("--end", type=parse_time)
+    find.add_argument("-k", type=int, default=20, help="results")
+    find.add_argument("--order-by", choices=["recency", "reactions"], default="recency")
+    find.add_argument("--root", default="data/search")
+    find.add_argument("--out", help="write the result here instead of printing")
+    find.add_argument("--format", choices=FORMATS[:3], default="parquet")
+
+    serve = commands.add_parser("serve", help="keep ingesting, see src/daemon.py")
+    serve.add_argument("--poll", type=float, default=5.0, help="seconds, new casts")
+    serve.add_argument("--users", type=float, default=600.0, help="seconds")
+    serve.add_argument("--reactions", type=float, default=300.0, help="seconds")
+    serve.add_argument("--compact", type=float, default=600.0, help="seconds")
+
+    pipeline = commands.add_parser("pipeline", help="run data_piplines by name")
+    pipeline.add_argument(
+        "names", nargs="*", help="default: the dashboard set, --list for all"
+    )
+    pipeline.add_argument("--list", action="store_true")
+    pipeline.add_argument("--start", type=parse_time, default="2023-07-01")
+    pipeline.add_argument("--end", type=parse_time, default="2023-08-01")
+    pipeline.add_argument("--format", choices=FORMATS, default="parquet")
+    pipeline.add_argument("--out-dir", default="data/pipelines")
+    pipeline.add_argument("--workers", type=int, help="pipelines running at once")
+    return parser
+
+
+def run(args: argparse.Namespace) -> None:
+    if args.command == "refresh":
+        asyncio.run(instrumented(REFRESHES[args.target]()))
+    elif args.command == "query":
+        run_query(args)
+    elif args.command == "search":
+        run_search(args)
+    elif args.command == "serve":
+        asyncio.run(instrumented(serve(args)))
+    elif args.command == "pipeline" and args.list:
+        import src.data_piplines as data_piplines
+
+        print("\n".join(data_piplines.PIPELINES))
+    elif args.command == "pipeline":
+        run_pipelines(args)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    profile = "--profile" in argv  # accepted anywhere, like before
+    argv = [arg for arg in argv if arg != "--profile"]
+    if argv and argv[0] in LEGACY:
+        argv = LEGACY[argv[0]] + argv[1:]
+    args = make_parser().parse_args(argv)
+
+    metrics.setup_logging()
+    if not profile:
+        run(args)
+        return
+
+    name = "-".join([args.command] + ([args.target] if "target" in args else []))
+    profiler.start(name)
+    try:
+        with profiler.stage(name):
+            run(args)
+    finally:
+        print(f"profile written to {profiler.finish()}", file=sys.stderr)
 
 
 if __name__ == "__main__":
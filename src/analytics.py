@@ -0,0 +1,129 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+
+import src.metrics as metrics
+import src.profiler as profiler
+
+# async duckdb for the crawler: queries run on a small dedicated thread pool, so
+# the event loop keeps fetching while a queue or parquet scan runs
+# - one connection, every pool thread queries through its own cursor of it
+#   (cursors are duckdb's way of using a connection from several threads)
+# - timeout / cancellation: the awaiting task stops waiting right away and the
+#   cursor is interrupted where duckdb supports it (0.9+); on older versions the
+#   query finishes in its thread and the result is dropped
+# - queries show up in the profiler like execute_query's
+
+T = TypeVar("T")
+
+
+class AsyncDuckDB:
+    workers = 2
+    timeout: Optional[float] = None  # seconds, default for every query
+
+    def __init__(
+        self,
+        database: str = ":memory:",
+        workers: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        self.con = duckdb.connect(database=database)
+        self.executor = ThreadPoolExecutor(
+            workers or AsyncDuckDB.workers, thread_name_prefix="duckdb"
+        )
+        self.timeout = timeout if timeout is not None else AsyncDuckDB.timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()  # cursor() on the shared connection
+
+    def cursor(self) -> duckdb.DuckDBPyConnection:
+        # the calling pool thread's cursor
+        cursor = getattr(self.local, "cursor", None)
+        if cursor is None:
+            with self.lock:
+                cursor = self.local.cursor = self.con.cursor()
+        return cursor
+
+    async def run(
+        self,
+        query: str,
+        fetch: Callable[[duckdb.DuckDBPyConnection], T],
+        timeout: Optional[float] = None,
+    ) -> T:
+        state: Dict[str, Any] = {"cancelled": False, "cursor": None}
+        context = contextvars.copy_context()  # the profiler stage of the caller
+
+        def work() -> T:
+            if state["cancelled"]:  # gave up while it was waiting for a thread
+                return None  # type: ignore
+            cursor = state["cursor"] = self.cursor()
+            t = time.perf_counter()
+            result = fetch(cursor.execute(query))
+            seconds = time.perf_counter() - t
+            metrics.registry.observe("duckdb_query_seconds", seconds)
+            if profiler.enabled():
+                rows = len(result) if hasattr(result, "__len__") else None
+                explain = profiler.explain_duckdb(cursor)
+                profiler.record_query("duckdb", query, seconds, rows, explain)
+            return result
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, context.run, work)
+        timeout = timeout if timeout is not None else self.timeout
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            state["cancelled"] = True
+            interrupt = getattr(state["cursor"], "interrupt", None)
+            if interrupt is not None:
+                interrupt()
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            if isinstance(e, asyncio.TimeoutError):
+                metrics.registry.inc("duckdb_query_timeouts_total")
+            raise
+
+    # ==================================================================================
+    # queries
+    # ==================================================================================
+
+    async def fetchall(self, query: str, timeout: Optional[float] = None) -> List[Any]:
+        return await self.run(query, lambda c: c.fetchall(), timeout)
+
+    async def column(self, query: str, timeout: Optional[float] = None) -> List[Any]:
+        # first column, without nulls (and falsy values, like execute_query)
+        rows = await self.fetchall(query, timeout)
+        return list(filter(None, [row[0] for row in rows]))
+
+    async def df(self, query: str, timeout: Optional[float] = None) -> pd.DataFrame:
+        return await self.run(query, lambda c: c.fetchdf(), timeout)
+
+    async def arrow(self, query: str, timeout: Optional[float] = None) -> pa.Table:
+        return await self.run(query, lambda c: c.fetch_arrow_table(), timeout)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        self.con.close()
+
+
+shared_db: Optional[AsyncDuckDB] = None
+
+
+def shared() -> AsyncDuckDB:
+    # the crawler's instance, in memory: it only reads files
+    global shared_db
+    if shared_db is None:
+        shared_db = AsyncDuckDB()
+    return shared_db
+
+
+def close_shared() -> None:
+    global shared_db
+    if shared_db is not None:
+        shared_db.close()
+        shared_db = None
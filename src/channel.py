@@ -0,0 +1,143 @@
+import json
+import os
+import urllib.parse
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+# ======================================================================================
+# channel lookup
+# ======================================================================================
+
+
+def get_field(item: Any, key: str) -> Any:
+    # casts come in as pydantic models from the fetcher, dicts from the fip2 crawler
+    return item.get(key) if isinstance(item, dict) else getattr(item, key, None)
+
+
+class ChannelIndex:
+    # parent_url <-> channel_id dictionary, persisted in the fip2.ndjson format
+    # so data/fip2.ndjson (or the r2 download) can be used as-is
+
+    def __init__(self, file_path: str = "data/fip2.ndjson") -> None:
+        self.file_path = file_path
+        self.by_url: Dict[str, str] = {}
+        self.by_id: Dict[str, str] = {}
+        self.descriptions: Dict[str, Optional[str]] = {}
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self.by_url)
+
+    def __contains__(self, parent_url: object) -> bool:
+        return parent_url in self.by_url
+
+    def load(self) -> None:
+        if not os.path.exists(self.file_path):
+            return
+
+        with open(self.file_path, "r") as f:
+            for line in f:
+                try:
+                    self.add(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # torn last line from an interrupted append
+
+    def add(self, item: Any) -> Optional[Dict[str, Any]]:
+        parent_url = get_field(item, "parent_url")
+        channel_id = get_field(item, "channel_id")
+        if parent_url is None or channel_id is None or parent_url in self.by_url:
+            return None
+
+        self.by_url[parent_url] = channel_id
+        self.by_id[channel_id] = parent_url
+        self.descriptions[channel_id] = get_field(item, "channel_description")
+        return {
+            "parent_url": parent_url,
+            "channel_id": channel_id,
+            "channel_description": self.descriptions[channel_id],
+        }
+
+    def update(self, casts: Iterable[Any]) -> List[Dict[str, Any]]:
+        # only pairs that weren't known before get appended, so the file grows
+        # with the number of channels rather than the number of casts
+        new = [item for item in map(self.add, casts) if item is not None]
+        if new:
+            os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+            with open(self.file_path, "a") as f:
+                for item in new:
+                    json.dump(item, f)
+                    f.write("\n")
+        return new
+
+    def channel_id(self, parent_url: Optional[str]) -> Optional[str]:
+        return self.by_url.get(parent_url) if parent_url else None
+
+    def parent_url(self, channel_id: Optional[str]) -> Optional[str]:
+        return self.by_id.get(channel_id) if channel_id else None
+
+
+# ======================================================================================
+# channel-clustered cast storage
+# ======================================================================================
+
+
+class ChannelStore:
+    # one parquet file per channel, hive style (channel_id=<id>/casts.parquet),
+    # sorted by timestamp, so a channel + time window read touches one small file
+    # casts without a channel stay in data/casts.parquet only
+
+    def __init__(self, root: str = "data/casts_by_channel") -> None:
+        self.root = root
+
+    def partition_path(self, channel_id: str) -> str:
+        name = urllib.parse.quote(channel_id, safe="")
+        return os.path.join(self.root, f"channel_id={name}", "casts.parquet")
+
+    def channels(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        dirs = [d for d in os.listdir(self.root) if d.startswith("channel_id=")]
+        return sorted(urllib.parse.unquote(d.split("=", 1)[1]) for d in dirs)
+
+    def write(self, df: pd.DataFrame, only: Optional[Iterable[str]] = None) -> None:
+        # df is the full merged casts frame; `only` limits the rewrite to the
+        # partitions that actually received new casts
+        if df.empty or "channel_id" not in df.columns:  # nothing merged yet
+            return
+        df = df[df["channel_id"].notna()]
+        if only is not None:
+            df = df[df["channel_id"].isin(list(only))]
+
+        for channel_id, group in df.groupby("channel_id", sort=False):
+            path = self.partition_path(str(channel_id))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            group = group.sort_values("timestamp")
+            group.drop(columns=["channel_id"]).to_parquet(f"{path}.tmp", index=False)
+            os.replace(f"{path}.tmp", path)
+
+    def read(
+        self,
+        channel_id: str,
+        t_from: Optional[int] = None,
+        t_until: Optional[int] = None,
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        path = self.partition_path(channel_id)
+        if not os.path.exists(path):
+            return pd.DataFrame()
+
+        # channel_id isn't stored in the partition, it's the directory name
+        columns = [c for c in columns if c != "channel_id"] if columns else None
+
+        filters = []
+        if t_from is not None:
+            filters.append(("timestamp", ">=", t_from))
+        if t_until is not None:
+            filters.append(("timestamp", "<", t_until))
+
+        df = pd.read_parquet(
+            path, columns=columns, filters=filters or None, dtype_backend="pyarrow"
+        )
+        df["channel_id"] = channel_id
+        return df
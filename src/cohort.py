@@ -0,0 +1,323 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple, TypeVar
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import src.timeindex as timeindex
+import src.utils as utils
+
+# cohort analytics over per fid daily activity
+# activity is (day, fid) rows sorted by day then fid, one count column per kind:
+# - casts: casts the fid authored that day
+# - reactions: reactions the fid gave that day
+# - received: reactions the fid's casts got that day
+# every report is a handful of bincounts over those rows, the whole fid range in one
+# pass; users are bucketed by registration week (searchcaster registered_at, weeks
+# start on monday like postgres date_trunc)
+# new days: rows from the last (partial) day on are dropped and rebuilt from the
+# parquet files, the time index keeps the read to the new row groups
+
+DAY_MS = utils.TimeConverter.to_ms("days", 1)
+KINDS = ["casts", "reactions", "received"]
+THRESHOLDS = [0, 1, 5, 10, 25, 50, 100, 250]
+WINDOWS = {"three_days": 3, "one_week": 7, "one_month": 30, "one_quarter": 90}
+
+Days = TypeVar("Days", npt.NDArray[np.int64], pd.Series)
+
+
+def week_start(day: Days) -> Days:
+    # day 0 (1970-01-01) was a thursday
+    return day - (day + 3) % 7
+
+
+def day_label(day: npt.NDArray[np.int64]) -> List[str]:
+    labels: List[str] = (
+        pd.to_datetime(day * DAY_MS, unit="ms").strftime("%Y-%m-%d").tolist()
+    )
+    return labels
+
+
+def registrations(user_file: str) -> npt.NDArray[np.int64]:
+    # fid -> registration day, -1 when unknown
+    if not os.path.exists(user_file):
+        return np.empty(0, dtype=np.int64)
+    table = pq.read_table(user_file, columns=["fid", "registered_at"])
+    table = table.filter(pc.is_valid(table["registered_at"]))
+    fids = table["fid"].to_numpy()
+    registered = np.full(int(fids.max(initial=-1)) + 1, -1, dtype=np.int64)
+    registered[fids] = table["registered_at"].to_numpy() // DAY_MS
+    return registered
+
+
+def cast_authors(cast_file: str, hashes: pd.Series) -> npt.NDArray[np.int64]:
+    # author_fid of each hash, -1 when it's not in cast_file; one scan of the cast
+    # hashes against the distinct reacted ones, in arrow
+    authors = np.full(len(hashes), -1, dtype=np.int64)
+    if not os.path.exists(cast_file) or hashes.empty:
+        return authors
+    encoded = pa.array(hashes, pa.string()).dictionary_encode()
+    table = pq.read_table(cast_file, columns=["hash", "author_fid"])
+    position = pc.index_in(table["hash"], value_set=encoded.dictionary)
+    found = pc.is_valid(position)
+    by_hash = np.full(len(encoded.dictionary), -1, dtype=np.int64)
+    by_hash[pc.filter(position, found).to_numpy()] = pc.filter(
+        table["author_fid"], found
+    ).to_numpy()
+    valid = encoded.indices.is_valid().to_numpy(zero_copy_only=False)
+    indices = encoded.indices.fill_null(0).to_numpy()
+    authors[valid] = by_hash[indices[valid]]
+    return authors
+
+
+class Activity:
+    def __init__(self) -> None:
+        self.day = np.empty(0, dtype=np.int32)
+        self.fid = np.empty(0, dtype=np.int64)
+        self.counts: Dict[str, npt.NDArray[np.int32]] = {
+            kind: np.empty(0, dtype=np.int32) for kind in KINDS
+        }
+        self.until = 0  # ms, events before it are in
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+    def frame(self) -> pd.DataFrame:
+        return pd.DataFrame({"day": self.day, "fid": self.fid, **self.counts})
+
+    def set_frame(self, df: pd.DataFrame) -> None:
+        self.day = df["day"].to_numpy(np.int32)
+        self.fid = df["fid"].to_numpy(np.int64)
+        self.counts = {kind: df[kind].to_numpy(np.int32) for kind in KINDS}
+
+    def truncate(self, day: int) -> None:
+        # drop days >= day
+        i = int(np.searchsorted(self.day, day))
+        self.day, self.fid = self.day[:i], self.fid[:i]
+        self.counts = {kind: c[:i] for kind, c in self.counts.items()}
+
+    def add(
+        self,
+        casts: pd.DataFrame,
+        reactions: pd.DataFrame,
+        authors: npt.NDArray[np.int64],
+    ) -> None:
+        # casts: author_fid, timestamp; reactions: reactor_fid, timestamp and
+        # authors, the author_fid of each reaction's cast (-1: unknown)
+        received = reactions.assign(author_fid=authors)[authors >= 0]
+        days: List[npt.NDArray[np.int64]] = []
+        fids: List[npt.NDArray[np.int64]] = []
+        counts: Dict[str, List[npt.NDArray[np.int32]]] = {kind: [] for kind in KINDS}
+        for kind, df, column in [
+            ("casts", casts, "author_fid"),
+            ("reactions", reactions, "reactor_fid"),
+            ("received", received, "author_fid"),
+        ]:
+            days.append(df["timestamp"].to_numpy(np.int64) // DAY_MS)
+            fids.append(df[column].to_numpy(np.int64))
+            for k in KINDS:
+                counts[k].append(np.full(len(df), k == kind, dtype=np.int32))
+            if len(df):
+                self.until = max(self.until, int(df["timestamp"].max()) + 1)
+        day, fid, summed = Activity.combine(
+            np.concatenate(days),
+            np.concatenate(fids),
+            {kind: np.concatenate(c) for kind, c in counts.items()},
+        )
+        overlap = len(self) and len(day) and day[0] <= self.day[-1]
+        day = np.concatenate([self.day, day])
+        fid = np.concatenate([self.fid, fid])
+        summed = {k: np.concatenate([self.counts[k], summed[k]]) for k in KINDS}
+        if overlap:  # days that were already in, the counts add up
+            day, fid, summed = Activity.combine(day, fid, summed)
+        self.day, self.fid, self.counts = day, fid, summed
+
+    @staticmethod
+    def combine(
+        day: npt.NDArray[np.signedinteger[Any]],
+        fid: npt.NDArray[np.int64],
+        counts: Dict[str, npt.NDArray[np.int32]],
+    ) -> Tuple[
+        npt.NDArray[np.int32], npt.NDArray[np.int64], Dict[str, npt.NDArray[np.int32]]
+    ]:
+        # rows -> one row per (day, fid), sorted, counts summed
+        span = int(fid.max(initial=0)) + 1
+        keys, inverse = np.unique(
+            day.astype(np.int64) * span + fid, return_inverse=True
+        )
+        summed = {
+            kind: np.bincount(inverse, weights=c, minlength=len(keys)).astype(np.int32)
+            for kind, c in counts.items()
+        }
+        return (keys // span).astype(np.int32), keys % span, summed
+
+    def update(self, cast_file: str, reaction_file: str) -> None:
+        # the days since the last update, the last one again as it was partial
+        start = self.until - self.until % DAY_MS
+        self.truncate(start // DAY_MS)
+        casts = timeindex.read_range(
+            cast_file, start, columns=["author_fid", "timestamp"]
+        )
+        reactions = timeindex.read_range(
+            reaction_file, start, columns=["reactor_fid", "timestamp", "target_hash"]
+        )
+        self.add(casts, reactions, cast_authors(cast_file, reactions["target_hash"]))
+
+    # ==================================================================================
+    # storage
+    # ==================================================================================
+
+    def save(self, file_path: str) -> None:
+        table = pa.Table.from_pandas(self.frame(), preserve_index=False)
+        table = table.replace_schema_metadata({"until": str(self.until)})
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        pq.write_table(table, f"{file_path}.tmp")
+        os.replace(f"{file_path}.tmp", file_path)
+
+    @staticmethod
+    def load(file_path: str) -> "Activity":
+        activity = Activity()
+        if not os.path.exists(file_path):
+            return activity
+        table = pq.read_table(file_path)
+        activity.set_frame(table.to_pandas())
+        activity.until = int(table.schema.metadata[b"until"])
+        return activity
+
+
+# ======================================================================================
+# reports
+# ======================================================================================
+
+
+def cohorts(
+    registered: npt.NDArray[np.int64], start: int, end: int
+) -> Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    # fids registered in [start, end) -> (fids, cohort of each fid, cohort weeks)
+    day = np.arange(len(registered))
+    in_window = (registered >= 0) & (registered >= start // DAY_MS)
+    in_window &= registered * DAY_MS < end
+    fids = day[in_window]
+    weeks, cohort = np.unique(week_start(registered[fids]), return_inverse=True)
+    return fids, cohort, weeks
+
+
+def user_rows(
+    activity: Activity,
+    registered: npt.NDArray[np.int64],
+    fids: npt.NDArray[np.int64],
+    kind: str,
+) -> npt.NDArray[np.int64]:
+    # activity rows of `kind` for these fids
+    member = np.zeros(len(registered), dtype=np.bool_)
+    member[fids] = True
+    known = activity.fid < len(registered)
+    rows = np.flatnonzero(known & (activity.counts[kind] > 0))
+    mine: npt.NDArray[np.int64] = rows[member[activity.fid[rows]]]
+    return mine
+
+
+def retention(
+    activity: Activity,
+    registered: npt.NDArray[np.int64],
+    start: int,
+    end: int,
+    kind: str = "casts",
+    period_days: int = 7,
+    periods: int = 12,
+) -> pd.DataFrame:
+    # per registration week: users, then the share of them active in each period
+    # after registering; a period is only counted for users who had all of it
+    # observed (NaN when none did)
+    fids, cohort, weeks = cohorts(registered, start, end)
+    cohort_of = np.full(len(registered), -1, dtype=np.int64)
+    cohort_of[fids] = cohort
+    complete = activity.until // DAY_MS  # days before it are complete
+
+    rows = user_rows(activity, registered, fids, kind)
+    fid = activity.fid[rows]
+    k = (activity.day[rows] - registered[fid]) // period_days
+    observed = registered[fid] + period_days * (k + 1) <= complete
+    keep = (k >= 0) & (k < periods) & observed
+    pairs = np.unique(fid[keep] * periods + k[keep])
+    fid, k = pairs // periods, pairs % periods
+    active = np.bincount(
+        cohort_of[fid] * periods + k, minlength=len(weeks) * periods
+    ).reshape(len(weeks), periods)
+
+    eligible = np.stack(
+        [
+            np.bincount(
+                cohort[registered[fids] + period_days * (p + 1) <= complete],
+                minlength=len(weeks),
+            )
+            for p in range(periods)
+        ],
+        axis=1,
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rates = np.where(eligible > 0, active / eligible, np.nan)
+
+    df = pd.DataFrame(rates, columns=[f"period_{p}" for p in range(periods)])
+    df.insert(0, "users", np.bincount(cohort, minlength=len(weeks)))
+    df.insert(0, "week", day_label(weeks))
+    return df
+
+
+def activation(
+    activity: Activity,
+    registered: npt.NDArray[np.int64],
+    start: int,
+    end: int,
+    kind: str = "casts",
+    thresholds: List[int] = THRESHOLDS,
+    window_days: Optional[int] = None,
+) -> pd.DataFrame:
+    # per registration week: users, and how many of them reached each count of
+    # `kind`, within window_days of registering or ever
+    fids, cohort, weeks = cohorts(registered, start, end)
+    rows = user_rows(activity, registered, fids, kind)
+    fid = activity.fid[rows]
+    counts = activity.counts[kind][rows]
+    if window_days is not None:
+        age = activity.day[rows] - registered[fid]
+        counts = np.where((age >= 0) & (age < window_days), counts, 0)
+    totals = np.bincount(fid, weights=counts, minlength=len(registered))[fids]
+
+    df = pd.DataFrame(
+        {
+            "week": day_label(weeks),
+            "total_registered": np.bincount(cohort, minlength=len(weeks)),
+        }
+    )
+    for t in thresholds:
+        reached = np.bincount(cohort, weights=totals >= t, minlength=len(weeks))
+        df[f"{kind}_{t}_plus"] = reached.astype(np.int64)
+    return df
+
+
+def first_actions(
+    activity: Activity, windows: Dict[str, int] = WINDOWS
+) -> pd.DataFrame:
+    # every fid that cast: day of the first cast, then casts and reactions received
+    # within each window (days, the first one included) from that day on
+    casts = activity.counts["casts"]
+    rows = np.flatnonzero(casts > 0)
+    size = int(activity.fid.max(initial=-1)) + 1
+    first = np.full(size, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(first, activity.fid[rows], activity.day[rows])
+    fids = np.flatnonzero(first < np.iinfo(np.int64).max)
+
+    age = activity.day - first[activity.fid]  # < 0 for fids that never cast
+    df = pd.DataFrame({"fid": fids, "first_cast": first[fids] * DAY_MS})
+    for label, days in windows.items():
+        inside = (age >= 0) & (age < days)
+        for kind, column in [("casts", "casts"), ("received", "reactions")]:
+            weights = np.where(inside, activity.counts[kind], 0)
+            counts = np.bincount(activity.fid, weights=weights, minlength=size)
+            df[f"{column}_{label}"] = counts[fids].astype(np.int64)
+    return df
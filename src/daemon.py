@@ -0,0 +1,309 @@
+import asyncio
+import os
+import signal
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+import pydantic
+
+import src.channel as channel
+import src.engagement as engagement
+import src.indexer as indexer
+import src.metrics as metrics
+import src.search as search
+import src.segments as segments
+import src.timeindex as timeindex
+import src.user_store as user_store
+
+# long running ingestion, python main.py serve
+# state that the batch refreshes rebuild from files on every run (newest cast
+# timestamp, known fids, recent cast hashes) is loaded once and kept in memory:
+# - casts: poll the head of /recent-casts every few seconds, page back only until
+#   the newest cast we already have, append new ones to the cast queue
+# - users: every few minutes fetch fids we haven't seen (new registrations and
+#   authors of new casts), warpcast then searchcaster then ensdata
+# - reactions: every few minutes re-crawl reactions of recent casts
+# - compact: every few minutes merge the queues into the parquet files, and feed
+#   the new casts and reactions to the engagement scores
+# the queue files and parquet layout are the same as main.py refresh, so batch
+# refreshes and the daemon can be mixed
+
+
+class DaemonConfig(pydantic.BaseModel):
+    poll_interval: float = 5.0
+    user_interval: float = 600.0
+    reaction_interval: float = 300.0
+    compact_interval: float = 600.0
+    page_size: int = 100
+    backfill_pages: int = 10  # cap when there's no local data, use refresh cast
+    reaction_window_ms: int = 24 * 60 * 60 * 1000  # casts this recent get reactions
+    cast_file: str = "data/casts.parquet"
+    user_file: str = "data/users.parquet"
+    reaction_file: str = "data/reactions.parquet"
+    cast_queue: str = "queue/cast_warpcast.ndjson"
+    reaction_queue: str = "queue/reaction_warpcast.ndjson"
+    user_warpcast_queue: str = "queue/user_warpcast.ndjson"
+    user_searchcaster_queue: str = "queue/user_searchcaster.ndjson"
+    user_ensdata_queue: str = "queue/user_ensdata.ndjson"
+    channel_file: str = "data/fip2.ndjson"
+    search_root: str = "data/search"
+    channel_root: str = "data/casts_by_channel"
+    engagement_root: str = "data/engagement"
+    metrics_file: str = "data/metrics.prom"
+
+
+class Daemon:
+    def __init__(self, config: Optional[DaemonConfig] = None) -> None:
+        self.config = config or DaemonConfig()
+        self.stopping = asyncio.Event()
+        self.latest_t = 0
+        self.recent: Dict[str, int] = {}  # cast hash -> timestamp, reaction window
+        self.known_fids: Set[int] = set()
+        self.pending_fids: Set[int] = set()
+        self.touched_channels: Set[str] = set()
+        self.users_lock = asyncio.Lock()  # user queues are appended and merged
+        self.channels = channel.ChannelIndex(self.config.channel_file)
+        self.engagement = engagement.Engagement()
+        self.users = user_store.UserStore()  # users.parquet, kept current by compact
+
+    def load(self) -> None:
+        # the only full scans, once at startup
+        c = self.config
+        self.latest_t = indexer.QueueProducer.cast_warpcast(c.cast_file)
+        # queued but not compacted yet
+        queued_t = indexer.get_property("timestamp", c.cast_queue)
+        self.latest_t = max([self.latest_t] + queued_t)
+        t_from = self.latest_t - c.reaction_window_ms
+        df = timeindex.read_range(c.cast_file, t_from, columns=["hash", "timestamp"])
+        self.recent = dict(zip(df["hash"], df["timestamp"]))
+        self.users = user_store.UserStore.from_parquet(c.user_file)
+        self.known_fids.update(np.flatnonzero(self.users.complete()).tolist())
+        self.known_fids.update(indexer.get_fids(c.user_warpcast_queue))
+        self.load_engagement()
+        metrics.event(
+            "daemon_loaded",
+            latest_t=self.latest_t,
+            recent_casts=len(self.recent),
+            known_fids=len(self.known_fids),
+            users=len(self.users),
+            engagement_casts=len(self.engagement),
+        )
+
+    def load_engagement(self) -> None:
+        # saved scores, or built once from the parquet files
+        c = self.config
+        if os.path.exists(c.engagement_root):
+            self.engagement = engagement.Engagement.load(c.engagement_root)
+            return
+        self.engagement = engagement.Engagement()
+        if os.path.exists(c.cast_file):
+            columns = ["hash", "timestamp", "author_fid", "channel_id"]
+            self.engagement.add_casts(pd.read_parquet(c.cast_file, columns=columns))
+        if os.path.exists(c.reaction_file):
+            columns = ["type", "timestamp", "target_hash"]
+            df = pd.read_parquet(c.reaction_file, columns=columns)
+            self.engagement.add_reactions(df)
+        self.engagement.save(c.engagement_root)
+
+    # ==================================================================================
+    # casts
+    # ==================================================================================
+
+    async def poll_casts(self) -> int:
+        c = self.config
+        cursor: Optional[str] = None
+        new: List[indexer.CastWarpcast] = []
+        pages = 0
+        while self.latest_t > 0 or pages < c.backfill_pages:
+            pages += 1
+            url = indexer.UrlMaker.cast_warpcast(limit=c.page_size)
+            if cursor:
+                url = indexer.UrlMaker.cast_warpcast(limit=c.page_size, cursor=cursor)
+            result = await indexer.Fetcher.cast_warpcast(url)
+            casts = result["casts"]
+            # same millisecond casts can straddle polls, hence >= plus the hash check
+            fresh = [
+                cast
+                for cast in casts
+                if cast.timestamp >= self.latest_t and cast.hash not in self.recent
+            ]
+            new.extend(fresh)
+            cursor = result["next_cursor"]
+            if not casts or cursor is None or casts[-1].timestamp < self.latest_t:
+                break
+
+        if new:
+            # recent already filters, the seen-set also keeps batch refreshes from
+            # queueing these again
+            keys = [cast.hash for cast in new]
+            indexer.BatchFetcher.append("cast_warpcast", c.cast_queue, keys, new)
+            self.channels.update(new)
+            for cast in new:
+                self.recent[cast.hash] = cast.timestamp
+                if cast.author_fid not in self.known_fids:
+                    self.pending_fids.add(cast.author_fid)
+                if cast.channel_id:
+                    self.touched_channels.add(cast.channel_id)
+            self.latest_t = max(self.latest_t, max(cast.timestamp for cast in new))
+
+        lag = time.time() - self.latest_t / 1000 if self.latest_t else 0
+        metrics.registry.inc("daemon_casts_total", len(new))
+        metrics.registry.set("daemon_cast_lag_seconds", lag)
+        metrics.event("daemon_poll", new=len(new), lag_s=round(lag, 1))
+        return len(new)
+
+    # ==================================================================================
+    # users and reactions
+    # ==================================================================================
+
+    async def refresh_users(self) -> int:
+        async with self.users_lock:
+            return await self.fetch_users()
+
+    async def fetch_users(self) -> int:
+        c = self.config
+        highest = await asyncio.to_thread(indexer.fetch_highest_fid)
+        known_max = max(self.known_fids, default=0)
+        wanted = set(range(known_max + 1, highest + 1)) | self.pending_fids
+        fids = sorted(wanted - self.known_fids)
+        if not fids:
+            return 0
+
+        await indexer.BatchFetcher.user_warpcast(fids, out=c.user_warpcast_queue)
+        await indexer.BatchFetcher.user_searchcaster(
+            fids, out=c.user_searchcaster_queue
+        )
+        addrs = await indexer.QueueProducer.user_ensdata_async(
+            c.user_searchcaster_queue, c.user_ensdata_queue
+        )
+        await indexer.BatchFetcher.user_ensdata(addrs, out=c.user_ensdata_queue)
+        self.known_fids.update(fids)
+        self.pending_fids.clear()
+        metrics.registry.inc("daemon_users_total", len(fids))
+        return len(fids)
+
+    async def refresh_reactions(self) -> int:
+        c = self.config
+        cutoff = self.latest_t - c.reaction_window_ms
+        self.recent = {h: t for h, t in self.recent.items() if t >= cutoff}
+        hashes: List[Tuple[str, Optional[str]]] = [(h, None) for h in self.recent]
+        await indexer.BatchFetcher.reaction_warpcast(hashes, out=c.reaction_queue)
+        return len(hashes)
+
+    # ==================================================================================
+    # storage
+    # ==================================================================================
+
+    async def compact(self) -> None:
+        # sealing runs on the event loop, where every append happens too; the
+        # merge reads exactly the sealed segments, later appends (and segments
+        # sealed meanwhile) wait for the next round, failed ones are retried
+        c = self.config
+        t = time.perf_counter()
+        casts = segments.seal(c.cast_queue)
+        reactions = segments.seal(c.reaction_queue)
+        touched, self.touched_channels = self.touched_channels, set()
+        try:
+            await asyncio.to_thread(self.compact_queues, casts, reactions, touched)
+        except Exception:
+            self.touched_channels |= touched
+            raise
+        async with self.users_lock:
+            await asyncio.to_thread(self.compact_users)
+
+        metrics.registry.observe("daemon_compact_seconds", time.perf_counter() - t)
+        metrics.registry.write_prometheus(c.metrics_file)
+
+    def compact_queues(
+        self, casts: List[str], reactions: List[str], touched: Set[str]
+    ) -> None:
+        # pending segments -> parquet, then the derived stores for what changed
+        c = self.config
+        if casts:
+            queued = indexer.read_ndjson(casts)
+            df = indexer.Merger.cast(casts, c.cast_file)
+            timeindex.write(df, c.cast_file)
+            channel.ChannelStore(c.channel_root).write(df, only=touched)
+            search.SearchIndex(c.search_root).add(queued)
+            self.engagement.add_casts(queued)
+            segments.consume(casts)
+            segments.prune(c.cast_queue)
+        if reactions:
+            # scores must not count a reaction twice, new ones are picked before
+            # the merge makes them stored
+            queued = self.new_reactions(indexer.read_ndjson(reactions))
+            df = indexer.Merger.reaction(reactions, c.reaction_file)
+            timeindex.write(df, c.reaction_file)
+            if not df.empty:
+                counts = df["target_hash"].value_counts()
+                search.SearchIndex(c.search_root).set_reaction_counts(counts)
+            if not queued.empty:
+                self.engagement.add_reactions(queued)
+            segments.consume(reactions)
+            segments.prune(c.reaction_queue)
+        if casts or reactions:
+            self.engagement.save(c.engagement_root)
+
+    def new_reactions(self, queued: pd.DataFrame) -> pd.DataFrame:
+        # the seen set keeps re-crawled reactions out of the queue, but it can be
+        # off (SEEN_FILE=), so queued ones already in reaction_file are dropped too.
+        # a re-crawled reaction keeps its timestamp: only the queued time range of
+        # the file is read
+        if queued.empty:
+            return queued
+        queued = queued.drop_duplicates("hash")
+        t_from = int(queued["timestamp"].min())
+        t_until = int(queued["timestamp"].max()) + 1
+        stored = timeindex.read_range(
+            self.config.reaction_file, t_from, t_until, columns=["hash"]
+        )
+        return queued[~queued["hash"].isin(stored["hash"])]
+
+    def compact_users(self) -> None:
+        c = self.config
+        indexer.Merger.user_segments(
+            c.user_warpcast_queue,
+            c.user_searchcaster_queue,
+            c.user_file,
+            store=self.users,
+        )
+
+    # ==================================================================================
+    # scheduling
+    # ==================================================================================
+
+    async def every(self, interval: float, job: Any, name: str) -> None:
+        # run job, sleep, repeat until stopped; a failing job is logged and retried
+        # on the next tick instead of taking the daemon down
+        while not self.stopping.is_set():
+            try:
+                await job()
+            except Exception as e:
+                metrics.registry.inc("daemon_job_errors_total", job=name)
+                metrics.event("daemon_job_failed", job=name, error=repr(e))
+            try:
+                await asyncio.wait_for(self.stopping.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self) -> None:
+        c = self.config
+        await asyncio.to_thread(self.load)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stopping.set)
+
+        try:
+            await asyncio.gather(
+                self.every(c.poll_interval, self.poll_casts, "casts"),
+                self.every(c.user_interval, self.refresh_users, "users"),
+                self.every(c.reaction_interval, self.refresh_reactions, "reactions"),
+                self.every(c.compact_interval, self.compact, "compact"),
+            )
+        finally:
+            # anything still queued goes to parquet before exiting
+            await self.compact()
+            indexer.BatchFetcher.close_seen_set()
+            metrics.event("daemon_stopped", latest_t=self.latest_t)
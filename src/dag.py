@@ -0,0 +1,93 @@
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# tiny dependency graph runner for pipelines, nodes are plain functions called with
+# the results of their dependencies (in the order listed) and run on a thread pool
+# as soon as those are done. threads are fine here, the work is waiting on the db
+# and pandas / pyarrow release the gil for most of the heavy lifting
+#   dag = Dag()
+#   dag.add("reactions", lambda: execute_query(q1))
+#   dag.add("casts", lambda r: execute_query(q2(r)), deps=["reactions"])
+#   dag.add("usernames", lambda: fid_lookup("username"))
+#   results = dag.run(max_workers=4)
+
+
+class Node:
+    def __init__(
+        self, name: str, fn: Callable[..., Any], deps: Sequence[str] = ()
+    ) -> None:
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+
+
+class Dag:
+    def __init__(self) -> None:
+        self.nodes: Dict[str, Node] = {}
+
+    def add(self, name: str, fn: Callable[..., Any], deps: Sequence[str] = ()) -> None:
+        assert name not in self.nodes, f"duplicate node {name}"
+        self.nodes[name] = Node(name, fn, deps)
+
+    def order(self) -> List[str]:
+        # topological order, also checks for unknown deps and cycles
+        done: Dict[str, bool] = {}  # name -> finished (False while on the stack)
+        out: List[str] = []
+
+        def visit(name: str) -> None:
+            if done.get(name) is False:
+                raise ValueError(f"cycle through {name}")
+            if name in done:
+                return
+            if name not in self.nodes:
+                raise ValueError(f"unknown dependency {name}")
+            done[name] = False
+            for dep in self.nodes[name].deps:
+                visit(dep)
+            done[name] = True
+            out.append(name)
+
+        for name in self.nodes:
+            visit(name)
+        return out
+
+    def run(self, max_workers: Optional[int] = None) -> Dict[str, Any]:
+        order = self.order()
+        results: Dict[str, Any] = {}
+        running: Dict[Future[Any], str] = {}
+        pending = list(order)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while pending or running:
+                for name in [n for n in pending if self.ready(n, results)]:
+                    pending.remove(name)
+                    node = self.nodes[name]
+                    args = [results[dep] for dep in node.deps]
+                    # copy the context so profiler stages nest under the caller's
+                    ctx = contextvars.copy_context()
+                    running[pool.submit(ctx.run, node.fn, *args)] = name
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        for other in running:
+                            other.cancel()
+                        raise RuntimeError(f"dag node {name} failed") from error
+                    results[name] = future.result()
+        return results
+
+    def ready(self, name: str, results: Dict[str, Any]) -> bool:
+        return all(dep in results for dep in self.nodes[name].deps)
+
+
+def parallel(
+    max_workers: Optional[int] = None, **fns: Callable[[], Any]
+) -> Dict[str, Any]:
+    # independent nodes only, parallel(casts=f, reactions=g) -> {"casts": .., ...}
+    dag = Dag()
+    for name, fn in fns.items():
+        dag.add(name, fn)
+    return dag.run(max_workers)
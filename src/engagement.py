@@ -0,0 +1,422 @@
+import heapq
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pydantic
+
+# per cast engagement scores kept up to date as reactions come in, so "top casts of
+# the day / channel / author" is a read of N entries instead of a join of casts and
+# reactions plus a window every time
+# - score: sum of weights[type] over the cast's reactions; with a half-life the
+#   weights decay with age, forward decay style: a reaction at t adds
+#   w * 2^((t - landmark) / half_life), so all scores shrink by the same factor as
+#   time passes and rankings never need touching, score(now) just rescales
+# - top-N heaps per utc day of the cast, channel and author, updated per batch
+# - weights are >= 0, scores only grow: a cast that drops out of a heap can only
+#   get back in through an update of its score, and updates are always offered
+# - reactions can arrive before their cast, their score waits for it
+# - reactions are added once, there's no dedupe here (the crawler's seen set and
+#   the replicator's ids take care of that)
+# on disk: <root>/casts.parquet (one row per cast) + <root>/meta.json
+
+DAY_MS = 24 * 60 * 60 * 1000
+REACTION_TYPES = {1: "like", 2: "recast"}  # replicator reaction_type
+DIMENSIONS = ["day", "channel", "author"]
+MAX_EXPONENT = 512.0  # of the decay factor, the landmark moves up past it
+BULK = 10_000  # candidates past which touched heaps are rebuilt instead of offered to
+
+
+class EngagementConfig(pydantic.BaseModel):
+    weights: Dict[str, float] = {"like": 1.0, "recast": 3.0}
+    half_life_ms: Optional[int] = None  # None: no decay
+    top_n: int = 50
+    since: int = 0  # casts older than this aren't tracked
+
+
+class TopN:
+    # min-heap of (score, -cast), ties go to the cast added first; a raised score
+    # is pushed again and the stale entry is skipped once it reaches the top
+
+    def __init__(self, n: int) -> None:
+        self.n = n
+        self.heap: List[Tuple[float, int]] = []
+        self.members: Dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def offer(self, cast: int, score: float) -> Optional[int]:
+        # returns the cast that was pushed out, cast itself if it didn't get in
+        if cast in self.members or len(self.members) < self.n:
+            self.members[cast] = score
+            heapq.heappush(self.heap, (score, -cast))
+            if len(self.heap) > 4 * self.n:
+                self.rebuild()
+            return None
+        while self.members.get(-self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        if (score, -cast) <= self.heap[0]:
+            return cast
+        _, evicted = heapq.heapreplace(self.heap, (score, -cast))
+        del self.members[-evicted]
+        self.members[cast] = score
+        return -evicted
+
+    def rebuild(self) -> None:
+        self.heap = [(score, -cast) for cast, score in self.members.items()]
+        heapq.heapify(self.heap)
+
+    @staticmethod
+    def from_items(n: int, casts: List[int], scores: List[float]) -> "TopN":
+        # casts ranked best first, reversed that's already a valid heap
+        top = TopN(n)
+        top.members = dict(zip(casts, scores))
+        top.heap = list(zip(scores[::-1], [-c for c in casts[::-1]]))
+        return top
+
+    def items(self) -> List[Tuple[int, float]]:
+        return sorted(self.members.items(), key=lambda item: (-item[1], item[0]))
+
+
+class Engagement:
+    def __init__(self, config: Optional[EngagementConfig] = None) -> None:
+        self.config = config or EngagementConfig()
+        if any(w < 0 for w in self.config.weights.values()):
+            raise ValueError("engagement weights must be >= 0")
+        self.landmark = self.config.since  # of the decay
+        self.now = 0  # newest reaction
+        self.watermarks: Dict[str, int] = {}  # for callers catching up on a source
+        self.index: Dict[str, int] = {}
+        self.hashes: List[str] = []
+        self.channels: List[str] = []
+        self.channel_index: Dict[str, int] = {}
+        # per cast row, grown by resize
+        self.score: npt.NDArray[np.float64]
+        self.timestamp: npt.NDArray[np.int64]
+        self.author: npt.NDArray[np.int64]
+        self.channel: npt.NDArray[np.int32]
+        self.known: npt.NDArray[np.bool_]
+        self.in_top: npt.NDArray[np.bool_]  # dimension x row
+        self.capacity = 0
+        self.resize(1024)
+        self.heaps: Dict[str, Dict[int, TopN]] = {d: {} for d in DIMENSIONS}
+
+    def __len__(self) -> int:
+        return int(self.known[: len(self.hashes)].sum())
+
+    def resize(self, capacity: int) -> None:
+        def grow(
+            a: Optional[npt.NDArray[Any]], fill: int, dtype: type
+        ) -> npt.NDArray[Any]:
+            out: npt.NDArray[Any] = np.full((capacity,), fill, dtype=dtype)
+            if a is not None:
+                out[: len(a)] = a
+            return out
+
+        first = self.capacity == 0
+        self.score = grow(None if first else self.score, 0, np.float64)
+        self.timestamp = grow(None if first else self.timestamp, -1, np.int64)
+        self.author = grow(None if first else self.author, -1, np.int64)
+        self.channel = grow(None if first else self.channel, -1, np.int32)
+        self.known = grow(None if first else self.known, 0, np.bool_)
+        in_top = np.zeros((len(DIMENSIONS), capacity), dtype=np.bool_)
+        if not first:
+            in_top[:, : self.capacity] = self.in_top
+        self.in_top = in_top
+        self.capacity = capacity
+
+    def indices(self, hashes: List[str]) -> npt.NDArray[np.int64]:
+        # cast hash -> row, new hashes get one
+        rows = [self.index.get(h, -1) for h in hashes]
+        if -1 in rows:
+            new = list(dict.fromkeys(h for h, r in zip(hashes, rows) if r < 0))
+            self.index.update(
+                zip(new, range(len(self.hashes), len(self.hashes) + len(new)))
+            )
+            self.hashes += new
+            rows = [self.index[h] for h in hashes]
+        if len(self.hashes) > self.capacity:
+            self.resize(max(2 * self.capacity, len(self.hashes)))
+        return np.array(rows, dtype=np.int64)
+
+    def channel_codes(self, channels: pd.Series) -> npt.NDArray[np.int32]:
+        local, uniques = pd.factorize(channels)  # nulls -> -1
+        mapping = np.empty(len(uniques) + 1, dtype=np.int32)
+        mapping[-1] = -1
+        for i, c in enumerate(uniques.tolist()):
+            code = self.channel_index.get(c)
+            if code is None:
+                code = self.channel_index[c] = len(self.channels)
+                self.channels.append(c)
+            mapping[i] = code
+        codes: npt.NDArray[np.int32] = mapping[local]
+        return codes
+
+    # ==================================================================================
+    # updates
+    # ==================================================================================
+
+    def add_casts(self, df: pd.DataFrame) -> int:
+        # df: hash, timestamp, author_fid, channel_id (optional); returns casts added
+        if df.empty:
+            return 0
+        df = df[df["timestamp"].to_numpy(np.int64) >= self.config.since]
+        df = df.drop_duplicates("hash", keep="last")
+        rows = self.indices(df["hash"].tolist())
+        new = ~self.known[rows]
+        rows, df = rows[new], df[new]
+        if len(rows) == 0:
+            return 0
+        self.timestamp[rows] = df["timestamp"].to_numpy(np.int64)
+        self.author[rows] = df["author_fid"].to_numpy(np.int64)
+        if "channel_id" in df:
+            self.channel[rows] = self.channel_codes(df["channel_id"])
+        self.known[rows] = True
+        self.offer(rows)
+        return len(rows)
+
+    def add_reactions(self, df: pd.DataFrame) -> int:
+        # df: type ("like" / "recast" or the replicator's ints), timestamp,
+        # target_hash; returns reactions counted
+        if df.empty:
+            return 0
+        types = df["type"]
+        if pd.api.types.is_integer_dtype(types.dtype):
+            types = types.map(REACTION_TYPES)
+        weights = types.map(self.config.weights).astype(float).fillna(0).to_numpy()
+        t = df["timestamp"].to_numpy(np.int64)
+        keep = (weights > 0) & df["target_hash"].notna().to_numpy()
+        keep &= t >= self.config.since  # can't be for a tracked cast
+        if not keep.any():
+            return 0
+        weights, t = weights[keep], t[keep]
+        self.now = max(self.now, int(t.max()))
+
+        h = self.config.half_life_ms
+        if h:
+            if (t.max() - self.landmark) / h > MAX_EXPONENT:
+                self.rebase(int(t.max()))
+            weights = weights * np.exp2((t - self.landmark) / h)
+        targets = df["target_hash"][keep].to_numpy(object)
+        sums = pd.Series(weights).groupby(targets, sort=False).sum()
+        rows = self.indices(sums.index.tolist())
+        self.score[rows] += sums.to_numpy()
+        self.offer(rows[self.known[rows]])
+        return int(keep.sum())
+
+    def rebase(self, landmark: int) -> None:
+        # same scores relative to a later landmark, keeps the factors finite
+        h = self.config.half_life_ms
+        assert h, "only scores with a half-life decay"
+        factor = np.exp2(-(landmark - self.landmark) / h)
+        self.score[: len(self.hashes)] *= factor
+        self.landmark = landmark
+        for heaps in self.heaps.values():
+            for top in heaps.values():
+                top.members = {c: float(self.score[c]) for c in top.members}
+                top.rebuild()
+
+    def groups(
+        self, dimension: str, rows: npt.NDArray[np.int64]
+    ) -> npt.NDArray[np.int64]:
+        groups: npt.NDArray[np.int64]
+        if dimension == "day":
+            groups = self.timestamp[rows] // DAY_MS
+        elif dimension == "channel":
+            groups = self.channel[rows].astype(np.int64)
+        else:
+            groups = self.author[rows]
+        return groups
+
+    def offer(self, rows: npt.NDArray[np.int64]) -> None:
+        # only the batch's top N per group can get in, plus heap members whose
+        # scores went up
+        rows = np.unique(rows)
+        n = self.config.top_n
+        for d, dimension in enumerate(DIMENSIONS):
+            groups = self.groups(dimension, rows)
+            df = pd.DataFrame({"group": groups, "row": rows, "score": self.score[rows]})
+            df = df[df["group"] >= 0].sort_values(
+                ["score", "row"], ascending=[False, True]
+            )
+            ranked = df.groupby("group", sort=False).cumcount().to_numpy() < n
+            df = df[ranked | self.in_top[d, df["row"].to_numpy()]]
+            if len(df) > BULK:
+                self.rebuild_heaps(d, df)
+                continue
+            heaps = self.heaps[dimension]
+            for group, row, score in zip(
+                df["group"].tolist(), df["row"].tolist(), df["score"].tolist()
+            ):
+                top = heaps.get(group)
+                if top is None:
+                    top = heaps[group] = TopN(n)
+                self.in_top[d, row] = True
+                out = top.offer(row, score)
+                if out is not None:
+                    self.in_top[d, out] = False
+
+    def rebuild_heaps(self, d: int, candidates: pd.DataFrame) -> None:
+        # big batches (loads, backfills): the touched groups' heaps from scratch,
+        # top N of their current members and the candidates
+        dimension, n = DIMENSIONS[d], self.config.top_n
+        size = len(self.hashes)
+        touched = candidates["group"].unique()
+        members = np.flatnonzero(self.in_top[d, :size])
+        members = members[np.isin(self.groups(dimension, members), touched)]
+        self.in_top[d, members] = False
+        df = pd.concat(
+            [
+                candidates,
+                pd.DataFrame(
+                    {
+                        "group": self.groups(dimension, members),
+                        "row": members,
+                        "score": self.score[members],
+                    }
+                ),
+            ]
+        ).drop_duplicates("row")
+        df = df.sort_values(
+            ["group", "score", "row"], ascending=[True, False, True], kind="stable"
+        )
+        df = df[df.groupby("group", sort=False).cumcount().to_numpy() < n]
+        self.in_top[d, df["row"].to_numpy()] = True
+
+        groups = df["group"].to_numpy()
+        bounds = np.flatnonzero(np.diff(groups)) + 1
+        starts = [0] + bounds.tolist()
+        ends = bounds.tolist() + [len(groups)]
+        row_list, score_list = df["row"].tolist(), df["score"].tolist()
+        heaps = self.heaps[dimension]
+        for group, i, j in zip(groups[starts].tolist(), starts, ends):
+            heaps[group] = TopN.from_items(n, row_list[i:j], score_list[i:j])
+
+    # ==================================================================================
+    # queries
+    # ==================================================================================
+
+    def decay(self, now: Optional[int] = None) -> float:
+        # stored score -> score at `now` (newest reaction by default)
+        h = self.config.half_life_ms
+        if not h:
+            return 1.0
+        return float(np.exp2(-((now or self.now) - self.landmark) / h))
+
+    def rows_frame(
+        self, rows: List[int], scores: npt.NDArray[np.float64]
+    ) -> pd.DataFrame:
+        rows_ = np.asarray(rows, dtype=np.int64)
+        channels = self.channel[rows_]
+        return pd.DataFrame(
+            {
+                "hash": [self.hashes[r] for r in rows],
+                "score": scores,
+                "timestamp": self.timestamp[rows_],
+                "author_fid": self.author[rows_],
+                "channel_id": [self.channels[c] if c >= 0 else None for c in channels],
+            }
+        )
+
+    def top(
+        self,
+        day: Optional[int] = None,
+        channel: Optional[str] = None,
+        author: Optional[int] = None,
+        n: Optional[int] = None,
+        now: Optional[int] = None,
+    ) -> pd.DataFrame:
+        # one of: day (any ms timestamp in it), channel, author; n <= top_n
+        if sum(x is not None for x in [day, channel, author]) != 1:
+            raise ValueError("top() takes exactly one of day, channel, author")
+        if day is not None:
+            top = self.heaps["day"].get(day // DAY_MS)
+        elif channel is not None:
+            code = self.channel_index.get(channel)
+            top = None if code is None else self.heaps["channel"].get(code)
+        elif author is not None:
+            top = self.heaps["author"].get(author)
+        items = top.items()[: n or self.config.top_n] if top else []
+        scores = np.array([s for _, s in items], dtype=np.float64) * self.decay(now)
+        return self.rows_frame([r for r, _ in items], scores)
+
+    def top_by_day(
+        self, start: int, end: int, n: Optional[int] = None, now: Optional[int] = None
+    ) -> pd.DataFrame:
+        # top n of each utc day for casts in [start, end), plus a `day` column
+        # (day start, ms); days cut by the window are ranked from the cast rows
+        n = n or self.config.top_n
+        frames = []
+        for day in range(start - start % DAY_MS, end, DAY_MS):
+            if start <= day and day + DAY_MS <= end:
+                df = self.top(day=day, n=n, now=now)
+            else:
+                ts = self.timestamp[: len(self.hashes)]
+                rows = np.flatnonzero(self.known[: len(ts)] & (ts >= max(day, start)))
+                rows = rows[ts[rows] < min(day + DAY_MS, end)]
+                order = np.lexsort((rows, -self.score[rows]))[:n]
+                rows = rows[order]
+                df = self.rows_frame(rows.tolist(), self.score[rows] * self.decay(now))
+            frames.append(df.assign(day=day))
+        if not frames:
+            return self.rows_frame([], np.empty(0)).assign(day=0)
+        return pd.concat(frames, ignore_index=True)
+
+    # ==================================================================================
+    # storage
+    # ==================================================================================
+
+    def save(self, root: str) -> None:
+        size = len(self.hashes)
+        channels = np.array(self.channels + [None], dtype=object)[self.channel[:size]]
+        table = pa.table(
+            {
+                "hash": pa.array(self.hashes, pa.string()),
+                "score": self.score[:size],
+                "timestamp": self.timestamp[:size],
+                "author_fid": self.author[:size],
+                "channel_id": pa.array(channels, pa.string()),
+                "known": self.known[:size],
+            }
+        )
+        meta = {
+            "config": self.config.model_dump(),
+            "landmark": self.landmark,
+            "now": self.now,
+            "watermarks": self.watermarks,
+        }
+        os.makedirs(root, exist_ok=True)
+        file_path = os.path.join(root, "casts.parquet")
+        pq.write_table(table, f"{file_path}.tmp")
+        os.replace(f"{file_path}.tmp", file_path)
+        with open(os.path.join(root, "meta.json.tmp"), "w") as f:
+            json.dump(meta, f)
+        os.replace(os.path.join(root, "meta.json.tmp"), os.path.join(root, "meta.json"))
+
+    @staticmethod
+    def load(root: str, config: Optional[EngagementConfig] = None) -> "Engagement":
+        # `config` for a fresh engine when nothing was saved
+        meta_file = os.path.join(root, "meta.json")
+        if not os.path.exists(meta_file):
+            return Engagement(config)
+        with open(meta_file) as f:
+            meta = json.load(f)
+        scores = Engagement(EngagementConfig(**meta["config"]))
+        scores.landmark, scores.now = meta["landmark"], meta["now"]
+        scores.watermarks = meta["watermarks"]
+
+        df = pq.read_table(os.path.join(root, "casts.parquet")).to_pandas()
+        rows = scores.indices(df["hash"].tolist())
+        scores.score[rows] = df["score"].to_numpy()
+        scores.timestamp[rows] = df["timestamp"].to_numpy()
+        scores.author[rows] = df["author_fid"].to_numpy()
+        scores.channel[rows] = scores.channel_codes(df["channel_id"])
+        scores.known[rows] = df["known"].to_numpy()
+        scores.offer(rows[scores.known[rows]])
+        return scores
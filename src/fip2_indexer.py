@@ -1,88 +1,57 @@
-import functools
-import json
-import os
-from typing import Any, Dict, List, Optional
+import asyncio
+import sys
+from typing import Optional
 
-import pandas as pd
-import requests
+import src.channel as channel
+import src.indexer as indexer
+import src.utils as utils
 
-import utils
-
-
-def make_warpcast_request(url: str) -> Any:
-    api_key = os.getenv("PICTURE_WARPCAST_API_KEY")
-    headers = {"Authorization": f"Bearer {api_key}"}
-    response = requests.get(url, headers=headers)
-    return response.json()
-
-
-def url_maker(limit: int = 1000, cursor: Optional[str] = None) -> str:
-    warpcast_url = "https://api.warpcast.com/v2/recent-casts"
-    if cursor:
-        return f"{warpcast_url}?limit={limit}&cursor={cursor}"
-    return f"{warpcast_url}?limit={limit}"
-
-
-def extractor(cast: Any) -> Any:
-    def _get_in(data_dict: Any, map_list: List[Any], default: Any = None) -> Any:
-        for key in map_list:
-            try:
-                data_dict = data_dict[key]
-            except KeyError:
-                return default
-        return data_dict
-
-    cast_getter = functools.partial(_get_in, cast)
-    tags = cast_getter(["tags"], [])
-    channel_tag = next((tag for tag in tags if tag["type"] == "channel"), None)
-
-    return {
-        "parent_url": cast_getter(["parentSource", "url"]),
-        "channel_id": channel_tag["id"] if channel_tag else None,
-        "channel_description": channel_tag["name"] if channel_tag else None,
-    }
-
-
-def not_fip2(cast: Any) -> Any:
-    return cast.get("parentSource") is not None
-
-
-def json_append(file_path: str, data: List[Dict[str, Any]]) -> None:
-    with open(file_path, "a") as f:
-        for item in data:
-            json.dump(item, f)
-            f.write("\n")
+# NOTE: run from the repo root with `python -m src.fip2_indexer [patience]`
+# the seen-set lives in ChannelIndex, so memory is O(channels) not O(casts),
+# and only never-seen (parent_url, channel_id) pairs are appended to `out`
 
 
 # because 2023/06/01 is ~roughly the start of fip2
-def pull_fip2s(t: int = utils.TimeConverter.ymd_to_unixms(2023, 6, 1)) -> None:
-    cursor = None
+async def pull_fip2s(
+    t: int = utils.TimeConverter.ymd_to_unixms(2023, 6, 1),
+    patience: int = 50,
+    n: int = 1000,
+    out: str = "data/fip2.ndjson",
+    cursor: Optional[str] = None,
+) -> channel.ChannelIndex:
+    # patience: stop after this many consecutive pages without a new channel
+    channels = channel.ChannelIndex(out)
+    stale_pages = 0
+
     while True:
-        url = url_maker(limit=1000, cursor=cursor)
-        data = make_warpcast_request(url)
-        casts = data["result"]["casts"]
-        c_t = casts[-1]["timestamp"]
-        if c_t < t:
+        url = indexer.UrlMaker.cast_warpcast(limit=n)
+        url = indexer.UrlMaker.cast_warpcast(limit=n, cursor=cursor) if cursor else url
+        result = await indexer.Fetcher.cast_warpcast(url)
+        casts = result["casts"]
+        if not casts:
             break
-        next_data = data.get("next")
-        cursor = next_data["cursor"] if next_data else None
-        casts = filter(not_fip2, casts)
-        fip2 = list(map(extractor, casts))
-        with open("data.ndjson", "a") as f:
-            for item in fip2:
-                json.dump(item, f)
-                f.write("\n")
 
-        if cursor is None:
+        new = channels.update(casts)
+        stale_pages = 0 if new else stale_pages + 1
+        c_t = casts[-1].timestamp
+        days_left = utils.TimeConverter.from_ms("days", c_t - t)
+        print(
+            f"fip2: {len(new)} new, {len(channels)} total; {days_left:.1f} days left;"
+            f" {stale_pages}/{patience} stale pages"
+        )
+
+        cursor = result["next_cursor"]
+        if c_t < t or cursor is None or stale_pages >= patience:
             break
-        print(utils.TimeConverter.unixms_to_ago("days", t - c_t))
+
+    return channels
 
 
-def unique_fip2s(df: pd.DataFrame) -> pd.DataFrame:
-    return df.drop_duplicates(subset=["parent_url", "channel_id"])
+def main() -> None:
+    patience = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    channels = asyncio.run(pull_fip2s(patience=patience))
+    print(f"fip2: done, {len(channels)} channels in {channels.file_path}")
 
 
-df = pd.read_json("data.ndjson", lines=True, dtype_backend="pyarrow")
-df = df[df["channel_id"].notnull()]
-df = unique_fip2s(df)
-df.to_json("data/fip2.ndjson", orient="records", lines=True)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+from typing import Literal, Optional, Union
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+# fids are dense small ints, so they are used directly as node ids; node i is fid i
+# and fids without edges simply have empty rows
+
+
+class Graph:
+    def __init__(
+        self,
+        indptr: npt.NDArray[np.int64],
+        indices: npt.NDArray[np.int64],
+        weights: npt.NDArray[np.float64],
+    ) -> None:
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self._transposed: Optional["Graph"] = None
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.indptr) - 1
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.indices)
+
+    @staticmethod
+    def from_edges(
+        src: npt.NDArray[np.int64],
+        dst: npt.NDArray[np.int64],
+        weights: Optional[npt.ArrayLike] = None,
+        n_nodes: Optional[int] = None,
+    ) -> "Graph":
+        # duplicate (src, dst) pairs are collapsed and their weights summed
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        w = np.ones(len(src)) if weights is None else np.asarray(weights, np.float64)
+        top = int(max(src.max(initial=-1), dst.max(initial=-1))) + 1
+        n = max(top, n_nodes or 0)
+
+        order = np.lexsort((dst, src))
+        src, dst, w = src[order], dst[order], w[order]
+        if len(src) > 0:
+            first = np.ones(len(src), dtype=bool)
+            first[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+            groups = np.cumsum(first) - 1
+            w = np.bincount(groups, weights=w).astype(np.float64, copy=False)
+            src, dst = src[first], dst[first]
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+        return Graph(indptr, dst, w)
+
+    @staticmethod
+    def from_frame(
+        df: pd.DataFrame,
+        src: str,
+        dst: str,
+        weight: Optional[str] = None,
+        n_nodes: Optional[int] = None,
+    ) -> "Graph":
+        df = df.dropna(subset=[src, dst])
+        weights = df[weight].to_numpy(np.float64) if weight else None
+        return Graph.from_edges(
+            df[src].to_numpy(np.int64), df[dst].to_numpy(np.int64), weights, n_nodes
+        )
+
+    @staticmethod
+    def load(file_path: str) -> "Graph":
+        data = np.load(file_path)
+        return Graph(data["indptr"], data["indices"], data["weights"])
+
+    def save(self, file_path: str) -> None:
+        np.savez(
+            file_path, indptr=self.indptr, indices=self.indices, weights=self.weights
+        )
+
+    def sources(self) -> npt.NDArray[np.int64]:
+        # edge i goes from sources()[i] to indices[i]
+        return np.repeat(np.arange(self.n_nodes), np.diff(self.indptr))
+
+    def transpose(self) -> "Graph":
+        if self._transposed is None:
+            self._transposed = Graph.from_edges(
+                self.indices, self.sources(), self.weights, self.n_nodes
+            )
+        return self._transposed
+
+    def out_degree(
+        self, weighted: bool = False
+    ) -> Union[npt.NDArray[np.int64], npt.NDArray[np.float64]]:
+        if not weighted:
+            return np.diff(self.indptr)
+        return np.bincount(self.sources(), self.weights, minlength=self.n_nodes)
+
+    def in_degree(
+        self, weighted: bool = False
+    ) -> Union[npt.NDArray[np.int64], npt.NDArray[np.float64]]:
+        w = self.weights if weighted else None
+        return np.bincount(self.indices, w, minlength=self.n_nodes)
+
+    def neighbors(self, fid: int) -> npt.NDArray[np.int64]:
+        if fid >= self.n_nodes:
+            return self.indices[:0]
+        return self.indices[self.indptr[fid] : self.indptr[fid + 1]]
+
+    def gather(self, nodes: npt.NDArray[np.int64]) -> npt.NDArray[np.int64]:
+        # concatenated neighbor lists of `nodes` without a python loop
+        starts, ends = self.indptr[nodes], self.indptr[nodes + 1]
+        lengths = ends - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return self.indices[offsets + np.arange(lengths.sum())]
+
+    def k_hop(
+        self,
+        fids: npt.ArrayLike,
+        k: int = 2,
+        direction: Literal["out", "in", "both"] = "out",
+    ) -> npt.NDArray[np.int64]:
+        # every fid reachable in <= k hops, seeds excluded
+        graphs = {"out": [self], "in": [self.transpose()]}
+        graphs["both"] = graphs["out"] + graphs["in"]
+
+        seeds = np.asarray(fids, dtype=np.int64)
+        seeds = seeds[seeds < self.n_nodes]
+        visited = np.zeros(self.n_nodes, dtype=bool)
+        visited[seeds] = True
+        frontier = seeds
+        for _ in range(k):
+            if len(frontier) == 0:
+                break
+            found = np.concatenate([g.gather(frontier) for g in graphs[direction]])
+            found = np.unique(found)
+            frontier = found[~visited[found]]
+            visited[frontier] = True
+
+        visited[seeds] = False
+        return np.flatnonzero(visited)
+
+    def pagerank(
+        self,
+        damping: float = 0.85,
+        max_iter: int = 100,
+        tol: float = 1e-6,
+        weighted: bool = True,
+    ) -> npt.NDArray[np.float64]:
+        # power iteration, dangling nodes spread their mass uniformly
+        n = self.n_nodes
+        if n == 0:
+            return np.zeros(0)
+
+        src = self.sources()
+        w = self.weights if weighted else np.ones(self.n_edges)
+        out_w = np.bincount(src, w, minlength=n)
+        dangling = out_w == 0
+        edge_share = w / np.where(out_w == 0, 1, out_w)[src]
+
+        rank = np.full(n, 1.0 / n)
+        for _ in range(max_iter):
+            spread = np.bincount(self.indices, rank[src] * edge_share, minlength=n)
+            leaked = rank[dangling].sum()
+            new = (1 - damping) / n + damping * (spread + leaked / n)
+            done = np.abs(new - rank).sum() < tol
+            rank = new
+            if done:
+                break
+        return rank
+
+
+# ======================================================================================
+# edge sources
+# ======================================================================================
+
+
+def inviter_graph(users: pd.DataFrame) -> Graph:
+    # inviter_fid -> fid from UserWarpcast records (queue or users.parquet)
+    # warpcast reports some inviters that registered after the invitee, skip those
+    df = users.dropna(subset=["inviter_fid"])
+    df = df[df["inviter_fid"] < df["fid"]]
+    return Graph.from_frame(df, "inviter_fid", "fid")
+
+
+def reaction_graph(reactions: pd.DataFrame, casts: pd.DataFrame) -> Graph:
+    # reactor_fid -> author_fid, weighted by number of reactions
+    df = pd.merge(
+        reactions[["reactor_fid", "target_hash"]],
+        casts[["hash", "author_fid"]],
+        left_on="target_hash",
+        right_on="hash",
+        how="inner",
+    )
+    return Graph.from_frame(df, "reactor_fid", "author_fid")
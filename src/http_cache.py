@@ -0,0 +1,160 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, Optional, Set
+
+# local response cache under Fetcher.fetch, for the endpoints that rarely change
+# (warpcast /user, searchcaster /profiles, ensdata). one sqlite file, bodies are
+# zlib compressed, keyed by url (the api key isn't part of it, there's only one)
+# - younger than the endpoint's ttl: served from here, no request at all
+# - older: revalidated with If-None-Match / If-Modified-Since when the server sent
+#   an ETag / Last-Modified, a 304 just renews the entry
+# only 200s are stored, errors always go to the network
+# the negative table remembers lookup keys (fids, addresses) the apis had nothing
+# for; they're skipped until the entry expires, and every further empty answer
+# doubles the wait, so a key that keeps coming back empty is asked less and less
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    stored_at REAL NOT NULL
+)
+"""
+
+NEGATIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS negative (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    failures INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+)
+"""
+
+
+class Entry:
+    def __init__(
+        self,
+        body: bytes,
+        etag: Optional[str],
+        last_modified: Optional[str],
+        stored_at: float,
+    ) -> None:
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at
+
+    def fresh(self, ttl: float) -> bool:
+        return time.time() - self.stored_at < ttl
+
+    def validators(self) -> Dict[str, str]:
+        # conditional request headers, empty when the server gave us nothing
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    def __init__(self, file_path: str = "data/http_cache.sqlite") -> None:
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(file_path, check_same_thread=False)
+        # wal + normal sync: a put is a page write, not an fsync
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        self.con.execute(SCHEMA)
+        self.con.execute(NEGATIVE_SCHEMA)
+
+    def __len__(self) -> int:
+        with self.lock:
+            (n,) = self.con.execute("SELECT COUNT(*) FROM responses").fetchone()
+        return int(n)
+
+    def get(self, url: str) -> Optional[Entry]:
+        with self.lock:
+            row = self.con.execute(
+                "SELECT body, etag, last_modified, stored_at FROM responses "
+                "WHERE url = ?",
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+        return Entry(zlib.decompress(row[0]), row[1], row[2], row[3])
+
+    def put(
+        self,
+        url: str,
+        body: bytes,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        with self.lock, self.con:
+            self.con.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (url, zlib.compress(body), etag, last_modified, time.time()),
+            )
+
+    def touch(self, url: str) -> None:
+        # after a 304, the stored body is good for another ttl
+        with self.lock, self.con:
+            self.con.execute(
+                "UPDATE responses SET stored_at = ? WHERE url = ?", (time.time(), url)
+            )
+
+    def prune(self, max_age: float) -> int:
+        cutoff = time.time() - max_age
+        with self.lock, self.con:
+            cursor = self.con.execute(
+                "DELETE FROM responses WHERE stored_at < ?", (cutoff,)
+            )
+        return cursor.rowcount
+
+    # ==================================================================================
+    # negative cache
+    # ==================================================================================
+
+    def negatives(self, kind: str) -> Set[str]:
+        # keys of this kind that are still skipped
+        with self.lock:
+            rows = self.con.execute(
+                "SELECT key FROM negative WHERE kind = ? AND expires_at > ?",
+                (kind, time.time()),
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def miss(self, kind: str, keys: Iterable[str], ttl: float, max_ttl: float) -> None:
+        # ttl after the first empty answer, then 2x, 4x, ... up to max_ttl
+        now = time.time()
+        with self.lock, self.con:
+            for key in keys:
+                row = self.con.execute(
+                    "SELECT failures FROM negative WHERE kind = ? AND key = ?",
+                    (kind, key),
+                ).fetchone()
+                failures = row[0] + 1 if row else 1
+                expires_at = now + min(ttl * 2 ** (failures - 1), max_ttl)
+                self.con.execute(
+                    "INSERT OR REPLACE INTO negative VALUES (?, ?, ?, ?)",
+                    (kind, key, failures, expires_at),
+                )
+
+    def found(self, kind: str, keys: Iterable[str]) -> None:
+        with self.lock, self.con:
+            self.con.executemany(
+                "DELETE FROM negative WHERE kind = ? AND key = ?",
+                [(kind, key) for key in keys],
+            )
+
+    def close(self) -> None:
+        with self.lock:
+            self.con.close()
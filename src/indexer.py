@@ -1,19 +1,35 @@
 import asyncio
+import email.utils
 import functools
+import io
 import json
+import logging
+import multiprocessing
 import os
 import time
-from datetime import datetime
-from typing import Any, List, Optional, Tuple, TypedDict, Union
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypedDict, Union
+from urllib.parse import urlparse
 
 import aiohttp
 import duckdb
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import pydantic
 import requests
-from dotenv import load_dotenv
 
-load_dotenv()
+import src.analytics as analytics
+import src.channel as channel
+import src.http_cache as http_cache
+import src.metrics as metrics
+import src.profiler as profiler
+import src.seen as seen
+import src.segments as segments
+import src.timeindex as timeindex
+import src.user_store as user_store
 
 
 class UserWarpcast(pydantic.BaseModel):
@@ -63,6 +79,7 @@ class CastWarpcast(pydantic.BaseModel):
     parent_hash: Optional[str]
     images: List[str]
     mentions: List[int]
+    parent_url: Optional[str] = None
     channel_id: Optional[str]
     channel_description: Optional[str]
 
@@ -97,19 +114,35 @@ class FetcherReactionWarpcastResponse(TypedDict):
 
 def execute_query(query: str) -> List[Any]:
     con = duckdb.connect(database=":memory:")
-    return list(filter(None, [x[0] for x in con.execute(query).fetchall()]))
+    t = time.perf_counter()
+    result = list(filter(None, [x[0] for x in con.execute(query).fetchall()]))
+    if profiler.enabled():
+        seconds = time.perf_counter() - t
+        profiler.record_query(
+            "duckdb", query, seconds, len(result), profiler.explain_duckdb(con)
+        )
+    return result
 
 
 def execute_query_df(query: str) -> pd.DataFrame:
     con = duckdb.connect(database=":memory:")
-    return con.execute(query).fetchdf()
+    t = time.perf_counter()
+    df = con.execute(query).fetchdf()
+    if profiler.enabled():
+        seconds = time.perf_counter() - t
+        profiler.record_query(
+            "duckdb", query, seconds, len(df), profiler.explain_duckdb(con)
+        )
+    return df
 
 
-def read_ndjson(file_path: str) -> pd.DataFrame:
+def read_ndjson(file_path: Union[str, List[str]]) -> pd.DataFrame:
     # wrapper exist because i want pyarrow by default
     # pyarrow because it preserves dtypes
+    # a queue path reads all its segments, a list just those (see src/segments.py)
+    data = segments.read(file_path)
     return pd.read_json(
-        file_path, lines=True, dtype_backend="pyarrow", convert_dates=False
+        io.BytesIO(data), lines=True, dtype_backend="pyarrow", convert_dates=False
     )
 
 
@@ -119,7 +152,16 @@ def read_parquet(file_path: str) -> pd.DataFrame:
     return pd.read_parquet(file_path, dtype_backend="pyarrow")
 
 
+@functools.lru_cache(maxsize=None)
+def load_env() -> None:
+    # .env is read on first use instead of at import, most commands never need it
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+
 def make_warpcast_request(url: str) -> Any:
+    load_env()
     api_key = os.getenv("PICTURE_WARPCAST_API_KEY")
     headers = {"Authorization": f"Bearer {api_key}"}
     response = requests.get(url, headers=headers)
@@ -128,7 +170,7 @@ def make_warpcast_request(url: str) -> Any:
 
 def fetch_highest_fid() -> int:
     try:
-        url = "https://api.warpcast.com/v2/recent-users?limit=1"
+        url = UrlMaker.recent_users(limit=1)
         response = make_warpcast_request(url)
         fid = response["result"]["users"][0]["fid"]
         assert isinstance(fid, int)
@@ -138,10 +180,32 @@ def fetch_highest_fid() -> int:
         return 10000
 
 
-def get_property(property: str, file_path: str) -> List[Any]:
+# queue properties are read with a fixed type, inference goes wrong on segments
+# where a column is all null (JSON typed, quoted strings)
+PROPERTY_TYPES = {"fid": "BIGINT", "timestamp": "BIGINT", "registered_at": "BIGINT"}
+
+
+def property_query(property: str, file_path: str) -> Optional[str]:
+    # None when there's nothing to read. queues are all their segments (see
+    # src/segments.py), a torn last line comes back as a null and is dropped
     file_format = file_path.split(".")[-1]
-    read_fn = "read_json_auto" if file_format in ("ndjson", "json") else "read_parquet"
-    query = f"SELECT {property} FROM {read_fn}('{file_path}')"
+    if file_format not in ("ndjson", "json"):
+        return f"SELECT {property} FROM read_parquet('{file_path}')"
+    files = segments.files(file_path)
+    if not files:
+        return None
+    listed = ", ".join(f"'{f}'" for f in files)
+    column = f"{{'{property}': '{PROPERTY_TYPES.get(property, 'VARCHAR')}'}}"
+    return (
+        f"SELECT {property} FROM read_json([{listed}], columns={column}, "
+        "format='newline_delimited', ignore_errors=true)"
+    )
+
+
+def get_property(property: str, file_path: str) -> List[Any]:
+    query = property_query(property, file_path)
+    if query is None:
+        return []
 
     try:
         return execute_query(query)
@@ -150,6 +214,21 @@ def get_property(property: str, file_path: str) -> List[Any]:
         return []
 
 
+async def fetch_property(
+    property: str, file_path: str, timeout: Optional[float] = None
+) -> List[Any]:
+    # get_property without blocking the event loop, on the shared async duckdb
+    query = property_query(property, file_path)
+    if query is None:
+        return []
+
+    try:
+        return await analytics.shared().column(query, timeout)
+    except (duckdb.Error, OSError) as e:
+        print(e)
+        return []
+
+
 get_fids = functools.partial(get_property, "fid")
 get_addresses = functools.partial(get_property, "address")
 get_hashes = functools.partial(get_property, "hash")
@@ -157,11 +236,13 @@ get_target_hashes = functools.partial(get_property, "target_hash")
 
 
 def json_append(file_path: str, data: List[Any]) -> None:
-    with open(file_path, "a") as f:
-        for item in data:
-            item = item.model_dump() if isinstance(item, pydantic.BaseModel) else item
-            json.dump(item, f)
-            f.write("\n")
+    items = [i.model_dump() if isinstance(i, pydantic.BaseModel) else i for i in data]
+    lines_append(file_path, "".join(json.dumps(i) + "\n" for i in items).encode())
+
+
+def lines_append(file_path: str, lines: bytes) -> None:
+    # ndjson already serialized (by ExtractPool), onto the queue's active segment
+    segments.append(file_path, lines)
 
 
 def get_fid_by_username(username: str) -> Optional[int]:
@@ -241,17 +322,42 @@ class UrlMaker:
         query_params = "&".join(f"{key}={value}" for key, value in params.items())
         return f"{base_url}{endpoint}?{query_params}"
 
+    # base urls are read at call time, so they can be pointed at a mock server
     warpcast_url = "https://api.warpcast.com/v2"
     searchcaster_url = "https://searchcaster.xyz/api"
+    ensdata_url = "https://ensdata.net"
+
+    @classmethod
+    def user_warpcast(cls, **params: Any) -> str:
+        return cls.make_url(cls.warpcast_url, "/user", **params)
+
+    @classmethod
+    def recent_users(cls, **params: Any) -> str:
+        return cls.make_url(cls.warpcast_url, "/recent-users", **params)
+
+    @classmethod
+    def user_searchcaster(cls, **params: Any) -> str:
+        return cls.make_url(cls.searchcaster_url, "/profiles", **params)
 
-    user_warpcast = functools.partial(make_url, warpcast_url, "/user")
-    user_searchcaster = functools.partial(make_url, searchcaster_url, "/profiles")
-    user_ensdata = functools.partial(lambda address: f"https://ensdata.net/{address}")
-    cast_warpcast = functools.partial(make_url, warpcast_url, "/recent-casts")
-    reaction_warpcast = functools.partial(make_url, warpcast_url, "/cast-reactions")
+    @classmethod
+    def user_ensdata(cls, address: str) -> str:
+        return f"{cls.ensdata_url}/{address}"
+
+    @classmethod
+    def cast_warpcast(cls, **params: Any) -> str:
+        return cls.make_url(cls.warpcast_url, "/recent-casts", **params)
+
+    @classmethod
+    def reaction_warpcast(cls, **params: Any) -> str:
+        return cls.make_url(cls.warpcast_url, "/cast-reactions", **params)
 
 
 class Extractor:
+    @staticmethod
+    def reject(kind: str, e: Exception) -> None:
+        metrics.registry.inc("crawl_records_rejected_total", kind=kind)
+        metrics.event("extract_failed", logging.WARNING, kind=kind, error=str(e))
+
     @staticmethod
     def get_in(data_dict: Any, map_list: List[Any], default: Any = None) -> Any:
         for key in map_list:
@@ -261,6 +367,21 @@ class Extractor:
                 return default
         return data_dict
 
+    @staticmethod
+    def user_payload(kind: str, data: Any) -> Any:
+        # the part of a user response the extractor takes, None when the api had
+        # nothing for the key (warpcast 404 errors, searchcaster's empty list)
+        if kind == "user_warpcast":
+            return data.get("result") if isinstance(data, dict) else None
+        if kind == "user_searchcaster":
+            return data[0] if isinstance(data, list) and data else None
+        return data
+
+    @staticmethod
+    def user(kind: str, data: Any) -> Any:
+        payload = Extractor.user_payload(kind, data)
+        return None if payload is None else getattr(Extractor, kind)(payload)
+
     @staticmethod
     def user_warpcast(user: Any) -> Optional[UserWarpcast]:
         user_getter = functools.partial(Extractor.get_in, user)
@@ -288,7 +409,7 @@ class Extractor:
                 onchain_collections=collections,
             )
         except Exception as e:
-            print(f"Failed to create UserWarpcast due to {str(e)}")
+            Extractor.reject("user_warpcast", e)
             return None
 
     @staticmethod
@@ -302,7 +423,7 @@ class Extractor:
                 registered_at=user_getter(["body", "registeredAt"]),
             )
         except Exception as e:
-            print(f"Failed to create UserSearchcaster due to {str(e)}")
+            Extractor.reject("user_searchcaster", e)
             return None
 
     @staticmethod
@@ -323,7 +444,7 @@ class Extractor:
         except Exception as e:
             import re
 
-            print(f"Failed to create UserEnsdata due to {str(e)}")
+            Extractor.reject("user_ensdata", e)
 
             address = re.search(r"0x[a-fA-F0-9]{40}", user.get("message"))
             if address is None:
@@ -347,6 +468,7 @@ class Extractor:
             author_fid=cast_getter(["author", "fid"]),
             parent_hash=cast_getter(["parentHash"]),
             images=[image["sourceUrl"] for image in images],
+            parent_url=cast_getter(["parentSource", "url"]),
             channel_id=channel_tag["id"] if channel_tag else None,
             channel_description=channel_tag["name"] if channel_tag else None,
             mentions=[mention["fid"] for mention in mentions],
@@ -365,51 +487,196 @@ class Extractor:
 
 
 class Fetcher:
-    api_key = os.getenv("PICTURE_WARPCAST_API_KEY")
+    api_key: Optional[str] = None  # see Fetcher.key()
+    max_retries = 3
+    backoff = 1.0  # seconds, doubled per attempt unless the server sends Retry-After
+    # response cache, see src/http_cache.py; HTTP_CACHE= (empty) turns it off
+    cache_file: Optional[str] = None  # None: HTTP_CACHE or data/http_cache.sqlite
+    cache: Optional[http_cache.HttpCache] = None
+    cache_ttl: Dict[str, float] = {  # seconds, endpoints not listed are never cached
+        "user_warpcast": 24 * 60 * 60,
+        "user_searchcaster": 24 * 60 * 60,
+        "user_ensdata": 7 * 24 * 60 * 60,
+    }
+    # keys the apis had nothing for are skipped for a day, then 2, 4, ... 30 days
+    negative_ttl = 24 * 60 * 60
+    negative_ttl_max = 30 * 24 * 60 * 60
+    inflight: Dict[str, "asyncio.Future[Tuple[int, bytes]]"] = {}  # url -> request
+
+    @staticmethod
+    def retry_delay(retry_after: Optional[str], attempt: int) -> float:
+        # Retry-After is seconds or an http date; the backoff when it's missing or
+        # neither
+        backoff: float = Fetcher.backoff * 2**attempt
+        if not retry_after:
+            return backoff
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+        try:
+            date = email.utils.parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return backoff
+        if date.tzinfo is None:  # -0000, utc by the rfc
+            date = date.replace(tzinfo=timezone.utc)
+        now = datetime.now(timezone.utc)
+        return max((date - now).total_seconds(), 0.0)
 
     @staticmethod
-    async def make_request(url: str, key: Optional[str] = None) -> Any:
-        headers = {"Authorization": f"Bearer {key}"} if key else None
+    def key() -> Optional[str]:
+        if Fetcher.api_key is None:
+            load_env()
+            Fetcher.api_key = os.getenv("PICTURE_WARPCAST_API_KEY")
+        return Fetcher.api_key
+
+    @staticmethod
+    def http_cache() -> Optional[http_cache.HttpCache]:
+        if Fetcher.cache is None:
+            if Fetcher.cache_file is None:
+                load_env()
+                default = "data/http_cache.sqlite"
+                Fetcher.cache_file = os.getenv("HTTP_CACHE", default)
+            if not Fetcher.cache_file:
+                return None
+            Fetcher.cache = http_cache.HttpCache(Fetcher.cache_file)
+        return Fetcher.cache
+
+    @staticmethod
+    def extracted(kind: str, n: int) -> None:
+        metrics.registry.inc("crawl_records_extracted_total", n, kind=kind)
+
+    @staticmethod
+    async def make_request(
+        url: str, key: Optional[str] = None, kind: Optional[str] = None
+    ) -> Any:
+        _, body = await Fetcher.fetch(url, key, kind)
+        return json.loads(body) if body else None
+
+    @staticmethod
+    async def fetch(
+        url: str, key: Optional[str] = None, kind: Optional[str] = None
+    ) -> Tuple[int, bytes]:
+        # status and raw body, ExtractPool parses it in a worker process. cache
+        # hits and 304s are 200s, the body is the one the api sent back then
+        # the same url requested again while the first request is still running
+        # (refresh all, the daemon's overlapping jobs) waits for that one
+        task = Fetcher.inflight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(Fetcher.request(url, key, kind))
+            Fetcher.inflight[url] = task
+            task.add_done_callback(lambda _: Fetcher.inflight.pop(url, None))
+        else:
+            host = urlparse(url).netloc
+            metrics.registry.inc("crawl_coalesced_total", host=host)
+        # shielded, a cancelled caller doesn't cancel the others' request
+        return await asyncio.shield(task)
+
+    @staticmethod
+    async def request(
+        url: str, key: Optional[str], kind: Optional[str]
+    ) -> Tuple[int, bytes]:
+        # kind picks the cache ttl, Fetcher.cache_ttl
+        host = urlparse(url).netloc
+        ttl = Fetcher.cache_ttl.get(kind) if kind else None
+        cache = Fetcher.http_cache() if ttl else None
+        entry = cache.get(url) if cache is not None else None
+        if entry is not None and ttl and entry.fresh(ttl):
+            metrics.registry.inc("crawl_cache_total", host=host, result="hit")
+            return 200, entry.body
+
+        headers = {"Authorization": f"Bearer {key}"} if key else {}
+        if entry is not None:
+            headers.update(entry.validators())
         async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                return await response.json()
+            for attempt in range(Fetcher.max_retries + 1):
+                t = time.perf_counter()
+                try:
+                    async with session.get(url, headers=headers) as response:
+                        body = await response.read()
+                except aiohttp.ClientError as e:
+                    metrics.registry.inc(
+                        "crawl_requests_total", host=host, status=type(e).__name__
+                    )
+                    raise
+                finally:
+                    elapsed = time.perf_counter() - t
+                    metrics.registry.observe(
+                        "crawl_request_seconds", elapsed, host=host
+                    )
+
+                status = response.status
+                metrics.registry.inc("crawl_requests_total", host=host, status=status)
+                metrics.registry.inc("crawl_response_bytes_total", len(body), host=host)
+                retryable = status == 429 or status >= 500
+                if retryable and attempt < Fetcher.max_retries:
+                    retry_after = response.headers.get("Retry-After")
+                    delay = Fetcher.retry_delay(retry_after, attempt)
+                    metrics.registry.inc(
+                        "crawl_retries_total", host=host, status=status
+                    )
+                    metrics.event(
+                        "retry", host=host, status=status, attempt=attempt, delay=delay
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+                if cache is not None and entry is not None and status == 304:
+                    cache.touch(url)
+                    metrics.registry.inc(
+                        "crawl_cache_total", host=host, result="revalidated"
+                    )
+                    return 200, entry.body
+                if cache is not None and status == 200:
+                    etag = response.headers.get("ETag")
+                    cache.put(url, body, etag, response.headers.get("Last-Modified"))
+                    metrics.registry.inc("crawl_cache_total", host=host, result="miss")
+                return status, body
+        raise AssertionError("unreachable")  # the last attempt always returns
 
     @staticmethod
     async def user_warpcast(urls: List[str]) -> FetcherUserResponse:
         async def _fetch(url: str) -> Optional[UserWarpcast]:
-            data = await Fetcher.make_request(url, Fetcher.api_key)
-            return Extractor.user_warpcast(data["result"])
+            data = await Fetcher.make_request(url, Fetcher.key(), "user_warpcast")
+            user: Optional[UserWarpcast] = Extractor.user("user_warpcast", data)
+            return user
 
         users = await asyncio.gather(*[_fetch(url) for url in urls])
         users = list(filter(lambda user: user is not None, users))
+        Fetcher.extracted("user_warpcast", len(users))
         return {"users": users}
 
     @staticmethod
     async def user_searchcaster(urls: List[str]) -> FetcherUserResponse:
         async def _fetch(url: str) -> Optional[UserSearchcaster]:
-            data = await Fetcher.make_request(url)
-            return Extractor.user_searchcaster(data[0])
+            data = await Fetcher.make_request(url, kind="user_searchcaster")
+            user: Optional[UserSearchcaster] = Extractor.user("user_searchcaster", data)
+            return user
 
         users = await asyncio.gather(*[_fetch(url) for url in urls])
         users = list(filter(lambda user: user is not None, users))
+        Fetcher.extracted("user_searchcaster", len(users))
         return {"users": users}
 
     @staticmethod
     async def user_ensdata(urls: List[str]) -> FetcherUserResponse:
         async def _fetch(url: str) -> Optional[UserEnsdata]:
-            data = await Fetcher.make_request(url)
-            return Extractor.user_ensdata(data)
+            data = await Fetcher.make_request(url, kind="user_ensdata")
+            user: Optional[UserEnsdata] = Extractor.user("user_ensdata", data)
+            return user
 
         users = await asyncio.gather(*[_fetch(url) for url in urls])
         users = list(filter(lambda user: user is not None, users))
+        Fetcher.extracted("user_ensdata", len(users))
         return {"users": users}
 
     @staticmethod
     async def cast_warpcast(url: str) -> FetcherCastWarpcastResponse:
-        data = await Fetcher.make_request(url, Fetcher.api_key)
+        data = await Fetcher.make_request(url, Fetcher.key())
         next_data = data.get("next")
+        casts = list(map(Extractor.cast_warpcast, data["result"]["casts"]))
+        Fetcher.extracted("cast_warpcast", len(casts))
         return {
-            "casts": list(map(Extractor.cast_warpcast, data["result"]["casts"])),
+            "casts": casts,
             "next_cursor": next_data["cursor"] if next_data else None,
         }
 
@@ -418,9 +685,10 @@ class Fetcher:
         urls: List[str],
     ) -> List[FetcherReactionWarpcastResponse]:
         async def _fetch(url: str) -> Optional[FetcherReactionWarpcastResponse]:
-            data = await Fetcher.make_request(url, Fetcher.api_key)
+            data = await Fetcher.make_request(url, Fetcher.key())
             next_data = data.get("next")
             reactions = data["result"]["reactions"]
+            Fetcher.extracted("reaction_warpcast", len(reactions))
             return {
                 "reactions": list(map(Extractor.reaction_warpcast, reactions)),
                 "next_cursor": next_data["cursor"] if next_data else None,
@@ -431,6 +699,110 @@ class Fetcher:
         return list(filter(lambda reaction: reaction is not None, reactions))
 
 
+class ExtractPool:
+    # opt-in, EXTRACT_WORKERS=4 (or ExtractPool.workers = 4): during backfills the
+    # json parsing, pydantic models and ndjson serialization of whole pages run in
+    # worker processes, the event loop only moves bytes and keeps fetching.
+    # workers get raw response bodies and hand back the queue lines ready to append
+    # plus the few fields the crawl needs (cursors, timestamps, channel pairs);
+    # the queues are ndjson, so lines are cheaper to ship back than arrow batches
+    workers: Optional[int] = None  # None: read EXTRACT_WORKERS, 0 = off
+    executor: Optional[ProcessPoolExecutor] = None
+
+    @staticmethod
+    def enabled() -> bool:
+        if ExtractPool.workers is None:
+            load_env()
+            ExtractPool.workers = int(os.getenv("EXTRACT_WORKERS", "0"))
+        return ExtractPool.workers > 0
+
+    @staticmethod
+    def start() -> ProcessPoolExecutor:
+        if ExtractPool.executor is None:
+            # spawn, forking a process with running threads isn't safe
+            context = multiprocessing.get_context("spawn")
+            ExtractPool.executor = ProcessPoolExecutor(
+                ExtractPool.workers, mp_context=context
+            )
+        return ExtractPool.executor
+
+    @staticmethod
+    async def run(fn: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(ExtractPool.start(), fn, *args)
+
+    @staticmethod
+    def shutdown() -> None:
+        if ExtractPool.executor is not None:
+            ExtractPool.executor.shutdown()
+            ExtractPool.executor = None
+
+    # worker side, everything below runs in the pool processes
+
+    @staticmethod
+    def lines(items: List[Any]) -> bytes:
+        # byte for byte what json_append writes
+        return "".join(json.dumps(item.model_dump()) + "\n" for item in items).encode()
+
+    @staticmethod
+    def users(
+        kind: str, bodies: List[bytes]
+    ) -> Tuple[bytes, List[str], int, List[int]]:
+        # lines, keys that came back with a user, rejected by the extractor and
+        # the bodies (indexes) the api had nothing in
+        payloads = [
+            Extractor.user_payload(kind, json.loads(b or "null")) for b in bodies
+        ]
+        empty = [i for i, payload in enumerate(payloads) if payload is None]
+        payloads = [payload for payload in payloads if payload is not None]
+        users = [getattr(Extractor, kind)(payload) for payload in payloads]
+        valid = [user for user in users if user is not None]
+        found = [BatchFetcher.user_key(kind, user) for user in valid]
+        return ExtractPool.lines(valid), found, len(users) - len(valid), empty
+
+    @staticmethod
+    def cast_page(body: bytes) -> Dict[str, Any]:
+        data = json.loads(body)
+        next_data = data.get("next")
+        casts = list(map(Extractor.cast_warpcast, data["result"]["casts"]))
+        channels = {  # ChannelIndex.update takes these as dicts
+            cast.parent_url: {
+                "parent_url": cast.parent_url,
+                "channel_id": cast.channel_id,
+                "channel_description": cast.channel_description,
+            }
+            for cast in casts
+            if cast.parent_url and cast.channel_id
+        }
+        return {
+            "lines": ExtractPool.lines(casts),
+            "keys": [cast.hash for cast in casts],
+            "n": len(casts),
+            "first_t": casts[0].timestamp if casts else None,
+            "last_t": casts[-1].timestamp if casts else None,
+            "next_cursor": next_data["cursor"] if next_data else None,
+            "channels": list(channels.values()),
+        }
+
+    @staticmethod
+    def reaction_pages(bodies: List[bytes]) -> Dict[str, Any]:
+        lines: List[bytes] = []
+        keys: List[str] = []
+        n = 0
+        cursors: List[Tuple[str, str]] = []  # (cast hash, next cursor)
+        for body in bodies:
+            data = json.loads(body)
+            next_data = data.get("next")
+            raw = data["result"]["reactions"]
+            reactions = list(map(Extractor.reaction_warpcast, raw))
+            lines.append(ExtractPool.lines(reactions))
+            keys.extend(reaction.hash for reaction in reactions)
+            n += len(reactions)
+            if next_data and next_data["cursor"] and raw:
+                cursors.append((raw[0]["castHash"], next_data["cursor"]))
+        return {"lines": b"".join(lines), "keys": keys, "n": n, "cursors": cursors}
+
+
 class QueueProducer:
     @staticmethod
     def user_warpcast(
@@ -458,99 +830,308 @@ class QueueProducer:
         searchcaster_queue_file: str = "queue/user_searchcaster.ndjson",
         ensdata_queue_file: str = "queue/user_ensdata.ndjson",
     ) -> List[str]:
-        #  ensdata.net doesn't return these addresses
-        forbidden_addresses = [
-            "0x947caf5ada865ace0c8de0ffd55de0c02e5f6b54",
-            "0xaee33d473c68f9b4946020d79021416ff0587005",
-            "0x2d3fe453caaa7cd2c5475a50b06630dd75f67377",
-            "0xc6735e557cb2c5850708cf00a2dec05da2aa6490",
-        ]
-
+        # addresses ensdata.net never returns anything for are skipped by the
+        # negative cache in BatchFetcher.users, not here
         s_addrs = set(get_addresses(searchcaster_queue_file))
         e_addrs = set(get_addresses(ensdata_queue_file))
-        e_addrs = set.union(e_addrs, set(forbidden_addresses))
         return list(set.difference(s_addrs, e_addrs))
 
+    # async versions for the crawler, the scans run on analytics.shared() and the
+    # highest fid request runs in a thread meanwhile
+
+    @staticmethod
+    async def user_warpcast_async(
+        queued_file: str = "queue/user_warpcast.ndjson",
+        data_file: str = "data/users.parquet",
+        timeout: Optional[float] = None,
+    ) -> List[int]:
+        highest, queued_fids, stored_fids = await asyncio.gather(
+            asyncio.to_thread(fetch_highest_fid),
+            fetch_property("fid", queued_file, timeout),
+            fetch_property("fid", data_file, timeout),
+        )
+        local_fids = set(queued_fids) | set(stored_fids)
+        return list(set(range(1, highest + 1)) - local_fids)
+
+    @staticmethod
+    async def user_searchcaster_async(
+        warpcast_queue_file: str = "queue/user_warpcast.ndjson",
+        searchcaster_queue_file: str = "queue/user_searchcaster.ndjson",
+        timeout: Optional[float] = None,
+    ) -> List[int]:
+        w_fids, s_fids = await asyncio.gather(
+            fetch_property("fid", warpcast_queue_file, timeout),
+            fetch_property("fid", searchcaster_queue_file, timeout),
+        )
+        return list(set(w_fids) - set(s_fids))
+
+    @staticmethod
+    async def user_ensdata_async(
+        searchcaster_queue_file: str = "queue/user_searchcaster.ndjson",
+        ensdata_queue_file: str = "queue/user_ensdata.ndjson",
+        timeout: Optional[float] = None,
+    ) -> List[str]:
+        s_addrs, e_addrs = await asyncio.gather(
+            fetch_property("address", searchcaster_queue_file, timeout),
+            fetch_property("address", ensdata_queue_file, timeout),
+        )
+        return list(set(s_addrs) - set(e_addrs))
+
     @staticmethod
     def cast_warpcast(filepath: str = "data/casts.parquet") -> int:
+        # high-watermark from the time index sidecar, no scan
         try:
-            query = f"SELECT MAX(timestamp) FROM read_parquet('{filepath}')"
-            time: List[int] = execute_query(query)  # a list of one element
-            return time[0] if time else 0
+            return timeindex.high_watermark(filepath)
         except Exception:
             return 0
 
     @staticmethod
     def reaction_warpcast(
-        t_from: int = TimeConverter.ago_to_unixms(factor="days", units=1),
-        t_until: int = TimeConverter.ms_now(),
+        t_from: Optional[int] = None,  # default: a day ago
+        t_until: Optional[int] = None,  # default: now
         data_file: str = "data/casts.parquet",
     ) -> List[Tuple[str, Optional[str]]]:
-        query = f"SELECT hash FROM read_parquet('{data_file}') "
-        query += f"WHERE timestamp >= {t_from} AND timestamp < {t_until}"
-        hashes = set(execute_query(query))
+        # the defaults used to be evaluated once, at import, so a long running
+        # process kept asking for the same day
+        t_from = t_from or TimeConverter.ago_to_unixms(factor="days", units=1)
+        t_until = t_until or TimeConverter.ms_now()
+        if not os.path.exists(data_file):  # no casts crawled yet
+            return []
+        # only the row groups overlapping the window are read
+        df = timeindex.read_range(data_file, t_from, t_until, columns=["hash"])
+        hashes = set(df["hash"].dropna())
         return list(map(lambda hash: (hash, None), hashes))
 
 
 class BatchFetcher:
+    pause = 0.5  # seconds between batches, reactions wait twice as long
+    # cast and reaction hashes already queued, see src/seen.py; SEEN_FILE= (empty)
+    # turns it off and every record is appended, Merger.cast dedupes either way
+    seen_file: Optional[str] = None  # None: SEEN_FILE or data/seen.sqlite
+    seen_keys: Optional[seen.SeenSet] = None
+
+    @staticmethod
+    def seen_set() -> Optional[seen.SeenSet]:
+        if BatchFetcher.seen_keys is None:
+            if BatchFetcher.seen_file is None:
+                load_env()
+                default = "data/seen.sqlite"
+                BatchFetcher.seen_file = os.getenv("SEEN_FILE", default)
+            if not BatchFetcher.seen_file:
+                return None
+            BatchFetcher.seen_keys = seen.SeenSet(BatchFetcher.seen_file)
+        return BatchFetcher.seen_keys
+
+    @staticmethod
+    def close_seen_set() -> None:
+        # saves the bloom filters, the next run doesn't have to rebuild them
+        if BatchFetcher.seen_keys is not None:
+            BatchFetcher.seen_keys.close()
+            BatchFetcher.seen_keys = None
+
+    @staticmethod
+    def append(
+        kind: str,
+        out: str,
+        keys: List[str],
+        items: Optional[List[Any]] = None,
+        lines: Optional[bytes] = None,
+    ) -> Tuple[int, int]:
+        # items (models) or lines (from ExtractPool, one per key) to the queue,
+        # minus the keys that were queued before; returns (written, duplicates)
+        seen_set = BatchFetcher.seen_set()
+        if seen_set is None:
+            if lines is None:
+                json_append(out, items or [])
+            else:
+                lines_append(out, lines)
+            return len(keys), 0
+
+        fresh = seen_set.unseen(kind, keys)
+        if lines is None:
+            json_append(out, [(items or [])[i] for i in fresh])
+        elif len(fresh) == len(keys):
+            lines_append(out, lines)
+        else:
+            split = lines.splitlines(keepends=True)
+            lines_append(out, b"".join(split[i] for i in fresh))
+        seen_set.add(kind, [keys[i] for i in fresh])
+
+        duplicates = len(keys) - len(fresh)
+        metrics.registry.inc("crawl_dedupe_total", len(fresh), kind=kind, result="new")
+        metrics.registry.inc(
+            "crawl_dedupe_total", duplicates, kind=kind, result="duplicate"
+        )
+        return len(fresh), duplicates
+
     @staticmethod
+    def dedupe_stats(kind: str) -> Dict[str, Any]:
+        # for the end of crawl event, counted since the seen-set was opened
+        seen_set = BatchFetcher.seen_set()
+        if seen_set is None:
+            return {}
+        stat = seen_set.stat(kind)
+        checked = stat["new"] + stat["duplicate"]
+        rate = stat["duplicate"] / checked if checked else 0.0
+        return {"duplicates": stat["duplicate"], "dup_rate": round(rate, 4)}
+
+    @staticmethod
+    def user_url(kind: str, key: Any) -> str:
+        if kind == "user_ensdata":
+            return UrlMaker.user_ensdata(key)
+        url: str = getattr(UrlMaker, kind)(fid=key)
+        return url
+
+    @staticmethod
+    def user_key(kind: str, user: Any) -> str:
+        # negative cache key, addresses are compared lowercased
+        key = user.address if kind == "user_ensdata" else user.fid
+        return str(key).lower()
+
+    @staticmethod
+    async def users(kind: str, keys: List[Any], out: str) -> int:
+        # one request per key: neither searchcaster /profiles nor ensdata take
+        # several fids / addresses per request. duplicate keys are fetched once
+        # and keys in the negative cache are skipped
+        cache = Fetcher.http_cache()
+        skip = cache.negatives(kind) if cache is not None else set()
+        unique = list(dict.fromkeys(keys))
+        keys = [key for key in unique if str(key).lower() not in skip]
+        skipped = len(unique) - len(keys)
+        metrics.registry.inc("crawl_negative_skipped_total", skipped, kind=kind)
+        urls = [BatchFetcher.user_url(kind, key) for key in keys]
+
+        token = Fetcher.key() if kind == "user_warpcast" else None
+        responses = await asyncio.gather(*[Fetcher.fetch(u, token, kind) for u in urls])
+        bodies = [body for _, body in responses]
+        if ExtractPool.enabled():
+            extract = ExtractPool.run(ExtractPool.users, kind, bodies)
+            lines, found, rejected, empty = await extract
+            if rejected:  # Extractor.reject counted them in the worker
+                metrics.registry.inc(
+                    "crawl_records_rejected_total", rejected, kind=kind
+                )
+        else:
+            lines, found, _, empty = ExtractPool.users(kind, bodies)
+        lines_append(out, lines)
+        Fetcher.extracted(kind, len(found))
+
+        if cache is not None:
+            # only what the api said it doesn't have: a 404 or a 200 without a
+            # user. 429s and 5xx the retries didn't get past are asked again
+            nothing = set(empty)
+            missing = {
+                str(key).lower()
+                for i, (key, (status, _)) in enumerate(zip(keys, responses))
+                if status == 404 or (status == 200 and i in nothing)
+            } - set(found)
+            cache.miss(kind, missing, Fetcher.negative_ttl, Fetcher.negative_ttl_max)
+            cache.found(kind, found)
+        return len(found)
+
+    @staticmethod
+    @profiler.profile
     async def user_warpcast(
         fids: List[int], n: int = 100, out: str = "queue/user_warpcast.ndjson"
     ) -> None:
+        progress = metrics.Progress("user_warpcast", total=len(fids))
         for i in range(0, len(fids), n):
             batch = fids[i : i + n]
-            urls = [UrlMaker.user_warpcast(fid=fid) for fid in batch]
-            print(f"user_warpcast: {len(fids) - i - n} left; fetching: {n}")
-            data = await Fetcher.user_warpcast(urls)
-            json_append(out, data["users"])
-            await asyncio.sleep(0.5)
+            written = await BatchFetcher.users("user_warpcast", batch, out)
+            progress.advance(len(batch), written=written)
+            await asyncio.sleep(BatchFetcher.pause)
+        progress.finish()
 
     @staticmethod
+    @profiler.profile
     async def user_searchcaster(
         fids: List[int], n: int = 125, out: str = "queue/user_searchcaster.ndjson"
     ) -> None:
+        progress = metrics.Progress("user_searchcaster", total=len(fids))
         for i in range(0, len(fids), n):
             batch = fids[i : i + n]
-            urls = [UrlMaker.user_searchcaster(fid=fid) for fid in batch]
-            print(f"user_searchcaster: {len(fids) - i - n} left; fetching: {n}")
-            data = await Fetcher.user_searchcaster(urls)
-            json_append(out, data["users"])
-            await asyncio.sleep(0.5)
+            written = await BatchFetcher.users("user_searchcaster", batch, out)
+            progress.advance(len(batch), written=written)
+            await asyncio.sleep(BatchFetcher.pause)
+        progress.finish()
 
     @staticmethod
+    @profiler.profile
     async def user_ensdata(
         addrs: List[str], n: int = 50, out: str = "queue/user_ensdata.ndjson"
     ) -> None:
+        progress = metrics.Progress("user_ensdata", total=len(addrs))
         for i in range(0, len(addrs), n):
             batch = addrs[i : i + n]
-            urls = [UrlMaker.user_ensdata(addr) for addr in batch]
-            print(f"user_ensdata: {len(addrs) - i - n} left; fetching: {n}")
-            data = await Fetcher.user_ensdata(urls)
-            json_append(out, data["users"])
-            await asyncio.sleep(0.5)
+            written = await BatchFetcher.users("user_ensdata", batch, out)
+            progress.advance(len(batch), written=written)
+            await asyncio.sleep(BatchFetcher.pause)
+        progress.finish()
+
+    @staticmethod
+    async def cast_page(url: str, out: str) -> Dict[str, Any]:
+        # appends the page to out, returns what the crawl loop needs from it
+        if ExtractPool.enabled():
+            _, body = await Fetcher.fetch(url, Fetcher.key())
+            page: Dict[str, Any] = await ExtractPool.run(ExtractPool.cast_page, body)
+            Fetcher.extracted("cast_warpcast", page["n"])
+            page["written"], page["duplicates"] = BatchFetcher.append(
+                "cast_warpcast", out, page["keys"], lines=page["lines"]
+            )
+            return page
+
+        result = await Fetcher.cast_warpcast(url)
+        casts = result["casts"]
+        keys = [cast.hash for cast in casts]
+        written, duplicates = BatchFetcher.append("cast_warpcast", out, keys, casts)
+        return {
+            "n": len(casts),
+            "written": written,
+            "duplicates": duplicates,
+            "first_t": casts[0].timestamp if casts else None,
+            "last_t": casts[-1].timestamp if casts else None,
+            "next_cursor": result["next_cursor"],
+            "channels": casts,
+        }
 
     @staticmethod
+    @profiler.profile
     async def cast_warpcast(
         cursor: Optional[str] = None,
         n: int = 1000,
         out: str = "queue/cast_warpcast.ndjson",
+        channels: Optional[channel.ChannelIndex] = None,
     ) -> None:
         local_t = QueueProducer.cast_warpcast()
         new_t = local_t + 1
+        # progress is measured in days of history walked back towards local_t,
+        # the total is only known once the first page says where we start
+        progress = metrics.Progress("cast_warpcast")
+        first_t: Optional[int] = None
         while new_t > local_t:
             url = UrlMaker.cast_warpcast(limit=n)
             url = UrlMaker.cast_warpcast(limit=n, cursor=cursor) if cursor else url
-            result = await Fetcher.cast_warpcast(url)
-            cursor = result["next_cursor"]
-            new_t = result["casts"][-1].timestamp
-            days_left = TimeConverter.from_ms(factor="days", ms=new_t - local_t)
-            print(f"cast_warpcast: fetching {url}; {days_left} days left")
-            json_append(out, result["casts"])
-            await asyncio.sleep(0.5)
+            page = await BatchFetcher.cast_page(url, out)
+            cursor = page["next_cursor"]
+            if page["n"] == 0:  # no casts at all, or past the oldest one
+                break
+            if first_t is None:
+                first_t = page["first_t"]
+                progress.total = TimeConverter.from_ms("days", first_t - local_t)
+            new_t = page["last_t"]
+            if channels is not None:
+                channels.update(page["channels"])
+            walked = TimeConverter.from_ms("days", first_t - new_t)
+            progress.update(
+                walked, written=page["written"], duplicates=page["duplicates"]
+            )
+            await asyncio.sleep(BatchFetcher.pause)
             if cursor is None:
                 break
+        progress.finish(**BatchFetcher.dedupe_stats("cast_warpcast"))
 
     @staticmethod
+    @profiler.profile
     async def reaction_warpcast(
         hashes: List[Tuple[str, Optional[str]]],  # tuple of cast hash and cursors
         n: int = 1000,
@@ -561,43 +1142,290 @@ class BatchFetcher:
                 return UrlMaker.reaction_warpcast(castHash=hash)
             return UrlMaker.reaction_warpcast(castHash=hash, cursor=cursor)
 
+        # counted in pages, every next cursor found adds one to the total
+        progress = metrics.Progress("reaction_warpcast", total=len(hashes))
         while hashes:
-            batch = hashes[:n]
+            batch, hashes = hashes[:n], hashes[n:]
             urls = [_make_url(item[0], item[1]) for item in batch]
-            print(f"reaction_warpcast: {len(hashes) - n} left; fetching: {n}")
-            data = await Fetcher.reaction_warpcast(urls)
-            for cast in data:
-                json_append(out, cast["reactions"])
-                if cast["next_cursor"]:
-                    hashes.append((cast["target_hash"], cast["next_cursor"]))
-            await asyncio.sleep(1)
+            if ExtractPool.enabled():
+                key = Fetcher.key()
+                responses = await asyncio.gather(*[Fetcher.fetch(u, key) for u in urls])
+                bodies = [body for _, body in responses]
+                pages = await ExtractPool.run(ExtractPool.reaction_pages, bodies)
+                Fetcher.extracted("reaction_warpcast", pages["n"])
+                keys, cursors = pages["keys"], pages["cursors"]
+                written, duplicates = BatchFetcher.append(
+                    "reaction_warpcast", out, keys, lines=pages["lines"]
+                )
+            else:
+                data = await Fetcher.reaction_warpcast(urls)
+                reactions = [r for cast in data for r in cast["reactions"]]
+                keys = [reaction.hash for reaction in reactions]
+                written, duplicates = BatchFetcher.append(
+                    "reaction_warpcast", out, keys, reactions
+                )
+                cursors = [
+                    (cast["target_hash"], cast["next_cursor"])
+                    for cast in data
+                    if cast["next_cursor"]
+                ]
+            hashes.extend(cursors)
+            progress.total = (progress.total or 0) + len(cursors)
+            progress.advance(len(batch), written=written, duplicates=duplicates)
+            await asyncio.sleep(BatchFetcher.pause * 2)
+        progress.finish(**BatchFetcher.dedupe_stats("reaction_warpcast"))
 
 
 class Merger:
+    # user_parquet's duckdb; None: MERGE_MEMORY_LIMIT, or duckdb's default (80% of
+    # the ram), past it the join and the dedupe spill to temp_directory
+    memory_limit: Optional[str] = None
+    temp_directory: Optional[str] = None  # None: duckdb_tmp next to the output
+    fid_batch = 250_000  # fids per user_parquet join
+    row_group_size = 65536
+    duckdb_types = {
+        "int": "BIGINT",
+        "bool": "BOOLEAN",
+        "str": "VARCHAR",
+        "dict": "VARCHAR",
+        "list": "VARCHAR[]",
+    }
+
+    @staticmethod
+    def record(kind: str, stored: int, queued: int, merged: int, t: float) -> None:
+        # duplicates = queued rows that were already stored (or queued twice)
+        seconds = time.perf_counter() - t
+        metrics.registry.observe("crawl_merge_seconds", seconds, kind=kind)
+        metrics.registry.set("crawl_stored_records", merged, kind=kind)
+        metrics.registry.inc(
+            "crawl_merge_duplicates_total", stored + queued - merged, kind=kind
+        )
+        metrics.event(
+            "merged",
+            kind=kind,
+            stored=stored,
+            queued=queued,
+            merged=merged,
+            seconds=round(seconds, 3),
+        )
+
+    @staticmethod
+    def stage_queue(source: str, queued_file: str, stage_file: str) -> bool:
+        # the queue segments to one parquet file with seq, the position of every
+        # record across segments (in order, then lines), so "the latest queued
+        # record wins" is an explicit order rather than the order duckdb happens to
+        # scan ndjson in. a segment at a time; False when nothing is queued
+        files = segments.files(queued_file)
+        if not files:
+            return False
+        schema = user_store.schema(source).append(pa.field("seq", pa.int64()))
+        seq = 0
+        with pq.ParquetWriter(stage_file, schema) as writer:
+            for file_path in files:
+                table = user_store.read_queue([file_path], source)
+                n = table.num_rows
+                table = table.append_column(
+                    "seq", pa.array(range(seq, seq + n), pa.int64())
+                )
+                writer.write_table(table, row_group_size=Merger.row_group_size)
+                seq += n
+        return True
+
     @staticmethod
-    def user(
+    def user_source_query(
+        source: str, stage_file: Optional[str], user_file: str, fids: Tuple[int, int]
+    ) -> str:
+        # the latest record of every fid in [lo, hi] for one source: stored users
+        # rank below queued records, queued ones by seq (see stage_queue). the fid
+        # range is pushed into both scans, parquet row groups outside it are
+        # skipped on their statistics
+        columns = {
+            name: Merger.duckdb_types[kind]
+            for name, (s, kind) in user_store.COLUMNS.items()
+            if s == source
+        }
+        names = ", ".join(columns)
+        cast = ", ".join(f"CAST({n} AS {t}) AS {n}" for n, t in columns.items())
+        where = f"fid BETWEEN {fids[0]} AND {fids[1]}"
+        parts = []
+        if os.path.exists(user_file):
+            parts.append(
+                f"SELECT fid, {cast}, 0 AS rank, 0 AS line "
+                f"FROM read_parquet('{user_file}') WHERE {where}"
+            )
+        if stage_file is not None:
+            parts.append(
+                f"SELECT fid, {cast}, 1 AS rank, seq AS line "
+                f"FROM read_parquet('{stage_file}') WHERE {where}"
+            )
+        if not parts:
+            return f"SELECT NULL::BIGINT AS fid, {names} WHERE false"
+        return (
+            f"SELECT fid, {names} FROM ({' UNION ALL '.join(parts)}) QUALIFY"
+            " row_number() OVER (PARTITION BY fid ORDER BY rank DESC, line DESC) = 1"
+        )
+
+    @staticmethod
+    def max_fid(con: duckdb.DuckDBPyConnection, files: List[str]) -> int:
+        # parquet max from the footer statistics, queues scan only the fid
+        highest = 0
+        for file_path in files:
+            query = property_query("fid", file_path)
+            if query is None or not (
+                os.path.exists(file_path) or segments.files(file_path)
+            ):
+                continue
+            row = con.execute(f"SELECT MAX(fid) FROM ({query})").fetchone()
+            highest = max(highest, (row[0] if row else None) or 0)
+        return highest
+
+    @staticmethod
+    def count_new_fids(
+        con: duckdb.DuckDBPyConnection,
+        table: pa.Table,
+        user_file: str,
+        fids: Tuple[int, int],
+    ) -> int:
+        # the fids of a merged batch that user_file doesn't have yet
+        if not os.path.exists(user_file):
+            rows: int = table.num_rows
+            return rows
+        con.register("merged_batch", table)
+        row = con.execute(
+            "SELECT count(*) FROM merged_batch WHERE fid NOT IN "
+            f"(SELECT fid FROM read_parquet('{user_file}') "
+            f"WHERE fid BETWEEN {fids[0]} AND {fids[1]})"
+        ).fetchone()
+        con.unregister("merged_batch")
+        new: int = row[0] if row else 0
+        return new
+
+    @staticmethod
+    @profiler.profile
+    def user_parquet(
         warpcast_file: str = "queue/user_warpcast.ndjson",
         searchcaster_file: str = "queue/user_searchcaster.ndjson",
         user_file: str = "data/users.parquet",
-    ) -> pd.DataFrame:
-        def make_queued_df(warpcast_file: str, searchcaster_file: str) -> pd.DataFrame:
-            w_df = read_ndjson(warpcast_file)
-            s_df = read_ndjson(searchcaster_file)
-            w_df = w_df.drop_duplicates(subset=["fid"])
-            s_df = s_df.drop_duplicates(subset=["fid"])
-            return pd.merge(w_df, s_df, on="fid", how="inner")
-
+        out_file: Optional[str] = None,  # default: user_file
+        store: Optional[user_store.UserStore] = None,
+    ) -> int:
+        # the user merge in duckdb, straight to parquet: queued records win over
+        # stored users and a fid needs both sources, without the frames ever
+        # existing in python. fid ranges of fid_batch are joined one at a time and
+        # appended to the output, so memory follows the batch, not the number of
+        # users; a store (the daemon's) gets every batch upserted as it's written.
+        # returns the number of users written
+        t = time.perf_counter()
+        out_file = out_file or user_file
+        if Merger.memory_limit is None:
+            load_env()
+            Merger.memory_limit = os.getenv("MERGE_MEMORY_LIMIT", "")
+        con = duckdb.connect(database=":memory:")
+        temp_directory = Merger.temp_directory or os.path.join(
+            os.path.dirname(out_file) or ".", "duckdb_tmp"
+        )
+        con.execute(f"SET temp_directory = '{temp_directory}'")
+        if Merger.memory_limit:
+            con.execute(f"SET memory_limit = '{Merger.memory_limit}'")
+
+        stored = 0
+        if os.path.exists(user_file):
+            stored = pq.ParquetFile(user_file).metadata.num_rows
+        highest = Merger.max_fid(con, [warpcast_file, searchcaster_file, user_file])
+        names = ", ".join(user_store.COLUMNS)
+        schema = user_store.schema()
+
+        os.makedirs(temp_directory, exist_ok=True)
+        staged: Dict[str, Optional[str]] = {}
+        for source, queued_file in [
+            ("user_warpcast", warpcast_file),
+            ("user_searchcaster", searchcaster_file),
+        ]:
+            stage_file = os.path.join(temp_directory, f"{source}.{os.getpid()}.parquet")
+            queued = Merger.stage_queue(source, queued_file, stage_file)
+            staged[source] = stage_file if queued else None
+
+        os.makedirs(os.path.dirname(out_file) or ".", exist_ok=True)
+        merged = 0
+        new = 0  # fids that weren't in user_file
         try:
-            df = read_parquet(user_file)
-        except Exception:
-            df = pd.DataFrame()
+            with pq.ParquetWriter(f"{out_file}.tmp", schema) as writer:
+                for lo in range(1, highest + 1, Merger.fid_batch):
+                    fids = (lo, lo + Merger.fid_batch - 1)
+                    w, s = [
+                        Merger.user_source_query(source, stage_file, user_file, fids)
+                        for source, stage_file in staged.items()
+                    ]
+                    query = (
+                        f"SELECT fid, {names} FROM ({w}) JOIN ({s}) USING (fid) "
+                        "ORDER BY fid"
+                    )
+                    q = time.perf_counter()
+                    table = con.execute(query).fetch_arrow_table()
+                    if profiler.enabled():
+                        explain = profiler.explain_duckdb(con)
+                        seconds = time.perf_counter() - q
+                        profiler.record_query(
+                            "duckdb", query, seconds, len(table), explain
+                        )
+                    table = table.cast(schema)
+                    writer.write_table(table, row_group_size=Merger.row_group_size)
+                    if store is not None:
+                        store.upsert(user_store.SOURCES, table)
+                    merged += table.num_rows
+                    new += Merger.count_new_fids(con, table, user_file, fids)
+        finally:
+            con.close()
+            for path in staged.values():
+                if path is not None:
+                    os.remove(path)
+        os.replace(f"{out_file}.tmp", out_file)
+
+        Merger.record("user", stored, new, merged, t)
+        return merged
 
-        df = pd.concat([df, make_queued_df(warpcast_file, searchcaster_file)])
-        df = df.drop_duplicates(subset=["fid"])
-        return df
+    @staticmethod
+    def user_segments(
+        warpcast_file: str = "queue/user_warpcast.ndjson",
+        searchcaster_file: str = "queue/user_searchcaster.ndjson",
+        user_file: str = "data/users.parquet",
+        store: Optional[user_store.UserStore] = None,
+    ) -> int:
+        # the user queues like the cast and reaction ones: seal, merge, consume,
+        # prune. a merged fid is in user_file, so only the records of fids that
+        # are still missing the other source go back on the queue, the
+        # QueueProducer diff (warpcast against searchcaster) needs them, and they
+        # are merged again next time. returns the users written, 0 when both
+        # queues are empty
+        queues = {
+            "user_warpcast": warpcast_file,
+            "user_searchcaster": searchcaster_file,
+        }
+        pending = {source: segments.seal(q) for source, q in queues.items()}
+        if not any(pending.values()):
+            return 0
+        merged = Merger.user_parquet(
+            warpcast_file, searchcaster_file, user_file, None, store
+        )
+        stored = pq.read_table(user_file, columns=["fid"])["fid"]
+        for source, queued_file in queues.items():
+            table = user_store.read_queue(pending[source], source)
+            missing = pc.invert(pc.is_in(table["fid"], value_set=stored))
+            # back on the queue before the segments are let go, a crash in between
+            # leaves a record twice, which the merge dedupes
+            json_append(queued_file, table.filter(missing).to_pylist())
+            segments.consume(pending[source])
+            segments.prune(queued_file)
+        return merged
 
     @staticmethod
-    def cast(queued_file: str, data_file: str) -> pd.DataFrame:
+    @profiler.profile
+    def cast(
+        queued_file: Union[str, List[str]], data_file: str, kind: str = "cast"
+    ) -> pd.DataFrame:
+        # queued_file: the pending segments from segments.seal(), so only what was
+        # queued since the last merge is read; a queue path reads all of it
+        t = time.perf_counter()
         queued_df = read_ndjson(queued_file)
 
         try:
@@ -605,10 +1433,14 @@ class Merger:
         except Exception:
             df = pd.DataFrame()
 
+        stored = len(df)
         df = pd.concat([df, queued_df])
-        df = df.drop_duplicates(subset=["hash"])
+        if len(df):
+            df = df.drop_duplicates(subset=["hash"])
+        Merger.record(kind, stored, len(queued_df), len(df), t)
         return df
 
     @staticmethod
-    def reaction(queued_file: str, data_file: str) -> pd.DataFrame:
-        return Merger.cast(queued_file, data_file)
+    @profiler.profile
+    def reaction(queued_file: Union[str, List[str]], data_file: str) -> pd.DataFrame:
+        return Merger.cast(queued_file, data_file, kind="reaction")
@@ -0,0 +1,281 @@
+import bisect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:  # aiohttp is only imported when the endpoint is served
+    from aiohttp import web
+
+# crawl instrumentation, one process-wide registry (`registry`) that the indexer
+# writes to and two ways out of it:
+# - prometheus text format, as a file (write_prometheus) or an http endpoint (serve)
+# - structured json log lines on the "crawl" logger (event)
+# metric names follow prometheus conventions, labels are plain kwargs:
+#   registry.inc("crawl_requests_total", host="api.warpcast.com", status="200")
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# seconds, roughly log spaced; an api call under 50ms or over 30s is an outlier
+LATENCY_BUCKETS = [0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+
+def make_labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = [(k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets: List[float]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        # upper bound of the bucket holding the q-th observation, good enough to
+        # tell 100ms from 1s apart
+        if self.count == 0:
+            return None
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = make_labels(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: Any) -> None:
+        with self.lock:
+            self.gauges.setdefault(name, {})[make_labels(labels)] = value
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        buckets: List[float] = LATENCY_BUCKETS,
+        **labels: Any,
+    ) -> None:
+        key = make_labels(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    def get(self, name: str, **labels: Any) -> float:
+        key = make_labels(labels)
+        series = self.counters.get(name) or self.gauges.get(name) or {}
+        return series.get(key, 0)
+
+    def total(self, name: str, **labels: Any) -> float:
+        # sum over every series of a counter whose labels include the given ones
+        wanted = set(make_labels(labels))
+        series = self.counters.get(name, {})
+        return sum(v for key, v in series.items() if wanted <= set(key))
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def to_prometheus(self) -> str:
+        lines: List[str] = []
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{format_labels(key)} {value:g}")
+            for name, series in sorted(self.gauges.items()):
+                lines.append(f"# TYPE {name} gauge")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{format_labels(key)} {value:g}")
+            for name, hists in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in sorted(hists.items()):
+                    cumulative = 0
+                    for bound, n in zip(hist.buckets + [float("inf")], hist.counts):
+                        cumulative += n
+                        le = ("le", "+Inf" if bound == float("inf") else f"{bound:g}")
+                        lines.append(
+                            f"{name}_bucket{format_labels(key, le)} {cumulative}"
+                        )
+                    lines.append(f"{name}_sum{format_labels(key)} {hist.sum:g}")
+                    lines.append(f"{name}_count{format_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, file_path: str = "data/metrics.prom") -> None:
+        # node_exporter's textfile collector wants whole files, hence tmp + rename
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        with open(f"{file_path}.tmp", "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(f"{file_path}.tmp", file_path)
+
+    def summary(self) -> Dict[str, Any]:
+        # per host view for the end-of-run log line
+        hosts: Dict[str, Dict[str, Any]] = {}
+
+        def host(key: Labels) -> Dict[str, Any]:
+            return hosts.setdefault(dict(key)["host"], {"requests": 0, "status": {}})
+
+        with self.lock:
+            for key, value in self.counters.get("crawl_requests_total", {}).items():
+                status = host(key)["status"]
+                status[dict(key)["status"]] = value
+                host(key)["requests"] += value
+            for key, value in self.counters.get("crawl_retries_total", {}).items():
+                host(key)["retries"] = host(key).get("retries", 0) + value
+            received = self.counters.get("crawl_response_bytes_total", {})
+            for key, value in received.items():
+                host(key)["bytes"] = value
+            for key, hist in self.histograms.get("crawl_request_seconds", {}).items():
+                host(key)["mean_s"] = round(hist.sum / hist.count, 4)
+                host(key)["p50_s"] = hist.quantile(0.5)
+                host(key)["p99_s"] = hist.quantile(0.99)
+        return hosts
+
+
+registry = Metrics()
+
+
+# ======================================================================================
+# structured logs
+# ======================================================================================
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+        }
+        line.update(getattr(record, "fields", {}))
+        return json.dumps(line, default=str)
+
+
+logger = logging.getLogger("crawl")
+
+
+def setup_logging(level: int = logging.INFO, file_path: Optional[str] = None) -> None:
+    # idempotent, main.py calls it once; processes that don't (benches, extract
+    # workers) get the stderr default on their first event
+    handler: logging.Handler = (
+        logging.FileHandler(file_path)
+        if file_path
+        else logging.StreamHandler(sys.stderr)
+    )
+    handler.setFormatter(JsonFormatter())
+    logger.handlers = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+def event(name: str, level: int = logging.INFO, **fields: Any) -> None:
+    if not logger.handlers:
+        setup_logging()
+    logger.log(level, name, extra={"fields": fields})
+
+
+# ======================================================================================
+# progress
+# ======================================================================================
+
+
+class Progress:
+    # items done out of total for one stage, with rate and eta from the wall clock
+    # since the stage started; total can be unknown (None) or grow as work is found
+
+    def __init__(self, stage: str, total: Optional[float] = None) -> None:
+        self.stage = stage
+        self.total = total
+        self.done = 0.0
+        self.started = time.monotonic()
+
+    def eta(self) -> Optional[float]:
+        elapsed = time.monotonic() - self.started
+        if self.total is None or self.done <= 0 or elapsed <= 0:
+            return None
+        return max(self.total - self.done, 0) / (self.done / elapsed)
+
+    def advance(self, n: float = 1, **fields: Any) -> None:
+        self.update(self.done + n, **fields)
+
+    def update(self, done: float, **fields: Any) -> None:
+        self.done = done
+        elapsed = time.monotonic() - self.started
+        eta = self.eta()
+        registry.set("crawl_progress_done", self.done, stage=self.stage)
+        if self.total is not None:
+            registry.set("crawl_progress_total", self.total, stage=self.stage)
+        if eta is not None:
+            registry.set("crawl_progress_eta_seconds", eta, stage=self.stage)
+        event(
+            "progress",
+            stage=self.stage,
+            done=round(self.done, 3),
+            total=self.total,
+            rate=round(self.done / elapsed, 3) if elapsed > 0 else None,
+            eta_s=round(eta, 1) if eta is not None else None,
+            **fields,
+        )
+
+    def finish(self, **fields: Any) -> None:
+        elapsed = time.monotonic() - self.started
+        registry.observe("crawl_stage_seconds", elapsed, stage=self.stage)
+        event("stage_done", stage=self.stage, done=self.done, seconds=elapsed, **fields)
+
+
+# ======================================================================================
+# endpoint
+# ======================================================================================
+
+
+def make_app(metrics: Metrics = registry) -> "web.Application":
+    from aiohttp import web
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.to_prometheus(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    return app
+
+
+async def serve(port: int = 9464, metrics: Metrics = registry) -> "web.AppRunner":
+    # runs inside the crawler's event loop, call runner.cleanup() when done
+    from aiohttp import web
+
+    runner = web.AppRunner(make_app(metrics))
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    return runner
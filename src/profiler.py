@@ -0,0 +1,224 @@
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+# opt-in profiling, off unless start() was called (main.py --profile), so the hooks
+# can stay in the code. a run is a tree of stages, each with
+# - wall and cpu seconds (cpu is process wide, so it includes other threads)
+# - tracemalloc peak, python allocations only (not arrow / duckdb buffers)
+# - the queries issued inside it, with their plan from EXPLAIN ANALYZE
+# EXPLAIN ANALYZE executes the query a second time, profiled runs are slower
+# finish() writes everything to one json report
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class Stage:
+    def __init__(self, name: str, parent: Optional["Stage"]) -> None:
+        self.name = name
+        self.parent = parent
+        self.path: str = f"{parent.path}/{name}" if parent else name
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak = 0
+        self.start_memory = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "stage": self.path,
+            "wall_s": round(self.wall, 4),
+            "cpu_s": round(self.cpu, 4),
+            "peak_mb": round(self.peak / 2**20, 2),
+            "alloc_mb": round((self.peak - self.start_memory) / 2**20, 2),
+        }
+
+
+class Run:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.stages: List[Dict[str, Any]] = []
+        self.queries: List[Dict[str, Any]] = []
+
+
+current_run: Optional[Run] = None
+current_stage: contextvars.ContextVar[Optional[Stage]] = contextvars.ContextVar(
+    "current_stage", default=None
+)
+
+
+def enabled() -> bool:
+    return current_run is not None
+
+
+def start(name: str) -> None:
+    global current_run
+    current_run = Run(name)
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    run = current_run
+    if run is None:
+        yield
+        return
+
+    parent = current_stage.get()
+    s = Stage(name, parent)
+    # tracemalloc has a single peak, so every stage resets it on entry and hands
+    # what it saw up to its parent on exit
+    current, peak = tracemalloc.get_traced_memory()
+    if parent is not None:
+        parent.peak = max(parent.peak, peak)
+    tracemalloc.reset_peak()
+    s.start_memory = s.peak = current
+
+    token = current_stage.set(s)
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        s.wall = time.perf_counter() - wall
+        s.cpu = time.process_time() - cpu
+        s.peak = max(s.peak, tracemalloc.get_traced_memory()[1])
+        if parent is not None:
+            parent.peak = max(parent.peak, s.peak)
+        current_stage.reset(token)
+        with run.lock:
+            run.stages.append(s.to_dict())
+
+
+def profile(fn: F) -> F:
+    # @profiler.profile on sync or async functions, the stage is the qualified name
+    if inspect.iscoroutinefunction(fn):
+
+        @functools.wraps(fn)
+        async def _async(*args: Any, **kwargs: Any) -> Any:
+            with stage(fn.__qualname__):
+                return await fn(*args, **kwargs)
+
+        return _async  # type: ignore
+
+    @functools.wraps(fn)
+    def _sync(*args: Any, **kwargs: Any) -> Any:
+        with stage(fn.__qualname__):
+            return fn(*args, **kwargs)
+
+    return _sync  # type: ignore
+
+
+# ======================================================================================
+# queries
+# ======================================================================================
+
+
+def plan_seconds(backend: str, plan: str) -> Optional[float]:
+    # server side execution time, so wall - this = transfer + client conversion
+    if backend == "postgres":
+        match = re.search(r"Execution Time: ([\d.]+) ms", plan)
+        return float(match.group(1)) / 1000 if match else None
+    match = re.search(r"Total Time: ([\d.]+)s", plan)
+    return float(match.group(1)) if match else None
+
+
+def explain_duckdb(con: Any) -> Callable[[str], str]:
+    # EXPLAIN ANALYZE rows are (kind, plan text); con is a duckdb connection, not
+    # imported here so the profiler stays cheap to import
+    return lambda q: "\n".join(row[1] for row in con.execute(q).fetchall())
+
+
+def record_query(
+    backend: str,
+    query: str,
+    seconds: float,
+    rows: Optional[int],
+    explain: Callable[[str], str],
+) -> None:
+    # explain gets the EXPLAIN statement and returns the plan as text
+    run = current_run
+    if run is None:
+        return
+
+    prefix = (
+        "EXPLAIN (ANALYZE, BUFFERS) " if backend == "postgres" else "EXPLAIN ANALYZE "
+    )
+    try:
+        plan = explain(prefix + query)
+    except Exception as e:  # the query itself already ran fine, keep going
+        plan = f"explain failed: {e}"
+    execution = plan_seconds(backend, plan)
+
+    s = current_stage.get()
+    entry = {
+        "stage": s.path if s else None,
+        "backend": backend,
+        "query": " ".join(query.split()),
+        "wall_s": round(seconds, 4),
+        "execution_s": round(execution, 4) if execution is not None else None,
+        "transfer_s": round(seconds - execution, 4) if execution is not None else None,
+        "rows": rows,
+        "plan": plan,
+    }
+    with run.lock:
+        run.queries.append(entry)
+
+
+# ======================================================================================
+# report
+# ======================================================================================
+
+
+def report() -> Dict[str, Any]:
+    assert current_run is not None, "profiler.start() wasn't called"
+    run = current_run
+    return {
+        "run": run.name,
+        "argv": sys.argv,
+        "started": run.started,
+        "seconds": round(time.time() - run.started, 4),
+        "stages": sorted(run.stages, key=lambda s: s["stage"]),
+        "queries": run.queries,
+    }
+
+
+def summary(data: Dict[str, Any]) -> str:
+    lines = [f"{'stage':48} {'wall_s':>8} {'cpu_s':>8} {'peak_mb':>8}"]
+    for s in data["stages"]:
+        depth = s["stage"].count("/")
+        name = "  " * depth + s["stage"].rsplit("/", 1)[-1]
+        lines.append(
+            f"{name[:48]:48} {s['wall_s']:8.3f} {s['cpu_s']:8.3f} {s['peak_mb']:8.1f}"
+        )
+    for q in data["queries"]:
+        lines.append(
+            f"sql {q['backend']} in {q['stage']}: {q['wall_s']}s total, "
+            f"{q['execution_s']}s executing, {q['rows']} rows"
+        )
+    return "\n".join(lines)
+
+
+def finish(out_dir: str = "profiles") -> str:
+    global current_run
+    data = report()
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(data["started"]))
+    name = re.sub(r"[^\w.-]+", "_", data["run"]).strip("_")
+    file_path = os.path.join(out_dir, f"{name}-{stamp}.json")
+    with open(file_path, "w") as f:
+        json.dump(data, f, indent=2, default=str, ensure_ascii=False)
+    print(summary(data), file=sys.stderr)
+    current_run = None
+    tracemalloc.stop()
+    return file_path
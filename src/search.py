@@ -0,0 +1,361 @@
+import os
+import re
+import shutil
+import zlib
+from typing import List, Literal, Mapping, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# on-disk layout, one directory per segment (data/search/seg-000001/...):
+# - docs.parquet: hash, timestamp, author_fid, channel_id, text sorted by timestamp,
+#   so doc id == row number and doc id order == time order
+# - lexicon.parquet: term, offset, length into postings.bin
+# - postings.bin: per term, zlib compressed uint32 deltas of the sorted doc ids
+# - reactions.npy: reaction count per doc, see SearchIndex.set_reaction_counts
+# segments are immutable once written, every `add` writes a new one, `compact`
+# folds them back into a single segment
+
+DOC_COLUMNS = ["hash", "timestamp", "author_fid", "channel_id", "text"]
+TOKEN_PATTERN = r"\w+"
+QUERY_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(TOKEN_PATTERN, text.lower())
+
+
+def parse_query(query: str) -> Tuple[List[str], List[List[str]]]:
+    # `foo "bar baz"` -> terms [foo, bar, baz], phrases [[bar, baz]]
+    terms: List[str] = []
+    phrases: List[List[str]] = []
+    for phrase, word in QUERY_PATTERN.findall(query):
+        tokens = tokenize(phrase or word)
+        terms += tokens
+        if phrase and len(tokens) > 1:
+            phrases.append(tokens)
+    return list(dict.fromkeys(terms)), phrases
+
+
+def phrase_regex(tokens: List[str]) -> re.Pattern[str]:
+    return re.compile(r"(?<!\w)" + r"\W+".join(map(re.escape, tokens)) + r"(?!\w)")
+
+
+def encode_postings(doc_ids: npt.NDArray[np.int64]) -> bytes:
+    deltas = np.diff(doc_ids, prepend=0).astype(np.uint32)
+    return zlib.compress(deltas.tobytes(), 1)
+
+
+def decode_postings(blob: bytes) -> npt.NDArray[np.int64]:
+    deltas = np.frombuffer(zlib.decompress(blob), dtype=np.uint32)
+    return np.cumsum(deltas, dtype=np.int64)
+
+
+def intersect_sorted(
+    small: npt.NDArray[np.int64], large: npt.NDArray[np.int64]
+) -> npt.NDArray[np.int64]:
+    # O(len(small) * log(len(large))), no concat + sort like np.intersect1d
+    if len(small) == 0 or len(large) == 0:
+        return small[:0]
+    i = np.minimum(np.searchsorted(large, small), len(large) - 1)
+    both: npt.NDArray[np.int64] = small[large[i] == small]
+    return both
+
+
+# ======================================================================================
+# segments
+# ======================================================================================
+
+
+class Segment:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        docs = pq.read_table(
+            os.path.join(path, "docs.parquet"),
+            columns=["hash", "timestamp", "author_fid", "channel_id"],
+            memory_map=True,
+        )
+        self.hashes = docs["hash"].combine_chunks()
+        self.timestamps = docs["timestamp"].to_numpy()
+        self.author_fids = docs["author_fid"].to_numpy()
+        channels = docs["channel_id"].combine_chunks().dictionary_encode()
+        self.channel_codes = channels.indices.fill_null(-1).to_numpy()
+        self.channel_names = channels.dictionary.to_pylist()
+        self._texts: Optional[pa.Array] = None
+
+        lexicon = pq.read_table(os.path.join(path, "lexicon.parquet"))
+        self.lexicon = dict(
+            zip(
+                lexicon["term"].to_pylist(),
+                zip(lexicon["offset"].to_pylist(), lexicon["length"].to_pylist()),
+            )
+        )
+        postings_path = os.path.join(path, "postings.bin")
+        self.postings = (
+            np.memmap(postings_path, mode="r")
+            if os.path.getsize(postings_path) > 0  # can't mmap an empty file
+            else np.empty(0, dtype=np.uint8)
+        )
+
+        reactions_path = os.path.join(path, "reactions.npy")
+        self.reactions = (
+            np.load(reactions_path)
+            if os.path.exists(reactions_path)
+            else np.zeros(len(self.timestamps), dtype=np.int64)
+        )
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def texts(self) -> pa.Array:
+        # only needed for phrase checks and results, so read it on first use
+        if self._texts is None:
+            docs_path = os.path.join(self.path, "docs.parquet")
+            table = pq.read_table(docs_path, columns=["text"], memory_map=True)
+            self._texts = table["text"].combine_chunks()
+        return self._texts
+
+    @staticmethod
+    def write(path: str, df: pd.DataFrame) -> None:
+        df = df[DOC_COLUMNS].sort_values("timestamp", kind="stable")
+        df = df.reset_index(drop=True)
+        os.makedirs(path, exist_ok=True)
+
+        tokens = df["text"].fillna("").astype(str).str.lower()
+        tokens = tokens.str.findall(TOKEN_PATTERN).explode().dropna()
+        pairs = pd.DataFrame({"term": tokens.to_numpy(str), "doc": tokens.index})
+        pairs = pairs.drop_duplicates().sort_values(["term", "doc"], kind="stable")
+        terms, starts = np.unique(pairs["term"].to_numpy(), return_index=True)
+        ends = np.append(starts[1:], len(pairs))
+        docs = pairs["doc"].to_numpy(np.int64)
+
+        offsets, lengths = [], []
+        with open(os.path.join(path, "postings.bin"), "wb") as f:
+            offset = 0
+            for start, end in zip(starts, ends):
+                blob = encode_postings(docs[start:end])
+                f.write(blob)
+                offsets.append(offset)
+                lengths.append(len(blob))
+                offset += len(blob)
+
+        lexicon = pa.table({"term": terms, "offset": offsets, "length": lengths})
+        pq.write_table(lexicon, os.path.join(path, "lexicon.parquet"))
+        docs_table = pa.Table.from_pandas(df, preserve_index=False)
+        pq.write_table(docs_table, os.path.join(path, "docs.parquet"))
+
+    def save_reactions(self) -> None:
+        np.save(os.path.join(self.path, "reactions.npy"), self.reactions)
+
+    def term_docs(self, term: str) -> npt.NDArray[np.int64]:
+        if term not in self.lexicon:
+            return np.empty(0, dtype=np.int64)
+        offset, length = self.lexicon[term]
+        return decode_postings(self.postings[offset : offset + length].tobytes())
+
+    def candidates(
+        self,
+        terms: List[str],
+        author_fid: Optional[int],
+        channel_id: Optional[str],
+        t_from: Optional[int],
+        t_until: Optional[int],
+    ) -> npt.NDArray[np.int64]:
+        # doc ids are in time order, so the time filter is a contiguous id range
+        lo = 0 if t_from is None else np.searchsorted(self.timestamps, t_from, "left")
+        hi = (
+            len(self)
+            if t_until is None
+            else np.searchsorted(self.timestamps, t_until, "left")
+        )
+
+        if terms:
+            postings = sorted((self.term_docs(term) for term in terms), key=len)
+            docs = postings[0]
+            for other in postings[1:]:
+                if len(docs) == 0:
+                    break
+                docs = intersect_sorted(docs, other)
+            docs = docs[np.searchsorted(docs, lo) : np.searchsorted(docs, hi)]
+        else:
+            docs = np.arange(lo, hi, dtype=np.int64)
+
+        if author_fid is not None:
+            docs = docs[self.author_fids[docs] == author_fid]
+        if channel_id is not None:
+            if channel_id not in self.channel_names:
+                return np.empty(0, dtype=np.int64)
+            code = self.channel_names.index(channel_id)
+            docs = docs[self.channel_codes[docs] == code]
+        return docs
+
+    def ranked(
+        self, docs: npt.NDArray[np.int64], order_by: Literal["recency", "reactions"]
+    ) -> npt.NDArray[np.int64]:
+        if order_by == "reactions":
+            keys = self.reactions[docs]
+            order: npt.NDArray[np.int64] = docs[
+                np.lexsort((-self.timestamps[docs], -keys))
+            ]
+            return order
+        return docs[::-1]
+
+    def verify(
+        self, docs: npt.NDArray[np.int64], phrases: List[re.Pattern[str]]
+    ) -> npt.NDArray[np.int64]:
+        if not phrases or len(docs) == 0:
+            return docs
+        texts = self.texts.take(pa.array(docs)).to_pylist()
+        keep = [all(p.search((t or "").lower()) for p in phrases) for t in texts]
+        passed: npt.NDArray[np.int64] = docs[np.array(keep, dtype=bool)]
+        return passed
+
+    def top(
+        self,
+        docs: npt.NDArray[np.int64],
+        phrases: List[re.Pattern[str]],
+        order_by: Literal["recency", "reactions"],
+        k: int,
+    ) -> npt.NDArray[np.int64]:
+        # phrase checks read text, so walk the ranked candidates in chunks and
+        # stop as soon as k of them pass
+        docs = self.ranked(docs, order_by)
+        if not phrases:
+            return docs[:k]
+
+        found: List[npt.NDArray[np.int64]] = []
+        n, chunk = 0, max(k, 256)
+        for i in range(0, len(docs), chunk):
+            passed = self.verify(docs[i : i + chunk], phrases)
+            found.append(passed)
+            n += len(passed)
+            if n >= k:
+                break
+        return np.concatenate(found)[:k] if found else docs[:0]
+
+    def rows(self, docs: npt.NDArray[np.int64]) -> pd.DataFrame:
+        channel_codes = self.channel_codes[docs]
+        return pd.DataFrame(
+            {
+                "hash": self.hashes.take(pa.array(docs)).to_pylist(),
+                "timestamp": self.timestamps[docs],
+                "author_fid": self.author_fids[docs],
+                "channel_id": [
+                    self.channel_names[c] if c >= 0 else None for c in channel_codes
+                ],
+                "text": self.texts.take(pa.array(docs)).to_pylist(),
+                "reactions": self.reactions[docs],
+            }
+        )
+
+
+# ======================================================================================
+# index
+# ======================================================================================
+
+
+class SearchIndex:
+    def __init__(self, root: str = "data/search", max_segments: int = 16) -> None:
+        self.root = root
+        self.max_segments = max_segments
+        self.segments: List[Segment] = []
+        self.load()
+
+    def __len__(self) -> int:
+        return sum(len(segment) for segment in self.segments)
+
+    def load(self) -> None:
+        if not os.path.isdir(self.root):
+            return
+        names = sorted(d for d in os.listdir(self.root) if d.startswith("seg-"))
+        self.segments = [Segment(os.path.join(self.root, name)) for name in names]
+
+    def next_segment_path(self) -> str:
+        names = [os.path.basename(segment.path) for segment in self.segments]
+        n = max((int(name.split("-")[1]) for name in names), default=0) + 1
+        return os.path.join(self.root, f"seg-{n:06d}")
+
+    def known(self, hashes: pa.Array) -> npt.NDArray[np.bool_]:
+        mask = np.zeros(len(hashes), dtype=bool)
+        for segment in self.segments:
+            mask |= pc.is_in(hashes, value_set=segment.hashes).to_numpy(False)
+        return mask
+
+    def add(self, df: pd.DataFrame) -> int:
+        # accepts Merger.cast output (or any frame with DOC_COLUMNS), casts that
+        # are already indexed are skipped, so passing the full merged frame is ok
+        df = df.drop_duplicates(subset=["hash"])
+        if self.segments and len(df) > 0:
+            df = df[~self.known(pa.array(df["hash"].astype(str)))]
+        if len(df) == 0:
+            return 0
+
+        path = self.next_segment_path()
+        Segment.write(f"{path}.tmp", df)
+        os.replace(f"{path}.tmp", path)
+        self.segments.append(Segment(path))
+
+        if len(self.segments) > self.max_segments:
+            self.compact()
+        return len(df)
+
+    def compact(self) -> None:
+        if len(self.segments) <= 1:
+            return
+        paths = [os.path.join(s.path, "docs.parquet") for s in self.segments]
+        df = pa.concat_tables([pq.read_table(path) for path in paths]).to_pandas()
+        reactions = np.concatenate([segment.reactions for segment in self.segments])
+        counts = pd.Series(reactions, index=df["hash"])
+
+        old = [segment.path for segment in self.segments]
+        path = self.next_segment_path()
+        Segment.write(f"{path}.tmp", df)
+        os.replace(f"{path}.tmp", path)
+        for segment_path in old:
+            shutil.rmtree(segment_path)
+        self.segments = [Segment(path)]
+        self.set_reaction_counts(counts)
+
+    def set_reaction_counts(self, counts: Mapping[str, int]) -> None:
+        # counts: target_hash -> number of reactions, all of them, i.e. the merged
+        # reactions.parquet's target_hash.value_counts(); refresh and the daemon's
+        # compact call it after every reaction merge
+        counts = counts if isinstance(counts, pd.Series) else pd.Series(counts)
+        for segment in self.segments:
+            hashes = pd.Series(segment.hashes.to_pylist())
+            mapped = hashes.map(counts).fillna(0).to_numpy(np.int64)
+            segment.reactions = mapped
+            segment.save_reactions()
+
+    def search(
+        self,
+        query: str = "",
+        author_fid: Optional[int] = None,
+        channel_id: Optional[str] = None,
+        t_from: Optional[int] = None,
+        t_until: Optional[int] = None,
+        k: int = 20,
+        order_by: Literal["recency", "reactions"] = "recency",
+    ) -> pd.DataFrame:
+        terms, phrases = parse_query(query)
+        patterns = [phrase_regex(tokens) for tokens in phrases]
+
+        frames = []
+        for segment in self.segments:
+            docs = segment.candidates(terms, author_fid, channel_id, t_from, t_until)
+            docs = segment.top(docs, patterns, order_by, k)
+            if len(docs) > 0:
+                frames.append(segment.rows(docs))
+
+        if not frames:
+            return pd.DataFrame(columns=DOC_COLUMNS + ["reactions"])
+
+        df = pd.concat(frames, ignore_index=True)
+        keys = ["reactions", "timestamp"] if order_by == "reactions" else ["timestamp"]
+        df = df.sort_values(keys, ascending=False, kind="stable")
+        return df.head(k).reset_index(drop=True)
@@ -0,0 +1,194 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Sequence, Set
+
+import numpy as np
+import numpy.typing as npt
+
+# persistent seen-set for the append-only queues (cast and reaction hashes), so
+# records we already queued are dropped before they're written instead of being
+# parsed again and thrown away by the drop_duplicates in Merger.cast
+# - every kind has a bloom filter in memory: a key it doesn't contain is new for
+#   sure, which is nearly every key of a forward crawl, no disk read at all
+# - the keys themselves live in sqlite; a key the filter does contain is looked
+#   up there, since the filter can be wrong in that direction (~1%)
+# the filter bits are saved on close and dropped by the next add, so a run that
+# didn't close (crashed) leaves none and the filter is rebuilt from the keys on
+# open. filters double (and are rebuilt) when they fill up
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (kind, key)
+) WITHOUT ROWID
+"""
+
+KINDS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kinds (
+    kind TEXT PRIMARY KEY,
+    keys INTEGER NOT NULL,
+    capacity INTEGER,
+    bloom BLOB
+)
+"""
+
+ERROR_RATE = 0.01
+MIN_CAPACITY = 1 << 16
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = ERROR_RATE) -> None:
+        # the usual sizing, m = -n ln(p) / ln(2)^2 bits and k = m / n ln(2) hashes
+        self.capacity = capacity
+        self.m = int(-capacity * np.log(error_rate) / np.log(2) ** 2) + 1
+        self.k = max(1, round(self.m / capacity * np.log(2)))
+        self.bits = np.zeros((self.m + 7) // 8, dtype=np.uint8)
+
+    def positions(self, keys: Sequence[str]) -> npt.NDArray[np.uint64]:
+        # k positions per key from two 64 bit hashes, h1 + i * h2
+        digests = b"".join(
+            hashlib.blake2b(key.encode(), digest_size=16).digest() for key in keys
+        )
+        h = np.frombuffer(digests, dtype=np.uint64).reshape(len(keys), 2)
+        i = np.arange(self.k, dtype=np.uint64)
+        p: npt.NDArray[np.uint64] = (h[:, :1] + i * h[:, 1:]) % np.uint64(self.m)
+        return p
+
+    def add(self, keys: Sequence[str]) -> None:
+        if keys:
+            p = self.positions(keys).ravel()
+            np.bitwise_or.at(
+                self.bits, p >> 3, np.left_shift(1, p & 7).astype(np.uint8)
+            )
+
+    def contains(self, keys: Sequence[str]) -> npt.NDArray[np.bool_]:
+        if not keys:
+            return np.zeros(0, dtype=np.bool_)
+        p = self.positions(keys)
+        bits = (self.bits[p >> 3] >> (p & 7).astype(np.uint8)) & 1
+        found: npt.NDArray[np.bool_] = bits.all(axis=1)
+        return found
+
+
+class SeenSet:
+    def __init__(self, file_path: str = "data/seen.sqlite") -> None:
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(file_path, check_same_thread=False)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        self.con.execute(SCHEMA)
+        self.con.execute(KINDS_SCHEMA)
+        self.filters: Dict[str, BloomFilter] = {}
+        self.counts: Dict[str, int] = {}
+        # per kind since open: new, duplicate, bloom false positives
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def filter(self, kind: str) -> BloomFilter:
+        if kind not in self.filters:
+            self.load(kind)
+        return self.filters[kind]
+
+    def load(self, kind: str) -> None:
+        row = self.con.execute(
+            "SELECT keys, capacity, bloom FROM kinds WHERE kind = ?", (kind,)
+        ).fetchone()
+        self.counts[kind] = row[0] if row else 0
+        if row and row[2] is not None:
+            bloom = BloomFilter(row[1])
+            bloom.bits = np.frombuffer(row[2], dtype=np.uint8).copy()
+            self.filters[kind] = bloom
+        else:
+            self.rebuild(kind)
+
+    def rebuild(self, kind: str) -> None:
+        capacity = max(MIN_CAPACITY, 2 * self.counts[kind])
+        bloom = BloomFilter(capacity)
+        cursor = self.con.execute("SELECT key FROM seen WHERE kind = ?", (kind,))
+        while True:
+            rows = cursor.fetchmany(100_000)
+            if not rows:
+                break
+            bloom.add([row[0] for row in rows])
+        self.filters[kind] = bloom
+
+    def stat(self, kind: str) -> Dict[str, int]:
+        return self.stats.setdefault(
+            kind, {"new": 0, "duplicate": 0, "false_positive": 0}
+        )
+
+    # ==================================================================================
+    # check and add
+    # ==================================================================================
+
+    def unseen(self, kind: str, keys: Sequence[str]) -> List[int]:
+        # positions of the keys that are neither stored nor repeated earlier in
+        # keys; doesn't add them, call add() once they're written
+        with self.lock:
+            maybe = self.filter(kind).contains(keys)
+            candidates = list({keys[i] for i in np.flatnonzero(maybe)})
+            stored = self.stored(kind, candidates)
+        out, batch = [], set()
+        for i, key in enumerate(keys):
+            if key in stored or key in batch:
+                continue
+            batch.add(key)
+            out.append(i)
+
+        stat = self.stat(kind)
+        stat["new"] += len(out)
+        stat["duplicate"] += len(keys) - len(out)
+        stat["false_positive"] += len(candidates) - len(stored)
+        return out
+
+    def stored(self, kind: str, keys: List[str]) -> Set[str]:
+        found: Set[str] = set()
+        for i in range(0, len(keys), 500):  # sqlite's host parameter limit
+            chunk = keys[i : i + 500]
+            rows = self.con.execute(
+                "SELECT key FROM seen WHERE kind = ? AND key IN "
+                f"({','.join('?' * len(chunk))})",
+                [kind, *chunk],
+            ).fetchall()
+            found.update(row[0] for row in rows)
+        return found
+
+    def add(self, kind: str, keys: Iterable[str]) -> None:
+        keys = list(keys)
+        with self.lock:
+            bloom = self.filter(kind)
+            with self.con:
+                before = self.con.total_changes
+                self.con.executemany(
+                    "INSERT OR IGNORE INTO seen VALUES (?, ?)",
+                    [(kind, key) for key in keys],
+                )
+                self.counts[kind] += self.con.total_changes - before
+                self.con.execute(
+                    "INSERT INTO kinds (kind, keys) VALUES (?, ?) ON CONFLICT(kind) "
+                    "DO UPDATE SET keys = excluded.keys, bloom = NULL",
+                    (kind, self.counts[kind]),
+                )
+            bloom.add(keys)
+            if self.counts[kind] > bloom.capacity:
+                self.rebuild(kind)
+
+    def __len__(self) -> int:
+        with self.lock:
+            (n,) = self.con.execute("SELECT COUNT(*) FROM seen").fetchone()
+        return int(n)
+
+    def close(self) -> None:
+        # saves the filters, the next open skips reading every key
+        with self.lock, self.con:
+            for kind, bloom in self.filters.items():
+                self.con.execute(
+                    "UPDATE kinds SET capacity = ?, bloom = ? WHERE kind = ?",
+                    (bloom.capacity, bloom.bits.tobytes(), kind),
+                )
+        with self.lock:
+            self.con.close()
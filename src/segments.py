@@ -0,0 +1,187 @@
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import pyarrow as pa
+
+# queue files as sealed, compressed segments
+#   queue/cast_warpcast.ndjson                              <- active, appended to
+#   queue/cast_warpcast.ndjson.segments/000000000007.ndjson.zst          <- pending
+#   queue/cast_warpcast.ndjson.segments/000000000006.consumed.ndjson.zst <- merged
+# appends go to the plain active file (so an old queue file just is the active
+# one). past SEGMENT_BYTES / SEGMENT_SECONDS, or when a merge asks, it's sealed:
+# moved into the segment dir under the next number, compressed to a .tmp and
+# renamed to .zst. every step is a rename, a crash leaves either the plain or the
+# compressed segment and the next seal finishes the job
+# a crash mid-append leaves a torn last line; it's cut off before the next
+# append and whenever the active file is read
+# merges read the pending segments and mark them consumed once the merged data
+# is written, so a merge reads what was queued since the last one, not the whole
+# history; prune() deletes consumed segments
+
+SEGMENT_BYTES = 64 * 2**20
+SEGMENT_SECONDS = 60 * 60
+COMPRESSION = "zstd"
+CHUNK = 2**20
+
+SEGMENT = re.compile(r"^(\d{12})(\.consumed)?\.ndjson(\.zst)?$")
+
+opened: Dict[str, float] = {}  # active file -> first append of this process
+
+
+def segment_dir(file_path: str) -> str:
+    return f"{file_path}.segments"
+
+
+def segment_path(file_path: str, seq: int, consumed: bool = False) -> str:
+    name = f"{seq:012d}{'.consumed' if consumed else ''}.ndjson.zst"
+    return os.path.join(segment_dir(file_path), name)
+
+
+def listing(file_path: str) -> List[Tuple[int, bool, str]]:
+    # (seq, consumed, path), a segment that's both plain and compressed (crash
+    # during seal) is listed as the plain one, seal() compresses it again
+    directory = segment_dir(file_path)
+    if not os.path.isdir(directory):
+        return []
+    found: Dict[Tuple[int, bool], str] = {}
+    for name in os.listdir(directory):
+        match = SEGMENT.match(name)
+        if match is None:
+            continue
+        key = (int(match.group(1)), match.group(2) is not None)
+        if key not in found or not match.group(3):
+            found[key] = os.path.join(directory, name)
+    return [(seq, consumed, path) for (seq, consumed), path in sorted(found.items())]
+
+
+def complete_size(file_path: str) -> int:
+    # bytes up to and including the last newline
+    with open(file_path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - 65536)
+            f.seek(start)
+            block = f.read(position - start)
+            newline = block.rfind(b"\n")
+            if newline >= 0:
+                return start + newline + 1
+            position = start
+    return 0
+
+
+# ======================================================================================
+# write
+# ======================================================================================
+
+
+def append(file_path: str, lines: bytes) -> None:
+    # lines: complete ndjson lines
+    if not lines:
+        return
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    with open(file_path, "ab") as f:
+        size = f.tell()
+        if size and complete_size(file_path) != size:  # torn line from a crash
+            f.truncate(complete_size(file_path))
+        f.write(lines)
+        size = f.tell()
+    started = opened.setdefault(file_path, time.monotonic())
+    if size >= SEGMENT_BYTES or time.monotonic() - started >= SEGMENT_SECONDS:
+        seal(file_path)
+
+
+def seal(file_path: str) -> List[str]:
+    # active file -> next segment; returns the pending segments, oldest first
+    directory = segment_dir(file_path)
+    entries = listing(file_path)
+    seq = max((e[0] for e in entries), default=0)
+    # a rotated file left behind by the daemon's old compaction is queued first
+    for source in [f"{file_path}.compacting", file_path]:
+        if os.path.exists(source) and os.path.getsize(source) > 0:
+            os.makedirs(directory, exist_ok=True)
+            seq += 1
+            os.replace(source, os.path.join(directory, f"{seq:012d}.ndjson"))
+        elif os.path.exists(source):
+            os.remove(source)
+    opened.pop(file_path, None)
+
+    for seq, consumed, path in listing(file_path):
+        if not path.endswith(".zst"):
+            compress(path, segment_path(file_path, seq, consumed))
+    return pending(file_path)
+
+
+def compress(plain: str, target: str) -> None:
+    size = complete_size(plain)
+    with open(plain, "rb") as src:
+        with pa.output_stream(f"{target}.tmp", compression=COMPRESSION) as out:
+            while src.tell() < size:
+                out.write(src.read(min(CHUNK, size - src.tell())))
+    os.replace(f"{target}.tmp", target)
+    os.remove(plain)
+
+
+def pending(file_path: str) -> List[str]:
+    return [path for _, consumed, path in listing(file_path) if not consumed]
+
+
+def consume(paths: List[str]) -> None:
+    # after the merged data is written; the segments are kept until prune()
+    for path in paths:
+        match = SEGMENT.match(os.path.basename(path))
+        if match is None or match.group(2):
+            continue
+        target = os.path.join(
+            os.path.dirname(path), f"{match.group(1)}.consumed.ndjson.zst"
+        )
+        if path.endswith(".zst"):
+            os.replace(path, target)
+        else:
+            compress(path, target)
+
+
+def prune(file_path: str) -> int:
+    removed = 0
+    for _, consumed, path in listing(file_path):
+        if consumed:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+# ======================================================================================
+# read
+# ======================================================================================
+
+
+def files(file_path: str, consumed: bool = True) -> List[str]:
+    # everything queued: segments (consumed ones too unless asked not to) then the
+    # active file
+    paths = [p for _, c, p in listing(file_path) if consumed or not c]
+    if os.path.exists(file_path) and os.path.getsize(file_path):
+        paths.append(file_path)
+    return paths
+
+
+def read_file(path: str) -> bytes:
+    if path.endswith(".zst"):
+        with pa.input_stream(path, compression=COMPRESSION) as f:
+            data: bytes = f.read()
+        return data
+    with open(path, "rb") as f:
+        return f.read(complete_size(path))
+
+
+def read(file_path: Union[str, List[str]], consumed: bool = True) -> bytes:
+    # a queue path reads the whole queue, a list reads just those segments
+    paths = files(file_path, consumed) if isinstance(file_path, str) else file_path
+    return b"".join(read_file(path) for path in paths)
+
+
+def size(file_path: str) -> Optional[int]:
+    # on disk, compressed; None when nothing was ever queued
+    paths = files(file_path)
+    return sum(os.path.getsize(p) for p in paths) if paths else None
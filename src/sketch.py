@@ -0,0 +1,236 @@
+import math
+import os
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+# mergeable sketches for the dashboards, all of them are kept per day and merged
+# for multi-day windows, error bounds:
+# - HyperLogLog(p): relative standard error 1.04 / sqrt(2^p), p=14 -> ~0.8%
+#   (within 2.4% for 99% of estimates), merging doesn't add error
+# - CountMinSketch(w, d): overestimates only, estimate <= true + (e / w) * N with
+#   probability 1 - exp(-d), N = total weight added (w=2^14, d=5 -> 0.017% of N)
+# - SpaceSaving(k): every reported count is an upper bound and count - error a lower
+#   bound, any key with true count > N / k is guaranteed to be reported
+
+
+def hash_values(values: Any) -> npt.NDArray[np.uint64]:
+    # stable across processes (unlike hash()) so persisted sketches stay mergeable
+    # nulls are dropped, same as COUNT(DISTINCT ...)
+    values = pd.Series(values).dropna()
+    if values.empty:
+        return np.empty(0, dtype=np.uint64)
+    if pd.api.types.is_integer_dtype(values.dtype):
+        hashed: npt.NDArray[np.uint64] = pd.util.hash_array(values.to_numpy(np.int64))
+    else:
+        hashed = pd.util.hash_array(values.to_numpy(object))
+    return hashed
+
+
+class HyperLogLog:
+    def __init__(
+        self, p: int = 14, registers: Optional[npt.NDArray[np.uint8]] = None
+    ) -> None:
+        self.p = p
+        self.m = 1 << p
+        self.registers = (
+            np.zeros(self.m, dtype=np.uint8) if registers is None else registers
+        )
+
+    def add(self, values: Any) -> "HyperLogLog":
+        h = hash_values(values)
+        idx = (h >> np.uint64(64 - self.p)).astype(np.int64)
+        # rank = position of the first 1 bit in the remaining 64 - p bits; only the
+        # top 53 of those are used so the int -> float conversion in frexp is exact
+        rest = (h << np.uint64(self.p)) >> np.uint64(11)
+        _, exponent = np.frexp(rest.astype(np.float64))
+        rank = (54 - exponent).astype(np.uint8)
+        np.maximum.at(self.registers, idx, rank)
+        return self
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        assert self.p == other.p, "can't merge sketches of different precision"
+        return HyperLogLog(self.p, np.maximum(self.registers, other.registers))
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = (
+            alpha * self.m**2 / np.sum(np.ldexp(1.0, -self.registers.astype(int)))
+        )
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * self.m and zeros > 0:
+            estimate = self.m * math.log(self.m / zeros)  # linear counting
+        return int(round(estimate))
+
+
+class CountMinSketch:
+    def __init__(
+        self,
+        width: int = 1 << 14,
+        depth: int = 5,
+        table: Optional[npt.NDArray[np.int64]] = None,
+    ) -> None:
+        self.width = width
+        self.depth = depth
+        self.table = (
+            np.zeros((depth, width), dtype=np.int64) if table is None else table
+        )
+
+    def columns(self, values: Any) -> npt.NDArray[np.int64]:
+        # double hashing, column of row i is (h1 + i * h2) mod width
+        h = hash_values(values)
+        h1 = (h & np.uint64(0xFFFFFFFF)).astype(np.int64)
+        h2 = (h >> np.uint64(32)).astype(np.int64) | 1
+        rows = np.arange(self.depth, dtype=np.int64)[:, None]
+        return (h1[None, :] + rows * h2[None, :]) % self.width
+
+    def add(self, values: Any, counts: Optional[Any] = None) -> "CountMinSketch":
+        cols = self.columns(values)
+        counts = np.ones(cols.shape[1], np.int64) if counts is None else counts
+        for row in range(self.depth):
+            np.add.at(self.table[row], cols[row], np.asarray(counts, np.int64))
+        return self
+
+    def merge(self, other: "CountMinSketch") -> "CountMinSketch":
+        assert self.table.shape == other.table.shape, "sketch shapes differ"
+        return CountMinSketch(self.width, self.depth, self.table + other.table)
+
+    def estimate(self, values: Any) -> npt.NDArray[np.int64]:
+        cols = self.columns(values)
+        rows = np.arange(self.depth)[:, None]
+        estimates: npt.NDArray[np.int64] = self.table[rows, cols].min(axis=0)
+        return estimates
+
+
+class SpaceSaving:
+    # counters: key -> (count, error), true count is in [count - error, count]
+    # floor: upper bound on the count of any key that isn't tracked
+
+    def __init__(self, k: int = 1000) -> None:
+        self.k = k
+        self.counters: Dict[Any, Tuple[int, int]] = {}
+        self.floor = 0
+
+    def add(self, keys: Iterable[Any], counts: Optional[Iterable[int]] = None) -> None:
+        counts = counts if counts is not None else iter(lambda: 1, None)
+        for key, count in zip(keys, counts):
+            if key in self.counters:
+                c, e = self.counters[key]
+                self.counters[key] = (c + count, e)
+            elif len(self.counters) < self.k:
+                self.counters[key] = (self.floor + count, self.floor)
+            else:
+                victim = min(self.counters, key=lambda x: self.counters[x][0])
+                floor = self.counters.pop(victim)[0]
+                self.floor = max(self.floor, floor)
+                self.counters[key] = (floor + count, floor)
+
+    @staticmethod
+    def from_counts(counts: Mapping[Any, int], k: int = 1000) -> "SpaceSaving":
+        # exact per-day counts (e.g. a GROUP BY) -> keep the top k exactly
+        ss = SpaceSaving(k)
+        ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+        ss.counters = {key: (int(count), 0) for key, count in ranked[:k]}
+        ss.floor = int(ranked[k][1]) if len(ranked) > k else 0
+        return ss
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        merged = SpaceSaving(max(self.k, other.k))
+        counters: Dict[Any, Tuple[int, int]] = {}
+        for key in set(self.counters) | set(other.counters):
+            c1, e1 = self.counters.get(key, (self.floor, self.floor))
+            c2, e2 = other.counters.get(key, (other.floor, other.floor))
+            counters[key] = (c1 + c2, e1 + e2)
+
+        ranked = sorted(counters.items(), key=lambda item: item[1][0], reverse=True)
+        merged.counters = dict(ranked[: merged.k])
+        dropped = ranked[merged.k][1][0] if len(ranked) > merged.k else 0
+        merged.floor = max(self.floor + other.floor, dropped)
+        return merged
+
+    def top(self, n: int) -> List[Tuple[Any, int, int]]:
+        ranked = sorted(
+            self.counters.items(), key=lambda item: item[1][0], reverse=True
+        )
+        return [(key, count, error) for key, (count, error) in ranked[:n]]
+
+
+# ======================================================================================
+# per day storage
+# ======================================================================================
+
+
+class DaySketches:
+    # everything the dashboards need for one UTC day, persisted as a single npz
+    # hll_*: distinct counts, cm_* / ss_*: frequencies, counts: exact row counts
+
+    def __init__(self) -> None:
+        self.hlls: Dict[str, HyperLogLog] = {}
+        self.cms: Dict[str, CountMinSketch] = {}
+        self.sss: Dict[str, SpaceSaving] = {}
+        self.counts: Dict[str, int] = {}
+
+    def merge(self, other: "DaySketches") -> "DaySketches":
+        merged = DaySketches()
+        for name in set(self.hlls) | set(other.hlls):
+            a, b = self.hlls.get(name), other.hlls.get(name)
+            merged.hlls[name] = a.merge(b) if a and b else a or b  # type: ignore
+        for name in set(self.cms) | set(other.cms):
+            x, y = self.cms.get(name), other.cms.get(name)
+            merged.cms[name] = x.merge(y) if x and y else x or y  # type: ignore
+        for name in set(self.sss) | set(other.sss):
+            s, t = self.sss.get(name), other.sss.get(name)
+            merged.sss[name] = s.merge(t) if s and t else s or t  # type: ignore
+        for name in set(self.counts) | set(other.counts):
+            merged.counts[name] = self.counts.get(name, 0) + other.counts.get(name, 0)
+        return merged
+
+    def save(self, file_path: str) -> None:
+        arrays: Dict[str, Any] = {}
+        for name, hll in self.hlls.items():
+            arrays[f"hll_{name}"] = hll.registers
+        for name, cm in self.cms.items():
+            arrays[f"cm_{name}"] = cm.table
+        for name, ss in self.sss.items():
+            keys = list(ss.counters)
+            arrays[f"ss_{name}_keys"] = np.array(keys)
+            arrays[f"ss_{name}_values"] = np.array(
+                [ss.counters[key] for key in keys], dtype=np.int64
+            ).reshape(-1, 2)
+            arrays[f"ss_{name}_meta"] = np.array([ss.k, ss.floor], dtype=np.int64)
+        for name, count in self.counts.items():
+            arrays[f"count_{name}"] = np.array(count, dtype=np.int64)
+
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        with open(f"{file_path}.tmp", "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(f"{file_path}.tmp", file_path)
+
+    @staticmethod
+    def load(file_path: str) -> "DaySketches":
+        day = DaySketches()
+        data = np.load(file_path)
+        for key in data.files:
+            kind, name = key.split("_", 1)
+            if kind == "hll":
+                registers = data[key]
+                day.hlls[name] = HyperLogLog(int(math.log2(len(registers))), registers)
+            elif kind == "cm":
+                table = data[key]
+                day.cms[name] = CountMinSketch(table.shape[1], table.shape[0], table)
+            elif kind == "count":
+                day.counts[name] = int(data[key])
+            elif kind == "ss" and name.endswith("_meta"):
+                name = name[: -len("_meta")]
+                k, floor = data[key].tolist()
+                ss = SpaceSaving(k)
+                ss.floor = floor
+                values = data[f"ss_{name}_values"].tolist()
+                ss.counters = {
+                    key.item(): (c, e)
+                    for key, (c, e) in zip(data[f"ss_{name}_keys"], values)
+                }
+                day.sss[name] = ss
+        return day
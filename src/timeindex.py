@@ -0,0 +1,161 @@
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# time-window layout for data/casts.parquet and data/reactions.parquet
+# - rows are sorted by timestamp and written in fixed size row groups
+# - a sidecar <file>.index.json holds min/max timestamp per row group plus the
+#   global high-watermark, so MAX(timestamp) is a small json read and a range
+#   query opens only the row groups that overlap the window
+# the sidecar remembers the size and mtime of the parquet it describes; when they
+# don't match (file written by something else) it's rebuilt from the parquet
+# footer statistics, which still prunes but costs opening the file
+
+ROW_GROUP_SIZE = 65536
+COLUMN = "timestamp"
+
+
+def index_path(file_path: str) -> str:
+    return f"{file_path}.index.json"
+
+
+def fingerprint(file_path: str) -> Dict[str, int]:
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+# ======================================================================================
+# write
+# ======================================================================================
+
+
+def write(
+    df: pd.DataFrame, file_path: str, row_group_size: int = ROW_GROUP_SIZE
+) -> Dict[str, Any]:
+    # sorted + row grouped parquet, then the sidecar; both atomically. an empty
+    # frame (nothing merged yet) leaves file_path as it is
+    if df.empty or COLUMN not in df.columns:
+        return load_index(file_path) or {}
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if table.num_rows:
+        table = table.sort_by(COLUMN)
+    pq.write_table(table, f"{file_path}.tmp", row_group_size=row_group_size)
+    os.replace(f"{file_path}.tmp", file_path)
+    return write_index(file_path, build_index(file_path))
+
+
+def build_index(file_path: str) -> Dict[str, Any]:
+    # from the footer only, no data pages are read
+    metadata = pq.ParquetFile(file_path).metadata
+    column = metadata.schema.names.index(COLUMN)
+    groups: List[Dict[str, Any]] = []
+    for i in range(metadata.num_row_groups):
+        group = metadata.row_group(i)
+        stats = group.column(column).statistics
+        has_stats = stats is not None and stats.has_min_max
+        groups.append(
+            {
+                "rows": group.num_rows,
+                "min": int(stats.min) if has_stats else None,
+                "max": int(stats.max) if has_stats else None,
+            }
+        )
+
+    bounds = [g for g in groups if g["min"] is not None]
+    return {
+        "column": COLUMN,
+        "rows": metadata.num_rows,
+        "min": min((g["min"] for g in bounds), default=None),
+        "max": max((g["max"] for g in bounds), default=None),
+        "complete": len(bounds) == len(groups),  # False: some groups can't be pruned
+        "row_groups": groups,
+    }
+
+
+def write_index(file_path: str, index: Dict[str, Any]) -> Dict[str, Any]:
+    index = {**index, **fingerprint(file_path)}
+    with open(f"{index_path(file_path)}.tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(f"{index_path(file_path)}.tmp", index_path(file_path))
+    return index
+
+
+# ======================================================================================
+# read
+# ======================================================================================
+
+
+def load_index(file_path: str) -> Optional[Dict[str, Any]]:
+    # None when there's no data file; a missing or stale sidecar gets rebuilt
+    if not os.path.exists(file_path):
+        return None
+    try:
+        with open(index_path(file_path)) as f:
+            index: Dict[str, Any] = json.load(f)
+        if all(index.get(k) == v for k, v in fingerprint(file_path).items()):
+            return index
+    except (OSError, ValueError):
+        pass
+    return write_index(file_path, build_index(file_path))
+
+
+def high_watermark(file_path: str) -> int:
+    index = load_index(file_path)
+    return index["max"] if index and index["max"] is not None else 0
+
+
+def row_groups(
+    index: Dict[str, Any], t_from: Optional[int] = None, t_until: Optional[int] = None
+) -> List[int]:
+    # [t_from, t_until), groups without statistics are always read
+    out = []
+    for i, group in enumerate(index["row_groups"]):
+        if group["min"] is not None:
+            if t_from is not None and group["max"] < t_from:
+                continue
+            if t_until is not None and group["min"] >= t_until:
+                continue
+        out.append(i)
+    return out
+
+
+def read_range(
+    file_path: str,
+    t_from: Optional[int] = None,
+    t_until: Optional[int] = None,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    index = load_index(file_path)
+    if index is None:
+        return pd.DataFrame(columns=columns or [])
+
+    groups = row_groups(index, t_from, t_until)
+    f = pq.ParquetFile(file_path)
+    read_columns = None if columns is None else list(dict.fromkeys(columns + [COLUMN]))
+    if groups:
+        table = f.read_row_groups(
+            groups, columns=read_columns, use_pandas_metadata=True
+        )
+    else:
+        table = f.schema_arrow.empty_table()
+        if read_columns is not None:
+            table = table.select(read_columns)
+
+    # the edge groups straddle the window
+    mask = None
+    if t_from is not None:
+        mask = pc.greater_equal(table[COLUMN], t_from)
+    if t_until is not None:
+        upper = pc.less(table[COLUMN], t_until)
+        mask = upper if mask is None else pc.and_(mask, upper)
+    if mask is not None:
+        table = table.filter(mask)
+    if columns is not None:
+        table = table.select(columns)
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
@@ -0,0 +1,293 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pa_json
+import pyarrow.parquet as pq
+
+import src.segments as segments
+
+# columnar user table, the users in memory: the daemon keeps one and
+# Merger.user_parquet upserts every merged fid range into it, users.parquet is
+# the same rows on disk. fids are dense (1..highest), so the fid is the row: an
+# upsert is an array assignment and there's no join at all
+# - numbers and flags: fixed width numpy columns, nullable ones carry a mask
+# - location ids / descriptions and collection ids: dictionary encoded, a few
+#   hundred distinct values shared by hundreds of thousands of users
+# - free text (usernames, bios, addresses) and the collection lists stay arrow:
+#   every upsert appends its column as a chunk and points the fids at their new
+#   rows (a fixed width int64 column), strings never become python objects
+# each source only writes its own columns, so a searchcaster record doesn't touch
+# the warpcast fields of the same fid; a user is complete (exported) once both
+# sources have written it, same as the inner join before
+
+SOURCES = ["user_warpcast", "user_searchcaster"]
+
+# column -> (source, kind), in users.parquet column order
+COLUMNS: Dict[str, Tuple[str, str]] = {
+    "username": ("user_warpcast", "str"),
+    "display_name": ("user_warpcast", "str"),
+    "pfp_url": ("user_warpcast", "str"),
+    "bio_text": ("user_warpcast", "str"),
+    "following_count": ("user_warpcast", "int"),
+    "follower_count": ("user_warpcast", "int"),
+    "location_id": ("user_warpcast", "dict"),
+    "location_description": ("user_warpcast", "dict"),
+    "verified": ("user_warpcast", "bool"),
+    "is_active": ("user_warpcast", "bool"),
+    "inviter_fid": ("user_warpcast", "int"),
+    "onchain_collections": ("user_warpcast", "list"),
+    "generated_farcaster_address": ("user_searchcaster", "str"),
+    "address": ("user_searchcaster", "str"),
+    "registered_at": ("user_searchcaster", "int"),
+}
+# values for int / bool / dict, row pointers into the chunks for str / list
+DTYPES = {"int": np.int64, "bool": np.bool_, "dict": np.int32}
+ARROW_TYPES = {
+    "int": pa.int64(),
+    "bool": pa.bool_(),
+    "str": pa.string(),
+    "dict": pa.string(),
+    "list": pa.list_(pa.string()),
+}
+
+
+def schema(source: Optional[str] = None) -> pa.Schema:
+    # users.parquet, or one queue's records: fid plus that source's columns
+    fields = [
+        (name, ARROW_TYPES[kind])
+        for name, (s, kind) in COLUMNS.items()
+        if source is None or s == source
+    ]
+    return pa.schema([("fid", pa.int64())] + fields)
+
+
+def read_queue(file_path: Union[str, List[str]], source: str) -> pa.Table:
+    # the ndjson queue straight to arrow with the known schema, no inference and
+    # no pandas in between; a queue path reads all segments, a list just those
+    data = segments.read(file_path)
+    if not data:
+        return schema(source).empty_table()
+    options = pa_json.ParseOptions(
+        explicit_schema=schema(source), unexpected_field_behavior="ignore"
+    )
+    return pa_json.read_json(pa.BufferReader(data), parse_options=options)
+
+
+def list_parts(column: pa.ListArray) -> Tuple[pa.Array, pa.Array]:
+    # offsets from 0 and the values they index, also for sliced arrays
+    offsets = column.offsets
+    first, last = offsets[0].as_py(), offsets[-1].as_py()
+    values = column.values.slice(first, last - first)
+    return pc.subtract(offsets, pa.scalar(first, pa.int32())), values
+
+
+class Dictionary:
+    # string <-> code, codes are append only so stored codes never change
+    def __init__(self) -> None:
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def encode(self, values: List[Optional[str]]) -> npt.NDArray[np.int32]:
+        out = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            if value is None:
+                out[i] = -1
+                continue
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.values)
+                self.values.append(value)
+            out[i] = code
+        return out
+
+    def arrow(self) -> pa.Array:
+        return pa.array(self.values, type=pa.string())
+
+
+class UserStore:
+    def __init__(self, capacity: int = 0) -> None:
+        self.capacity = 0
+        # int64 / bool / int32 codes per kind, see DTYPES
+        self.columns: Dict[str, npt.NDArray[Any]] = {}
+        self.valid: Dict[str, npt.NDArray[np.bool_]] = {}  # null masks, every column
+        self.chunks: Dict[str, List[pa.Array]] = {}  # str and list columns
+        self.rows: Dict[str, int] = {}  # rows in the chunks so far
+        self.present = {source: np.zeros(0, dtype=np.bool_) for source in SOURCES}
+        self.dictionaries = {
+            name: Dictionary()
+            for name, (_, kind) in COLUMNS.items()
+            if kind in ("dict", "list")
+        }
+        for name, (_, kind) in COLUMNS.items():
+            self.columns[name] = np.zeros(0, dtype=DTYPES.get(kind, np.int64))
+            self.valid[name] = np.zeros(0, dtype=np.bool_)
+            if kind in ("str", "list"):
+                self.chunks[name], self.rows[name] = [], 0
+        self.grow(capacity)
+
+    def __len__(self) -> int:
+        return int(self.complete().sum())
+
+    def grow(self, max_fid: int) -> None:
+        # amortized doubling, row i is fid i (row 0 stays empty)
+        if max_fid < self.capacity:
+            return
+        capacity = max(max_fid + 1, self.capacity * 2, 1024)
+
+        def extend(array: npt.NDArray[Any]) -> npt.NDArray[Any]:
+            grown: npt.NDArray[Any] = np.zeros(capacity, dtype=array.dtype)
+            grown[: len(array)] = array
+            return grown
+
+        self.columns = {name: extend(a) for name, a in self.columns.items()}
+        self.valid = {name: extend(a) for name, a in self.valid.items()}
+        self.present = {name: extend(a) for name, a in self.present.items()}
+        self.capacity = capacity
+
+    def complete(self) -> npt.NDArray[np.bool_]:
+        both: npt.NDArray[np.bool_] = np.logical_and.reduce(
+            [self.present[source] for source in SOURCES]
+        )
+        return both
+
+    # ==================================================================================
+    # upsert
+    # ==================================================================================
+
+    def upsert(
+        self, sources: Union[str, List[str]], data: Union[pd.DataFrame, pa.Table]
+    ) -> int:
+        # writes the given sources' columns that are in data, other columns keep
+        # their values; the last record of a fid wins. returns the rows written
+        sources = [sources] if isinstance(sources, str) else sources
+        table = data if isinstance(data, pa.Table) else pa.Table.from_pandas(data)
+        if table.num_rows == 0:
+            return 0
+
+        fids = table["fid"].to_numpy().astype(np.int64)
+        # keep the last occurrence of every fid
+        _, last = np.unique(fids[::-1], return_index=True)
+        rows = np.sort(len(fids) - 1 - last)
+        table, fids = table.take(pa.array(rows)), fids[rows]
+        self.grow(int(fids.max()))
+
+        for name, (source, kind) in COLUMNS.items():
+            if source not in sources or name not in table.column_names:
+                continue
+            column = table[name].combine_chunks().cast(ARROW_TYPES[kind])
+            self.valid[name][fids] = column.is_valid().to_numpy(zero_copy_only=False)
+            self.columns[name][fids] = self.decode(name, kind, column)
+        for source in sources:
+            self.present[source][fids] = True
+        return len(fids)
+
+    def decode(self, name: str, kind: str, column: pa.Array) -> npt.NDArray[Any]:
+        if kind in ("int", "bool"):
+            filled = pc.fill_null(column, 0 if kind == "int" else False)
+            values: npt.NDArray[Any] = filled.to_numpy(zero_copy_only=False)
+            return values
+        if kind == "dict":
+            return self.encode_strings(name, column)
+        if kind == "list":
+            # list<string> -> list<int32 code>, the values are encoded in one go
+            offsets, values = list_parts(column)
+            codes = pa.array(self.encode_strings(name, values))
+            mask = column.is_null() if column.null_count else None
+            column = pa.ListArray.from_arrays(offsets, codes, mask=mask)
+        # str / list: append the chunk, the column holds row pointers into it
+        self.chunks[name].append(column)
+        start, self.rows[name] = self.rows[name], self.rows[name] + len(column)
+        return np.arange(start, start + len(column), dtype=np.int64)
+
+    def encode_strings(self, name: str, column: pa.Array) -> npt.NDArray[np.int32]:
+        # dictionary encode once with arrow, then map the (few) distinct values
+        encoded = pc.dictionary_encode(column)
+        local = self.dictionaries[name].encode(encoded.dictionary.to_pylist())
+        indices = pc.fill_null(encoded.indices, -1).to_numpy(zero_copy_only=False)
+        if len(local) == 0:  # all null
+            return np.full(len(indices), -1, dtype=np.int32)
+        return np.where(indices >= 0, local[np.maximum(indices, 0)], -1).astype(
+            np.int32
+        )
+
+    # ==================================================================================
+    # read
+    # ==================================================================================
+
+    def get(self, fid: int) -> Optional[Dict[str, Any]]:
+        if fid >= self.capacity:
+            return None
+        if not all(self.present[source][fid] for source in SOURCES):
+            return None
+        user: Dict[str, Any] = self.to_arrow(np.array([fid])).to_pylist()[0]
+        return user
+
+    def to_arrow(self, fids: Optional[npt.NDArray[np.int64]] = None) -> pa.Table:
+        if fids is None:
+            fids = np.flatnonzero(self.complete())
+        arrays = {"fid": pa.array(fids, type=pa.int64())}
+        for name, (_, kind) in COLUMNS.items():
+            values = self.columns[name][fids]
+            mask = ~self.valid[name][fids]
+            if kind == "dict":
+                indices = pa.array(values, mask=values < 0, type=pa.int32())
+                dictionary = self.dictionaries[name].arrow()
+                arrays[name] = pa.DictionaryArray.from_arrays(
+                    indices, dictionary
+                ).dictionary_decode()
+            elif kind in ("str", "list"):
+                arrays[name] = self.gather(name, kind, values, mask)
+            else:
+                arrays[name] = pa.array(values, type=ARROW_TYPES[kind], mask=mask)
+        return pa.table(arrays)
+
+    def gather(
+        self,
+        name: str,
+        kind: str,
+        pointers: npt.NDArray[np.int64],
+        mask: npt.NDArray[np.bool_],
+    ) -> pa.Array:
+        chunks = self.chunks[name]
+        if not chunks:
+            value_type = pa.list_(pa.string()) if kind == "list" else pa.string()
+            return pa.nulls(len(pointers), type=value_type)
+        # never written fids point nowhere, they come out null
+        taken = pa.concat_arrays(chunks).take(pa.array(pointers, mask=mask))
+        if kind == "str":
+            return taken
+        # codes back to strings
+        offsets, codes = list_parts(taken)
+        items = self.dictionaries[name].arrow().take(codes)
+        null_mask = taken.is_null() if taken.null_count else None
+        return pa.ListArray.from_arrays(offsets, items, mask=null_mask)
+
+    def to_pandas(self) -> pd.DataFrame:
+        # list columns stay object dtype, pandas 2.0 can't read its own metadata
+        # back for arrow list dtypes from parquet
+        def mapper(t: pa.DataType) -> Optional[pd.ArrowDtype]:
+            return None if pa.types.is_list(t) else pd.ArrowDtype(t)
+
+        return self.to_arrow().to_pandas(types_mapper=mapper)
+
+    # ==================================================================================
+    # files
+    # ==================================================================================
+
+    @staticmethod
+    def from_parquet(file_path: str) -> "UserStore":
+        # users.parquet rows are complete users, both sources
+        store = UserStore()
+        if os.path.exists(file_path):
+            store.upsert(SOURCES, pq.read_table(file_path))
+        return store
+
+    def write_parquet(self, file_path: str) -> None:
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        pq.write_table(self.to_arrow(), f"{file_path}.tmp")
+        os.replace(f"{file_path}.tmp", file_path)
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import time
+from typing import Any
+
+import pytest
+
+from src import analytics, indexer, segments
+
+SLOW = "SELECT COUNT(*) FROM range(300000000) a"
+
+
+def test_queries(tmp_path: Any) -> None:
+    queue = str(tmp_path / "q.ndjson")
+    indexer.json_append(queue, [{"fid": i, "address": None} for i in range(1, 6)])
+    segments.seal(queue)
+    indexer.json_append(queue, [{"fid": 6, "address": "0xab"}])
+    with open(queue, "a") as f:
+        f.write('{"fid": 7, "addr')  # torn
+
+    async def run() -> None:
+        db = analytics.AsyncDuckDB(workers=2)
+        try:
+            assert await db.fetchall("SELECT 1, 2") == [(1, 2)]
+            assert list((await db.df("SELECT 42 AS x"))["x"]) == [42]
+            assert (await db.arrow("SELECT 1 AS x")).num_rows == 1
+            # both at once, on two threads
+            a, b = await asyncio.gather(
+                db.column("SELECT * FROM range(3)"), db.column("SELECT 7")
+            )
+            assert (a, b) == ([1, 2], [7])
+        finally:
+            db.close()
+        assert await indexer.fetch_property("fid", queue) == list(range(1, 7))
+        assert await indexer.fetch_property("address", queue) == ["0xab"]
+        assert await indexer.fetch_property("fid", str(tmp_path / "no.ndjson")) == []
+        assert indexer.get_property("fid", queue) == list(range(1, 7))
+
+    asyncio.run(run())
+    analytics.close_shared()
+
+
+def test_timeout_keeps_the_loop_running() -> None:
+    async def run() -> None:
+        db = analytics.AsyncDuckDB(workers=2)
+        ticks = 0
+
+        async def tick() -> None:
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        t = time.perf_counter()
+        with pytest.raises(asyncio.TimeoutError):
+            await db.fetchall(SLOW, timeout=0.1)
+        assert time.perf_counter() - t < 0.5
+        assert ticks > 3  # the loop wasn't blocked by the scan
+        # the other thread still answers
+        assert await db.fetchall("SELECT 1") == [(1,)]
+
+        task = asyncio.create_task(db.fetchall(SLOW))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        ticker.cancel()
+        db.close()
+
+    asyncio.run(run())
+
+
+def test_user_producers(tmp_path: Any, monkeypatch: Any) -> None:
+    monkeypatch.setattr(indexer, "fetch_highest_fid", lambda: 10)
+    wf, sf, ef = [str(tmp_path / f"{n}.ndjson") for n in "wse"]
+    with open(wf, "w") as f:
+        f.writelines(json.dumps({"fid": i}) + "\n" for i in [1, 2, 3])
+    with open(sf, "w") as f:
+        f.writelines(json.dumps({"fid": i, "address": f"0x{i}"}) + "\n" for i in [1])
+    with open(ef, "w") as f:
+        f.write(json.dumps({"address": "0x1"}) + "\n")
+    uf = str(tmp_path / "users.parquet")
+
+    async def run() -> None:
+        fids = await indexer.QueueProducer.user_warpcast_async(wf, uf)
+        assert sorted(fids) == list(range(4, 11))
+        assert sorted(await indexer.QueueProducer.user_searchcaster_async(wf, sf)) == [
+            2,
+            3,
+        ]
+        assert await indexer.QueueProducer.user_ensdata_async(sf, ef) == []
+
+    asyncio.run(run())
+    analytics.close_shared()
@@ -0,0 +1,80 @@
+import os
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+from src import channel
+
+
+def make_cast(
+    hash: str, timestamp: int, parent_url: Optional[str], channel_id: Optional[str]
+) -> Dict[str, Any]:
+    return {
+        "hash": hash,
+        "timestamp": timestamp,
+        "parent_url": parent_url,
+        "channel_id": channel_id,
+        "channel_description": channel_id.title() if channel_id else None,
+    }
+
+
+def test_channel_index(tmp_path: Any) -> None:
+    file_path = str(tmp_path / "fip2.ndjson")
+    index = channel.ChannelIndex(file_path)
+    assert len(index) == 0
+
+    casts = [
+        make_cast("0x1", 1, "chain://eth", "ethereum"),
+        make_cast("0x2", 2, "chain://eth", "ethereum"),
+        make_cast("0x3", 3, None, None),
+        make_cast("0x4", 4, "https://purple.com", "purple"),
+    ]
+    new = index.update(casts)
+    assert [item["channel_id"] for item in new] == ["ethereum", "purple"]
+    assert index.update(casts) == []
+    assert index.channel_id("chain://eth") == "ethereum"
+    assert index.parent_url("purple") == "https://purple.com"
+    assert index.channel_id(None) is None
+
+    # only new pairs hit the disk, and a reload picks them all up
+    with open(file_path) as f:
+        assert len(f.readlines()) == 2
+    with open(file_path, "a") as f:
+        f.write('{"parent_url": "torn')
+    reloaded = channel.ChannelIndex(file_path)
+    assert reloaded.by_url == index.by_url
+    assert reloaded.descriptions["purple"] == "Purple"
+
+
+def test_channel_store(tmp_path: Any) -> None:
+    store = channel.ChannelStore(str(tmp_path / "casts_by_channel"))
+    df = pd.DataFrame(
+        [
+            make_cast("0x1", 30, "chain://eth", "ethereum"),
+            make_cast("0x2", 10, "chain://eth", "ethereum"),
+            make_cast("0x3", 20, None, None),
+            make_cast("0x4", 40, "https://a/b", "a/b"),
+        ]
+    )
+    store.write(df)
+    assert store.channels() == ["a/b", "ethereum"]
+
+    eth = store.read("ethereum")
+    assert list(eth["hash"]) == ["0x2", "0x1"]  # sorted by timestamp
+    assert set(eth["channel_id"]) == {"ethereum"}
+
+    window = store.read("ethereum", t_from=20, t_until=40, columns=["hash"])
+    assert list(window["hash"]) == ["0x1"]
+    assert store.read("a/b")["hash"].tolist() == ["0x4"]
+    assert store.read("missing").empty
+
+    # partial rewrite leaves other partitions untouched
+    df.loc[df["hash"] == "0x4", "timestamp"] = 50
+    store.write(df, only=["ethereum"])
+    assert store.read("a/b")["timestamp"].tolist() == [40]
+    assert os.path.exists(store.partition_path("a/b"))
+
+    # nothing merged yet: an empty, column-less frame
+    store.write(pd.DataFrame(), only=set())
+    store.write(pd.DataFrame())
+    assert store.channels() == ["a/b", "ethereum"]
@@ -0,0 +1,155 @@
+from typing import Any, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src import cohort, timeindex
+
+DAY = cohort.DAY_MS
+T0 = 19_000 * DAY  # 2022-01-08, a saturday
+
+
+def make_data(seed: int = 0) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    rng = np.random.default_rng(seed)
+    users = pd.DataFrame(
+        {
+            "fid": np.arange(1, 201),
+            "registered_at": T0 + rng.integers(0, 40 * DAY, 200),
+        }
+    )
+    users.loc[users["fid"] % 17 == 0, "registered_at"] = None
+    n = 3000
+    authors = rng.integers(1, 201, n)
+    registered = users.set_index("fid")["registered_at"].fillna(T0).astype(np.int64)
+    casts = pd.DataFrame(
+        {
+            "hash": [f"0x{i:x}" for i in range(n)],
+            "author_fid": authors,
+            "timestamp": registered[authors].to_numpy() + rng.exponential(
+                20 * DAY, n
+            ).astype(np.int64),
+        }
+    )
+    m = 8000
+    targets = rng.integers(0, n, m)
+    reactions = pd.DataFrame(
+        {
+            "hash": [f"0xr{i:x}" for i in range(m)],
+            "reactor_fid": rng.integers(1, 250, m),  # some without a user row
+            "timestamp": casts["timestamp"].to_numpy()[targets] + rng.integers(
+                0, 5 * DAY, m
+            ),
+            "target_hash": casts["hash"].to_numpy()[targets],
+        }
+    )
+    return users, casts, reactions
+
+
+def build(tmp_path: Any, casts: pd.DataFrame, reactions: pd.DataFrame) -> Any:
+    cast_file, reaction_file = str(tmp_path / "c.parquet"), str(tmp_path / "r.parquet")
+    cut = T0 + 30 * DAY + DAY // 3  # mid-day
+    timeindex.write(casts[casts["timestamp"] < cut], cast_file)
+    timeindex.write(reactions[reactions["timestamp"] < cut], reaction_file)
+    activity = cohort.Activity()
+    activity.update(cast_file, reaction_file)
+    activity.save(str(tmp_path / "a.parquet"))
+
+    # the rest lands, the partial day is redone
+    activity = cohort.Activity.load(str(tmp_path / "a.parquet"))
+    timeindex.write(casts, cast_file)
+    timeindex.write(reactions, reaction_file)
+    activity.update(cast_file, reaction_file)
+    return activity
+
+
+def test_activity_matches_events(tmp_path: Any) -> None:
+    _, casts, reactions = make_data()
+    activity = build(tmp_path, casts, reactions)
+    assert (
+        activity.until
+        == max(casts["timestamp"].max(), reactions["timestamp"].max()) + 1
+    )
+
+    df = activity.frame()
+    assert df.equals(df.sort_values(["day", "fid"], ignore_index=True))
+    assert not df.duplicated(["day", "fid"]).any()
+    per_fid = df.groupby("fid")[cohort.KINDS].sum()
+    author = reactions["target_hash"].map(casts.set_index("hash")["author_fid"])
+    for kind, fids in [
+        ("casts", casts["author_fid"]),
+        ("reactions", reactions["reactor_fid"]),
+        ("received", author),
+    ]:
+        counts = per_fid[kind]
+        assert (
+            counts[counts > 0].to_dict() == fids.value_counts().sort_index().to_dict()
+        )
+
+
+def test_reports(tmp_path: Any) -> None:
+    users, casts, reactions = make_data()
+    activity = build(tmp_path, casts, reactions)
+    users.to_parquet(str(tmp_path / "u.parquet"), index=False)
+    registered = cohort.registrations(str(tmp_path / "u.parquet"))
+    assert registered[17] == -1 and registered[1] == users["registered_at"][0] // DAY
+
+    start, end = T0, T0 + 28 * DAY
+    u = users.dropna().astype(np.int64)
+    u = u[(u["registered_at"] >= start) & (u["registered_at"] < end)]
+    reg_day = u.set_index("fid")["registered_at"] // DAY
+    week = cohort.week_start(reg_day)
+    c = casts[casts["author_fid"].isin(u["fid"])].copy()
+    c["age"] = c["timestamp"] // DAY - c["author_fid"].map(reg_day)
+
+    # activation, ever and within a week of registering
+    table = cohort.activation(activity, registered, start, end)
+    assert (
+        table["total_registered"].tolist() == week.value_counts().sort_index().tolist()
+    )
+    assert table["week"].tolist() == cohort.day_label(np.unique(week.to_numpy()))
+    total = c.groupby("author_fid").size().reindex(u["fid"], fill_value=0)
+    for t in cohort.THRESHOLDS:
+        expected = (total >= t).groupby(week.to_numpy()).sum()
+        assert table[f"casts_{t}_plus"].tolist() == expected.tolist()
+    table = cohort.activation(activity, registered, start, end, window_days=7)
+    week_casts = c[(c["age"] >= 0) & (c["age"] < 7)].groupby("author_fid").size()
+    week_casts = week_casts.reindex(u["fid"], fill_value=0)
+    expected = (week_casts >= 5).groupby(week.to_numpy()).sum()
+    assert table["casts_5_plus"].tolist() == expected.tolist()
+
+    # retention: only fully observed periods count
+    table = cohort.retention(activity, registered, start, end, periods=8)
+    complete = activity.until // DAY
+    for p in range(8):
+        eligible = reg_day[reg_day + 7 * (p + 1) <= complete]
+        active = c[c["age"] // 7 == p]["author_fid"].unique()
+        rate = eligible.index.isin(active).astype(float)
+        expected = (
+            pd.Series(rate).groupby(cohort.week_start(eligible).to_numpy()).mean()
+        )
+        got = table.set_index("week")[f"period_{p}"].dropna()
+        assert got.tolist() == expected.tolist()
+
+    # 30 days in, nobody's 8th week is over yet
+    partial = cohort.Activity.load(str(tmp_path / "a.parquet"))
+    table = cohort.retention(partial, registered, start, end, periods=8)
+    assert table["period_7"].isna().all() and table["period_0"].notna().any()
+
+
+def test_first_actions(tmp_path: Any) -> None:
+    _, casts, reactions = make_data()
+    activity = build(tmp_path, casts, reactions)
+    df = cohort.first_actions(activity).set_index("fid")
+    first = casts.groupby("author_fid")["timestamp"].min() // DAY
+    assert df.index.tolist() == first.index.tolist()
+    assert (df["first_cast"] == first * DAY).all()
+
+    author = reactions["target_hash"].map(casts.set_index("hash")["author_fid"])
+    for label, days in cohort.WINDOWS.items():
+        age = casts["timestamp"] // DAY - casts["author_fid"].map(first)
+        expected = casts[(age >= 0) & (age < days)].groupby("author_fid").size()
+        assert (df[f"casts_{label}"] == expected.reindex(df.index, fill_value=0)).all()
+        age = reactions["timestamp"] // DAY - author.map(first)
+        expected = author[(age >= 0) & (age < days)].value_counts()
+        got = df[f"reactions_{label}"]
+        assert (got == expected.reindex(df.index, fill_value=0)).all()
@@ -0,0 +1,56 @@
+import contextlib
+import socket
+from typing import Any, AsyncContextManager, AsyncIterator, Callable, Generator
+
+import pytest
+from aiohttp import web
+
+from bench.mock_server import MockConfig, make_app
+from src import indexer
+
+MockApi = Callable[[MockConfig], AsyncContextManager[str]]
+
+
+@pytest.fixture(autouse=True)
+def crawler(
+    tmp_path: Any, monkeypatch: pytest.MonkeyPatch
+) -> Generator[None, None, None]:
+    # the http cache and the seen-set go to tmp_path instead of data/ in the cwd,
+    # no pause between batches; api urls a test points at the mock are put back
+    monkeypatch.setattr(indexer.Fetcher, "cache_file", str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(indexer.Fetcher, "cache", None)
+    monkeypatch.setattr(
+        indexer.BatchFetcher, "seen_file", str(tmp_path / "seen.sqlite")
+    )
+    monkeypatch.setattr(indexer.BatchFetcher, "seen_keys", None)
+    monkeypatch.setattr(indexer.BatchFetcher, "pause", 0)
+    for name in ["warpcast_url", "searchcaster_url", "ensdata_url"]:
+        monkeypatch.setattr(indexer.UrlMaker, name, getattr(indexer.UrlMaker, name))
+    yield
+    if indexer.Fetcher.cache is not None:
+        indexer.Fetcher.cache.close()
+    indexer.BatchFetcher.close_seen_set()
+
+
+@pytest.fixture
+def mock_api() -> MockApi:
+    # async with mock_api(MockConfig(...)) as base: the in-process mock api on a
+    # free port, UrlMaker points every api at it until the block exits
+    @contextlib.asynccontextmanager
+    async def serve(config: MockConfig) -> AsyncIterator[str]:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        runner = web.AppRunner(make_app(config))
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, "127.0.0.1", port).start()
+            base = f"http://127.0.0.1:{port}"
+            indexer.UrlMaker.warpcast_url = f"{base}/v2"
+            indexer.UrlMaker.searchcaster_url = f"{base}/api"
+            indexer.UrlMaker.ensdata_url = f"{base}/ens"
+            yield base
+        finally:
+            await runner.cleanup()
+
+    return serve
@@ -0,0 +1,99 @@
+import asyncio
+import os
+from typing import Any, Dict
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from bench.mock_server import MockConfig
+from src import daemon, engagement, indexer, search, segments
+
+
+async def run_daemon(mock_api: Any, tmp_path: Any) -> None:
+    paths: Dict[str, Any] = {
+        name: str(tmp_path / field.default)
+        for name, field in daemon.DaemonConfig.model_fields.items()
+        if isinstance(field.default, str)
+    }
+    os.makedirs(tmp_path / "queue")
+    os.makedirs(tmp_path / "data")
+    config = daemon.DaemonConfig(page_size=50, backfill_pages=2, **paths)
+    d = daemon.Daemon(config)
+    d.load()
+    mock = MockConfig(latency_ms=0, jitter_ms=0, n_users=30, n_casts=500)
+    async with mock_api(mock):
+        assert await d.poll_casts() == 100  # backfill is capped without local data
+        assert await d.poll_casts() == 0  # nothing new at the head
+        assert d.pending_fids
+
+        assert await d.refresh_users() == 30
+        assert await d.refresh_reactions() == 100
+        await d.compact()
+
+    casts = pd.read_parquet(config.cast_file)
+    assert len(casts) == 100 and casts["hash"].is_unique
+    assert not os.path.exists(config.cast_queue)
+    assert not os.path.exists(config.reaction_queue)
+    users = pd.read_parquet(config.user_file)
+    assert len(users) == 30 and len(d.users) == 30
+    # every fid is complete, nothing is left on the user queues
+    assert segments.size(config.user_warpcast_queue) is None
+    # the in-memory store is the same rows as users.parquet
+    assert d.users.to_arrow().equals(pq.read_table(config.user_file))
+    assert os.path.exists(config.reaction_file)
+    index = search.SearchIndex(config.search_root)
+    assert len(index) == 100
+    top = index.search(order_by="reactions", k=3)
+    reactions = pd.read_parquet(config.reaction_file)
+    counts = reactions["target_hash"].value_counts()
+    assert top["reactions"].tolist() == counts.head(3).tolist()
+    assert counts.loc[top["hash"]].tolist() == top["reactions"].tolist()
+    scores = engagement.Engagement.load(config.engagement_root)
+    reactions = pd.read_parquet(config.reaction_file)
+    weights = reactions["type"].map({"like": 1, "recast": 3})
+    assert len(scores) == 100 and scores.score.sum() == weights.sum()
+    assert not scores.top(day=d.latest_t).empty
+
+    # a restart picks the state back up from disk
+    restarted = daemon.Daemon(config)
+    restarted.load()
+    assert restarted.latest_t == d.latest_t
+    assert len(restarted.recent) == 100
+    assert len(restarted.known_fids) == 30 and len(restarted.users) == 30
+    assert len(restarted.engagement) == 100
+
+
+def test_daemon(tmp_path: Any, mock_api: Any) -> None:
+    asyncio.run(run_daemon(mock_api, tmp_path))
+
+
+async def recrawl_reactions(mock_api: Any, tmp_path: Any) -> daemon.Daemon:
+    paths: Dict[str, Any] = {
+        name: str(tmp_path / field.default)
+        for name, field in daemon.DaemonConfig.model_fields.items()
+        if isinstance(field.default, str)
+    }
+    config = daemon.DaemonConfig(page_size=50, backfill_pages=1, **paths)
+    d = daemon.Daemon(config)
+    d.load()
+    mock = MockConfig(latency_ms=0, jitter_ms=0, n_users=30, n_casts=200)
+    async with mock_api(mock):
+        await d.poll_casts()
+        for _ in range(2):
+            await d.refresh_reactions()
+            await d.compact()
+    return d
+
+
+def test_daemon_without_seen_set(
+    tmp_path: Any, mock_api: Any, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # SEEN_FILE= queues every reaction again on the second crawl, the scores
+    # still count each one once
+    monkeypatch.setattr(indexer.BatchFetcher, "seen_file", "")
+    d = asyncio.run(recrawl_reactions(mock_api, tmp_path))
+    reactions = pd.read_parquet(d.config.reaction_file)
+    weights = reactions["type"].map({"like": 1, "recast": 3})
+    assert len(reactions) > 0 and reactions["hash"].is_unique
+    assert d.engagement.score.sum() == weights.sum()
@@ -0,0 +1,50 @@
+import threading
+import time
+
+import pytest
+
+from src import dag
+
+
+def test_dag_runs_dependencies_in_order() -> None:
+    pipeline = dag.Dag()
+    pipeline.add("total", lambda a, b: a + b, deps=["a", "b"])
+    pipeline.add("a", lambda: 1)
+    pipeline.add("b", lambda a: a + 1, deps=["a"])
+    assert pipeline.order() == ["a", "b", "total"]
+    assert pipeline.run() == {"a": 1, "b": 2, "total": 3}
+
+
+def test_parallel_is_concurrent_and_bounded() -> None:
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def work() -> int:
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.1)
+        with lock:
+            running[0] -= 1
+        return 1
+
+    t = time.perf_counter()
+    results = dag.parallel(2, **{f"n{i}": work for i in range(4)})
+    assert sum(results.values()) == 4
+    assert peak[0] == 2
+    assert time.perf_counter() - t < 0.35  # two rounds of 0.1s, not four
+
+
+def test_dag_errors() -> None:
+    pipeline = dag.Dag()
+    pipeline.add("a", lambda b: b, deps=["b"])
+    pipeline.add("b", lambda a: a, deps=["a"])
+    with pytest.raises(ValueError, match="cycle"):
+        pipeline.run()
+
+    pipeline = dag.Dag()
+    pipeline.add("boom", lambda: 1 / 0)
+    pipeline.add("after", lambda x: x, deps=["boom"])
+    with pytest.raises(RuntimeError, match="boom") as e:
+        pipeline.run()
+    assert isinstance(e.value.__cause__, ZeroDivisionError)
@@ -0,0 +1,152 @@
+import datetime
+import os
+import re
+from typing import Any, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from src import data_piplines
+
+
+def test_copy_to_arrow() -> None:
+    # what COPY (...) TO STDOUT (FORMAT csv) writes, with the result's type oids
+    columns = [
+        ("fid", 20),
+        ("n", 23),
+        ("avg", 1700),
+        ("ok", 16),
+        ("timestamp", 1184),
+        ("date", 1114),
+        ("username", 1043),
+        ("hash", 17),
+    ]
+    data = (
+        b'1,2,0.5,t,2023-07-01 12:00:00.123+00,2023-07-01 00:00:00,"a,b",\\x0102\n'
+        b',,,f,2023-07-02 01:00:00+00,,"",\n'
+    )
+    table = data_piplines.copy_to_arrow(data, columns)
+    assert table.schema == pa.schema(
+        [
+            ("fid", pa.int64()),
+            ("n", pa.int32()),
+            ("avg", pa.float64()),
+            ("ok", pa.bool_()),
+            ("timestamp", pa.timestamp("us", "UTC")),
+            ("date", pa.timestamp("us")),
+            ("username", pa.string()),
+            ("hash", pa.binary()),
+        ]
+    )
+    first, second = table.to_pylist()
+    assert first["timestamp"] == datetime.datetime(
+        2023, 7, 1, 12, 0, 0, 123000, tzinfo=datetime.timezone.utc
+    )
+    assert first["username"] == "a,b" and first["hash"] == b"\x01\x02"
+    # NULL is an empty field, the empty string is quoted
+    assert second["fid"] is None and second["date"] is None
+    assert second["username"] == "" and second["hash"] is None
+
+    empty = data_piplines.copy_to_arrow(b"", columns)
+    assert empty.num_rows == 0 and empty.schema == table.schema
+
+
+def test_query_tables() -> None:
+    reactions = pa.table({"fid": [3, 1, 2], "reactions_received": [5, 9, 5]})
+    casts = pa.table({"fid": pa.array([1, 3], pa.int32()), "total_casts": [4, 2]})
+    usernames = pa.table({"fid": [1, 2], "username": ["a", "b"]})
+    table = data_piplines.query_tables(
+        """
+        SELECT r.fid, COALESCE(c.total_casts, 0) AS total_casts, u.username
+        FROM reactions r
+            LEFT JOIN casts c USING (fid)
+            LEFT JOIN usernames u USING (fid)
+        ORDER BY r.reactions_received DESC, r.fid
+        """,
+        reactions=reactions,
+        casts=casts,
+        usernames=usernames,
+    )
+    assert table.to_pylist() == [
+        {"fid": 1, "total_casts": 4, "username": "a"},
+        {"fid": 2, "total_casts": 0, "username": "b"},
+        {"fid": 3, "total_casts": 2, "username": None},
+    ]
+
+
+def test_lookups_query_once_per_run(monkeypatch: pytest.MonkeyPatch) -> None:
+    queries: List[str] = []
+
+    def query_arrow(query: str, pg_url: Optional[str] = None) -> pa.Table:
+        queries.append(query)
+        return pa.table({"fid": [1, 2], "username": ["a", "b"]})
+
+    def names(start: int, end: int) -> pd.DataFrame:
+        lookup = data_piplines.fid_lookup("username")
+        return pd.DataFrame({"username": [lookup(1), lookup(2)]})
+
+    monkeypatch.setattr(data_piplines, "query_arrow", query_arrow)
+    monkeypatch.setitem(data_piplines.PIPELINES, "names", names)
+    data_piplines.usernames.cache_clear()
+    data_piplines.fid_lookup.cache_clear()
+
+    assert data_piplines.fid_lookup("username")(1) == "a"
+    assert data_piplines.fid_lookup("username")(2) == "b"
+    assert data_piplines.fid_lookup("fid")("b") == 2
+    assert len(queries) == 1
+
+    # every run starts from fresh usernames
+    results = data_piplines.run_pipelines(["names"], 0, 1)
+    assert results["names"]["username"].tolist() == ["a", "b"]
+    assert len(queries) == 2
+
+
+DAY = 24 * 60 * 60 * 1000
+START = 1688169600000  # 2023-07-01
+CASTS = {0: 3, 1: 2, 2: 4}  # day -> casts, day 2 has no reactions
+REACTIONS = {0: 2, 1: 1}
+
+
+def volume_query_arrow(query: str, pg_url: Optional[str] = None) -> pa.Table:
+    # the exact mode's per day aggregates, or one day's rows for the day sketches
+    casts = "parent_hash" in query
+    counts = CASTS if casts else REACTIONS
+    if "GROUP BY" in query:
+        days = sorted(counts)
+        dates = [(START + d * DAY) * 1000 for d in days]
+        names = ["unique_fids"] + (
+            ["unique_parent_hashes"]
+            if casts
+            else ["unique_target_fids", "unique_target_hashes"]
+        )
+        columns = {name: [1] * len(days) for name in names}
+        columns["count"] = [counts[d] for d in days]
+        return pa.table({"date": pa.array(dates, pa.timestamp("us")), **columns})
+    match = re.search(r"to_timestamp\(([\d.]+)\)", query)
+    assert match is not None
+    n = counts.get((int(float(match.group(1)) * 1000) - START) // DAY, 0)
+    if casts:
+        return pa.table({"fid": list(range(n)), "parent_hash": ["0x1"] * n})
+    return pa.table({"fid": [1] * n, "target_fid": [2] * n, "target_hash": ["0x1"] * n})
+
+
+def test_cast_reaction_volume_modes(
+    tmp_path: Any, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(data_piplines, "query_arrow", volume_query_arrow)
+    # day 2 ended less than SKETCH_SETTLE_MS ago
+    now = START + 3 * DAY + 1
+    monkeypatch.setattr(data_piplines.utils.TimeConverter, "ms_now", lambda: now)
+
+    end = START + 3 * DAY
+    exact = data_piplines.cast_reaction_volume(START, end)
+    approximate = data_piplines.cast_reaction_volume(START, end, approximate=True)
+    assert approximate.columns.tolist() == exact.columns.tolist()
+    assert approximate.dtypes.tolist() == exact.dtypes.tolist()
+    assert approximate.index.equals(exact.index)
+    for column in ["date", "count_casts", "count_reactions"]:
+        assert approximate[column].tolist() == exact[column].tolist(), column
+
+    assert sorted(os.listdir("data/sketches")) == ["2023-07-01.npz"]
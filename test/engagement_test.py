@@ -0,0 +1,139 @@
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import engagement
+
+DAY = engagement.DAY_MS
+
+
+def casts(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "hash": [f"0x{i:x}" for i in range(n)],
+            "timestamp": rng.integers(0, 5 * DAY, n),
+            "author_fid": rng.integers(1, 20, n),
+            "channel_id": rng.choice(np.array(["a", "b", None], dtype=object), n),
+        }
+    )
+
+
+def reactions(c: pd.DataFrame, m: int, seed: int = 1) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    targets = rng.integers(0, len(c), m)
+    return pd.DataFrame(
+        {
+            "type": rng.choice(["like", "recast", "follow"], m),
+            "timestamp": c["timestamp"].to_numpy()[targets] + rng.integers(0, DAY, m),
+            "target_hash": c["hash"].to_numpy()[targets],
+        }
+    )
+
+
+def expected_top(c: pd.DataFrame, r: pd.DataFrame, key: str, n: int) -> pd.DataFrame:
+    # the join + window the engine replaces
+    weights = r["type"].map({"like": 1, "recast": 3}).fillna(0)
+    score = weights.groupby(r["target_hash"]).sum()
+    df = c.assign(score=c["hash"].map(score).fillna(0.0), row=np.arange(len(c)))
+    df["day"] = df["timestamp"] // DAY
+    df = df.dropna(subset=[key]).sort_values(["score", "row"], ascending=[False, True])
+    return df.groupby(key, sort=False).head(n)
+
+
+@pytest.mark.parametrize("bulk", [10_000, 100])
+def test_incremental_matches_recompute(
+    tmp_path: Any, monkeypatch: Any, bulk: int
+) -> None:
+    # bulk: per cast heap updates vs rebuilding the touched heaps
+    monkeypatch.setattr(engagement, "BULK", bulk)
+    c, r = casts(3000), reactions(casts(3000), 20_000)
+    score = expected_top(c, r, "day", len(c)).set_index("hash")["score"]
+    scores = engagement.Engagement(engagement.EngagementConfig(top_n=10))
+    # reactions in batches, some before their casts
+    scores.add_reactions(r[:5000])
+    scores.add_casts(c[:2000])
+    for i in range(5000, len(r), 3000):
+        scores.add_reactions(r[i : i + 3000])
+    scores.add_casts(c)  # re-adding known casts is a no-op
+    assert len(scores) == len(c)
+
+    for key, arg in [
+        ("day", "day"),
+        ("channel_id", "channel"),
+        ("author_fid", "author"),
+    ]:
+        expected = expected_top(c, r, key, 10)
+        for group, df in expected.groupby(key):
+            value = group * DAY if key == "day" else group
+            top = scores.top(**{arg: value})
+            # equal scores may come in any order
+            assert top["score"].tolist() == df["score"].tolist()
+            assert (top["hash"].map(score) == top["score"]).all()
+
+    # persisted, the heaps come back the same
+    scores.watermarks["reactions"] = 42
+    scores.save(str(tmp_path / "e"))
+    loaded = engagement.Engagement.load(str(tmp_path / "e"))
+    assert loaded.watermarks == {"reactions": 42} and len(loaded) == len(c)
+    for day in range(0, 5 * DAY, DAY):
+        assert loaded.top(day=day).equals(scores.top(day=day))
+    assert loaded.top(channel="b", n=3).equals(scores.top(channel="b", n=3))
+
+
+def test_top_by_day_window() -> None:
+    c = casts(500)
+    r = reactions(c, 4000)
+    scores = engagement.Engagement(engagement.EngagementConfig(top_n=5))
+    scores.add_casts(c)
+    scores.add_reactions(r)
+
+    # a window cutting days in half is ranked from the rows
+    start, end = DAY + DAY // 2, 3 * DAY + DAY // 2
+    top = scores.top_by_day(start, end, 5)
+    assert sorted(set(top["day"])) == [DAY, 2 * DAY, 3 * DAY]
+    inside = c[(c["timestamp"] >= start) & (c["timestamp"] < end)]
+    expected = expected_top(inside, r, "day", 5)
+    expected = expected.sort_values("day", kind="stable")
+    assert top["score"].tolist() == expected["score"].tolist()
+
+
+def test_decay_and_weights() -> None:
+    config = engagement.EngagementConfig(
+        weights={"like": 1, "recast": 2}, half_life_ms=1000
+    )
+    scores = engagement.Engagement(config)
+    c = pd.DataFrame(
+        {"hash": ["old", "new"], "timestamp": [0, 0], "author_fid": [1, 1]}
+    )
+    scores.add_casts(c)
+    r = pd.DataFrame(
+        {
+            "type": [1, 1, 1, 2],  # replicator reaction types
+            "timestamp": [0, 0, 0, 3000],
+            "target_hash": ["old", "old", "old", "new"],
+        }
+    )
+    scores.add_reactions(r)
+    # 3 likes 3 half-lives ago < 1 recast now
+    top = scores.top(author=1)
+    assert top["hash"].tolist() == ["new", "old"]
+    assert top["score"].tolist() == pytest.approx([2.0, 3 / 8])
+    assert scores.top(author=1, now=4000)["score"].tolist() == pytest.approx(
+        [1.0, 3 / 16]
+    )
+
+    # far in the future the landmark moves, the ranking stays
+    late = 2000 * 1000
+    scores.add_reactions(
+        pd.DataFrame({"type": ["like"], "timestamp": [late], "target_hash": ["old"]})
+    )
+    assert scores.landmark == late
+    assert scores.top(author=1)["score"].tolist() == pytest.approx([1.0, 0.0])
+
+    with pytest.raises(ValueError):
+        engagement.Engagement(engagement.EngagementConfig(weights={"like": -1}))
+    with pytest.raises(ValueError):
+        scores.top(day=0, author=1)
@@ -0,0 +1,46 @@
+import asyncio
+import os
+from typing import Any, List
+
+import pytest
+
+from bench.mock_server import MockConfig
+from src import channel, fip2_indexer
+
+
+async def pull(mock_api: Any, out: str, patience: int) -> channel.ChannelIndex:
+    async with mock_api(MockConfig(latency_ms=0, jitter_ms=0, n_casts=2000)):
+        return await fip2_indexer.pull_fip2s(t=0, patience=patience, n=50, out=out)
+
+
+def test_pull_fip2s(
+    tmp_path: Any, mock_api: Any, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # new channels per page, to see where the crawl stopped
+    pages: List[int] = []
+    update = channel.ChannelIndex.update
+
+    def counted(self: channel.ChannelIndex, items: Any) -> Any:
+        new = update(self, items)
+        pages.append(len(new))
+        return new
+
+    monkeypatch.setattr(channel.ChannelIndex, "update", counted)
+    out = str(tmp_path / "fip2.ndjson")
+
+    # the mock has 30 channels, found in the first pages; the crawl stops after
+    # `patience` pages in a row without a new one, not at the end of the casts
+    channels = asyncio.run(pull(mock_api, out, patience=3))
+    assert len(channels) == 30 and sum(pages) == 30
+    assert pages[-3:] == [0, 0, 0] and pages[-4] > 0
+    assert len(pages) < 2000 // 50
+    with open(out) as f:
+        assert len(f.readlines()) == 30
+
+    # resuming from the file: everything is seen already, so it stops after
+    # `patience` pages and appends nothing
+    pages.clear()
+    size = os.path.getsize(out)
+    channels = asyncio.run(pull(mock_api, out, patience=2))
+    assert len(channels) == 30 and pages == [0, 0]
+    assert os.path.getsize(out) == size
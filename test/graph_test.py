@@ -0,0 +1,57 @@
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from src import graph
+
+
+def make_graph() -> graph.Graph:
+    # 1 -> 2 -> 3 -> 4, 1 -> 3 (twice), 5 -> 1
+    src = np.array([1, 2, 3, 1, 1, 5])
+    dst = np.array([2, 3, 4, 3, 3, 1])
+    return graph.Graph.from_edges(src, dst)
+
+
+def test_graph_structure(tmp_path: Any) -> None:
+    g = make_graph()
+    assert g.n_nodes == 6
+    assert g.n_edges == 5  # duplicate 1 -> 3 collapsed
+    assert g.neighbors(1).tolist() == [2, 3]
+    assert g.neighbors(4).tolist() == []
+    assert g.out_degree().tolist() == [0, 2, 1, 1, 0, 1]
+    assert g.in_degree().tolist() == [0, 1, 1, 2, 1, 0]
+    assert g.in_degree(weighted=True).tolist() == [0, 1, 1, 3, 1, 0]
+    assert g.transpose().neighbors(3).tolist() == [1, 2]
+
+    assert g.k_hop([1], k=1).tolist() == [2, 3]
+    assert g.k_hop([1], k=2).tolist() == [2, 3, 4]
+    assert g.k_hop([3], k=2, direction="in").tolist() == [1, 2, 5]
+    assert g.k_hop([3], k=1, direction="both").tolist() == [1, 2, 4]
+
+    path = str(tmp_path / "graph.npz")
+    g.save(path)
+    loaded = graph.Graph.load(path)
+    assert loaded.indices.tolist() == g.indices.tolist()
+    assert loaded.weights.tolist() == g.weights.tolist()
+
+
+def test_pagerank_and_sources() -> None:
+    g = make_graph()
+    rank = g.pagerank()
+    assert abs(rank.sum() - 1) < 1e-6
+    assert np.argmax(rank) in (3, 4)  # sinks of the chain collect the most mass
+
+    users = pd.DataFrame(
+        {"fid": [2, 3, 4, 5], "inviter_fid": [1, 1, 9, None]}  # 9 > 4: skipped
+    )
+    invites = graph.inviter_graph(users)
+    assert invites.out_degree()[1] == 2
+    assert invites.n_edges == 2
+
+    casts = pd.DataFrame({"hash": ["a", "b"], "author_fid": [1, 2]})
+    reactions = pd.DataFrame(
+        {"reactor_fid": [2, 3, 3, 3], "target_hash": ["a", "a", "b", "b"]}
+    )
+    reacted = graph.reaction_graph(reactions, casts)
+    assert reacted.in_degree(weighted=True)[1:3].tolist() == [2, 2]
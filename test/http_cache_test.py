@@ -0,0 +1,128 @@
+import asyncio
+import time
+from typing import Any, List
+
+import pytest
+
+from bench.mock_server import MockConfig
+from src import http_cache, indexer, metrics
+
+
+def test_entries(tmp_path: Any) -> None:
+    cache = http_cache.HttpCache(str(tmp_path / "cache.sqlite"))
+    url = "https://ensdata.net/0xabc"
+    assert cache.get(url) is None
+
+    cache.put(url, b'{"ens": "abc.eth"}' * 100, etag='"v1"')
+    entry = cache.get(url)
+    assert entry is not None and entry.body == b'{"ens": "abc.eth"}' * 100
+    assert entry.fresh(60) and not entry.fresh(0)
+    assert entry.validators() == {"If-None-Match": '"v1"'}
+
+    cache.con.execute("UPDATE responses SET stored_at = 0")
+    assert not cache.get(url).fresh(60)  # type: ignore
+    cache.touch(url)
+    assert cache.get(url).fresh(60)  # type: ignore
+    assert cache.prune(max_age=60) == 0 and len(cache) == 1
+    assert cache.prune(max_age=-1) == 1 and len(cache) == 0
+
+
+async def fetch_users_three_times(mock_api: Any, n: int) -> None:
+    def count(result: str) -> float:
+        return metrics.registry.total("crawl_cache_total", result=result)
+
+    async with mock_api(MockConfig(latency_ms=0, jitter_ms=0)):
+        urls = [indexer.UrlMaker.user_warpcast(fid=fid) for fid in range(1, n + 1)]
+        data = await indexer.Fetcher.user_warpcast(urls)
+        assert count("miss") == n
+
+        cached = await indexer.Fetcher.user_warpcast(urls)  # inside the ttl
+        assert count("hit") == n
+        assert metrics.registry.total("crawl_requests_total") == n
+        assert cached == data
+
+        await asyncio.sleep(0.01)
+        indexer.Fetcher.cache_ttl = {"user_warpcast": 0.001}
+        revalidated = await indexer.Fetcher.user_warpcast(urls)  # etag -> 304s
+        assert count("revalidated") == n
+        assert metrics.registry.total("crawl_requests_total", status=304) == n
+        assert revalidated == data
+
+
+def test_fetcher_cache(mock_api: Any, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(indexer.Fetcher, "cache_ttl", {"user_warpcast": 3600})
+    metrics.registry.reset()
+    asyncio.run(fetch_users_three_times(mock_api, 5))
+
+
+def test_negative_entries(tmp_path: Any) -> None:
+    cache = http_cache.HttpCache(str(tmp_path / "cache.sqlite"))
+    cache.miss("user_ensdata", ["0xa", "0xb"], ttl=60, max_ttl=100)
+    assert cache.negatives("user_ensdata") == {"0xa", "0xb"}
+    assert cache.negatives("user_warpcast") == set()
+
+    cache.miss("user_ensdata", ["0xa"], ttl=60, max_ttl=100)
+    row = cache.con.execute(
+        "SELECT failures, expires_at FROM negative WHERE key = '0xa'"
+    )
+    failures, expires_at = row.fetchone()
+    assert failures == 2 and expires_at - time.time() > 99  # 120, capped at 100
+
+    cache.found("user_ensdata", ["0xa"])
+    assert cache.negatives("user_ensdata") == {"0xb"}
+    cache.miss("user_ensdata", ["0xc"], ttl=-1, max_ttl=100)  # already expired
+    assert cache.negatives("user_ensdata") == {"0xb"}
+
+
+async def crawl_users(
+    mock_api: Any, fids: List[int], out: str, error_rate: float = 0.0
+) -> None:
+    mock = MockConfig(latency_ms=20, jitter_ms=0, n_users=10, error_rate=error_rate)
+    async with mock_api(mock):
+        await indexer.BatchFetcher.user_warpcast(fids, n=50, out=out)
+        # concurrent identical requests share one
+        url = indexer.UrlMaker.user_warpcast(fid=1)
+        bodies = await asyncio.gather(*[indexer.Fetcher.fetch(url) for _ in range(5)])
+        assert len(set(bodies)) == 1
+
+
+def test_negative_cache_and_coalescing(
+    tmp_path: Any, mock_api: Any, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(indexer.Fetcher, "cache_ttl", {})
+    metrics.registry.reset()
+
+    # fids 11-15 don't exist on the mock, fid 3 is asked for twice
+    out = str(tmp_path / "users.ndjson")
+    asyncio.run(crawl_users(mock_api, [3] + list(range(1, 16)), out))
+    assert metrics.registry.total("crawl_requests_total") == 15 + 1
+    assert metrics.registry.total("crawl_coalesced_total") == 4
+    cache = indexer.Fetcher.http_cache()
+    assert cache is not None
+    assert cache.negatives("user_warpcast") == {str(fid) for fid in range(11, 16)}
+
+    metrics.registry.reset()
+    asyncio.run(crawl_users(mock_api, list(range(1, 16)), out))
+    assert metrics.registry.total("crawl_requests_total", status=404) == 0
+    assert metrics.registry.total("crawl_negative_skipped_total") == 5
+    with open(out) as f:
+        assert sum(1 for _ in f) == 20
+
+
+def test_failures_are_not_negative(
+    tmp_path: Any, mock_api: Any, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(indexer.Fetcher, "cache_ttl", {})
+    monkeypatch.setattr(indexer.Fetcher, "max_retries", 0)
+    metrics.registry.reset()
+
+    # every request a 500: nothing is known about fids 11-15 yet
+    out = str(tmp_path / "users.ndjson")
+    asyncio.run(crawl_users(mock_api, list(range(1, 16)), out, error_rate=1.0))
+    assert metrics.registry.total("crawl_requests_total", status=500) == 15 + 1
+    cache = indexer.Fetcher.http_cache()
+    assert cache is not None
+    assert cache.negatives("user_warpcast") == set()
+
+    asyncio.run(crawl_users(mock_api, list(range(1, 16)), out))
+    assert cache.negatives("user_warpcast") == {str(fid) for fid in range(11, 16)}
@@ -1,14 +1,20 @@
+import asyncio
+import datetime
+import email.utils
 import glob
+import json
 import os
 import random
 import string
 import time
-from typing import Any, Dict, Generator, Hashable
+from typing import Any, Dict, Generator, Hashable, List, Optional, Tuple
 
 import pandas as pd
+import pyarrow.parquet as pq
 import pytest
 
-from src import indexer
+from bench.mock_server import MockConfig
+from src import indexer, metrics, segments, user_store
 
 
 @pytest.fixture(autouse=True)
@@ -70,6 +76,190 @@ def test_time_converter() -> None:
         assert abs(indexer.TimeConverter.unixms_to_ago(factor, ms) - 1) < 0.01
 
 
+def test_retry_delay(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(indexer.Fetcher, "backoff", 1.0)
+    assert indexer.Fetcher.retry_delay(None, 2) == 4.0
+    assert indexer.Fetcher.retry_delay("0.5", 0) == 0.5
+    # http dates, in the past they mean right away
+    later = email.utils.format_datetime(
+        datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=30),
+        usegmt=True,
+    )
+    assert 25 < indexer.Fetcher.retry_delay(later, 0) <= 30
+    assert indexer.Fetcher.retry_delay("Wed, 21 Oct 2015 07:28:00 GMT", 0) == 0.0
+    assert indexer.Fetcher.retry_delay("soon", 1) == 2.0
+
+
+async def crawl_mock(mock_api: Any, out_dir: Any) -> None:
+    # every BatchFetcher crawl against the in-process mock api
+    mock = MockConfig(latency_ms=0, jitter_ms=0, n_users=60, n_casts=300)
+    async with mock_api(mock):
+        fids = list(range(1, 61))
+        await indexer.BatchFetcher.user_warpcast(fids, n=25, out=f"{out_dir}/u.ndjson")
+        out = f"{out_dir}/s.ndjson"
+        await indexer.BatchFetcher.user_searchcaster(fids, n=25, out=out)
+        await indexer.BatchFetcher.cast_warpcast(n=100, out=f"{out_dir}/c.ndjson")
+        hashes: List[Tuple[str, Optional[str]]] = [
+            (f"0x{i:040x}", None) for i in range(40)
+        ]
+        out = f"{out_dir}/r.ndjson"
+        await indexer.BatchFetcher.reaction_warpcast(hashes, n=15, out=out)
+
+
+def test_extract_pool_matches_inline(
+    tmp_path: Any, mock_api: Any, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    for name, workers in [("inline", 0), ("pool", 2)]:
+        monkeypatch.setattr(indexer.ExtractPool, "workers", workers)
+        seen_file = str(tmp_path / f"{name}.sqlite")
+        monkeypatch.setattr(indexer.BatchFetcher, "seen_file", seen_file)
+        monkeypatch.setattr(indexer.BatchFetcher, "seen_keys", None)
+        os.makedirs(tmp_path / name)
+        try:
+            asyncio.run(crawl_mock(mock_api, tmp_path / name))
+        finally:
+            indexer.ExtractPool.shutdown()
+
+    for file_name in ["u.ndjson", "s.ndjson", "c.ndjson", "r.ndjson"]:
+        with open(tmp_path / "inline" / file_name, "rb") as f:
+            inline = f.read()
+        with open(tmp_path / "pool" / file_name, "rb") as f:
+            assert f.read() == inline and inline, file_name
+
+
+async def crawl_empty(mock_api: Any, out: str) -> None:
+    async with mock_api(MockConfig(latency_ms=0, jitter_ms=0, n_casts=0)):
+        await indexer.BatchFetcher.cast_warpcast(n=100, out=out)
+
+
+def test_cast_warpcast_empty_page(
+    tmp_path: Any, mock_api: Any, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # an api with no casts ends the crawl instead of failing on the empty page
+    for workers in [0, 2]:
+        monkeypatch.setattr(indexer.ExtractPool, "workers", workers)
+        out = str(tmp_path / f"c{workers}.ndjson")
+        try:
+            asyncio.run(crawl_empty(mock_api, out))
+        finally:
+            indexer.ExtractPool.shutdown()
+        assert not segments.files(out)
+
+
+def warpcast_user(fid: int, **fields: Any) -> Dict[str, Any]:
+    # a queued warpcast user, the columns left out are null
+    user = {
+        "fid": fid,
+        "username": f"user{fid}",
+        "follower_count": fid * 3,
+        "location_id": f"place{fid % 3}",
+        "verified": fid % 2 == 0,
+        "onchain_collections": [f"c{fid % 2}", "c9"] if fid % 4 else [],
+    }
+    return {**user, **fields}
+
+
+def searchcaster_user(fid: int, **fields: Any) -> Dict[str, Any]:
+    user = {
+        "fid": fid,
+        "address": None if fid % 3 else f"0x{fid:040d}",
+        "registered_at": 1_000 * fid,
+    }
+    return {**user, **fields}
+
+
+def user_row(fid: int, **fields: Any) -> Dict[str, Any]:
+    # a users.parquet row
+    row = {name: None for name in user_store.COLUMNS}
+    return {**row, **warpcast_user(fid), **searchcaster_user(fid), **fields}
+
+
+def write_users(file_path: str, users: List[Dict[str, Any]]) -> None:
+    with open(file_path, "w") as f:
+        f.writelines(json.dumps(u) + "\n" for u in users)
+
+
+def test_merger_user(tmp_path: Any) -> None:
+    wf, sf, uf = [str(tmp_path / f) for f in ["w.ndjson", "s.ndjson", "u.parquet"]]
+    write_users(wf, [warpcast_user(i) for i in range(1, 11)])
+    write_users(sf, [searchcaster_user(i) for i in range(5, 15)])
+    assert indexer.Merger.user_parquet(wf, sf, uf) == 6
+    assert pq.read_table(uf).to_pylist() == [user_row(i) for i in range(5, 11)]
+    assert pq.read_table(uf).schema == user_store.schema()
+
+    # stored users stay, newer queue records replace them
+    write_users(wf, [warpcast_user(i, username="renamed") for i in [5, 11]])
+    write_users(sf, [searchcaster_user(11)])
+    assert indexer.Merger.user_parquet(wf, sf, uf) == 7
+    users = pq.read_table(uf)
+    assert users["fid"].to_pylist() == list(range(5, 12))
+    assert users.to_pylist()[:2] == [user_row(5, username="renamed"), user_row(6)]
+
+
+def test_merger_user_batches(tmp_path: Any, monkeypatch: pytest.MonkeyPatch) -> None:
+    # across fid batches, with queued duplicates and all null columns
+    monkeypatch.setattr(indexer.Merger, "fid_batch", 7)
+    wf, sf, uf = [str(tmp_path / f) for f in ["w.ndjson", "s.ndjson", "u.parquet"]]
+    out = str(tmp_path / "out.parquet")
+    write_users(wf, [warpcast_user(i, extra=1) for i in range(1, 30)])
+    write_users(sf, [searchcaster_user(i) for i in range(5, 40)])
+    assert indexer.Merger.user_parquet(wf, sf, uf, out) == 25
+    assert pq.read_table(out).to_pylist() == [user_row(i) for i in range(5, 30)]
+
+    os.replace(out, uf)
+    metrics.registry.reset()
+    write_users(wf, [warpcast_user(i, username=f"v{i}") for i in [5, 44, 5, 3]])
+    with open(wf, "a") as f:
+        f.write(json.dumps(warpcast_user(5, username="last")) + "\n")
+    write_users(sf, [searchcaster_user(44)])
+    assert indexer.Merger.user_parquet(wf, sf, uf) == 26
+    users = pq.read_table(uf)
+    expected = [
+        user_row(i, username="last" if i == 5 else f"user{i}") for i in range(5, 30)
+    ]
+    assert users.to_pylist() == expected + [user_row(44, username="v44")]
+    # one new fid, nothing counted as a duplicate
+    assert metrics.registry.get("crawl_merge_duplicates_total", kind="user") == 0
+    assert indexer.Merger.user_parquet(wf, sf, str(tmp_path / "none.parquet")) == 1
+
+
+def test_merger_user_segments(tmp_path: Any) -> None:
+    # the latest record is the one queued last, across sealed segments and the
+    # active file
+    wf, sf, uf = [str(tmp_path / f) for f in ["w.ndjson", "s.ndjson", "u.parquet"]]
+    for version in range(3):
+        records = [warpcast_user(i, username=f"v{version}") for i in [2, 1, 2]]
+        indexer.json_append(wf, records)
+        indexer.json_append(sf, [searchcaster_user(1), searchcaster_user(2)])
+        if version < 2:
+            segments.seal(wf)
+            segments.seal(sf)
+    assert len(segments.files(wf)) == 3
+    assert indexer.Merger.user_parquet(wf, sf, uf) == 2
+    assert pq.read_table(uf)["username"].to_pylist() == ["v2", "v2"]
+    assert not os.listdir(tmp_path / "duckdb_tmp")
+
+
+def test_merger_user_segments_pruned(tmp_path: Any) -> None:
+    # merged records leave the queues, fids missing a source stay for the diff
+    wf, sf, uf = [str(tmp_path / f) for f in ["w.ndjson", "s.ndjson", "u.parquet"]]
+    indexer.json_append(wf, [warpcast_user(i) for i in range(1, 11)])
+    indexer.json_append(sf, [searchcaster_user(i) for i in range(5, 15)])
+    assert indexer.Merger.user_segments(wf, sf, uf) == 6
+    assert sorted(indexer.get_fids(wf)) == [1, 2, 3, 4]
+    assert sorted(indexer.get_fids(sf)) == [11, 12, 13, 14]
+    assert segments.files(wf) == [wf] and segments.files(sf) == [sf]
+    assert sorted(indexer.QueueProducer.user_searchcaster(wf, sf)) == [1, 2, 3, 4]
+    # the carried records are merged again, nothing changes
+    assert indexer.Merger.user_segments(wf, sf, uf) == 6
+    assert sorted(indexer.get_fids(wf)) == [1, 2, 3, 4]
+
+    indexer.json_append(sf, [searchcaster_user(2)])
+    assert indexer.Merger.user_segments(wf, sf, uf) == 7
+    assert sorted(indexer.get_fids(wf)) == [1, 3, 4]
+    assert pq.read_table(uf).to_pylist()[0] == user_row(2)
+
+
 # ======================================================================================
 # integration tests
 # ======================================================================================
@@ -188,15 +378,15 @@ async def test_user_integration() -> None:
 
     ws_fids = set.intersection(set(w_df["fid"]), set(s_df["fid"]))
     ws_fids_half = random.sample(list(ws_fids), len(ws_fids) // 2)
-    ws_df = indexer.Merger.user(warpcast_file=wf, searchcaster_file=sf, user_file=f)
-    assert isinstance(ws_df, pd.DataFrame)
+    indexer.Merger.user_parquet(warpcast_file=wf, searchcaster_file=sf, user_file=f)
+    ws_df = indexer.read_parquet(f)
     assert set(ws_df["fid"]) == ws_fids
     ws_df = ws_df[ws_df["fid"].isin(ws_fids_half)]
     ws_df.to_parquet(f)
     ws_df = indexer.read_parquet(f)
     assert set(ws_df["fid"]) == set(ws_fids_half)
-    ws_df = indexer.Merger.user(warpcast_file=wf, searchcaster_file=sf, user_file=f)
-    assert isinstance(ws_df, pd.DataFrame)
+    indexer.Merger.user_parquet(warpcast_file=wf, searchcaster_file=sf, user_file=f)
+    ws_df = indexer.read_parquet(f)
     assert set(ws_df["fid"]) == ws_fids
     assert len(ws_df.columns) == len(w_df.columns) + len(s_df.columns) - 1  # fid dedup
 
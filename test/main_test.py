@@ -0,0 +1,90 @@
+import asyncio
+import os
+from typing import Any
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import main
+from bench.mock_server import T0, MockConfig
+from src import indexer, segments
+
+
+def test_cli_arguments() -> None:
+    parser = main.make_parser()
+    args = parser.parse_args(["pipeline", "embed_count", "--start", "2023-07-01"])
+    assert args.names == ["embed_count"]
+    assert args.start == 1688169600000
+    assert args.end == main.parse_time("1690848000000")
+    assert args.format == "parquet"
+    assert parser.parse_args(["refresh", "all"]).target == "all"
+
+
+def test_write_output(tmp_path: Any) -> None:
+    df = pd.DataFrame({"fid": [1, 2], "username": ["a", "b"]})
+    for format in ["parquet", "csv", "arrow"]:
+        file_path = str(tmp_path / "out" / f"users.{format}")
+        main.write_output(df, file_path, format)
+        if format == "parquet":
+            back = pd.read_parquet(file_path)
+        elif format == "csv":
+            back = pd.read_csv(file_path)
+        else:
+            back = pa.ipc.open_file(file_path).read_pandas()
+        assert back.to_dict("list") == df.to_dict("list")
+
+
+def test_legacy_query_flag(tmp_path: Any, capsys: Any) -> None:
+    sql = tmp_path / "q.sql"
+    sql.write_text("SELECT 42 AS answer")
+    main.main(["--query", str(sql)])
+    assert "42" in capsys.readouterr().out
+
+
+def test_instrumented(tmp_path: Any, monkeypatch: Any) -> None:
+    # the metrics file and summary come out whether the refresh works or dies
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("METRICS_PORT", raising=False)
+
+    async def noop() -> None:
+        pass
+
+    async def boom() -> None:
+        raise RuntimeError("boom")
+
+    asyncio.run(main.instrumented(noop()))
+    assert os.path.exists("data/metrics.prom")
+    os.remove("data/metrics.prom")
+    with pytest.raises(RuntimeError):
+        asyncio.run(main.instrumented(boom()))
+    assert os.path.exists("data/metrics.prom")
+
+
+async def refresh_mock(mock_api: Any) -> None:
+    async with mock_api(MockConfig(latency_ms=0, jitter_ms=0, n_casts=200)):
+        await main.refresh_cast()
+        await main.refresh_reactions()
+
+
+def test_refresh_reactions(
+    tmp_path: Any, mock_api: Any, monkeypatch: pytest.MonkeyPatch, capsys: Any
+) -> None:
+    # reactions end up in data/reactions.parquet, not only in the queue
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(indexer.TimeConverter, "ms_now", lambda: T0)
+    asyncio.run(refresh_mock(mock_api))
+    reactions = pd.read_parquet("data/reactions.parquet")
+    casts = pd.read_parquet("data/casts.parquet")
+    assert len(reactions) > 0 and reactions["hash"].is_unique
+    assert set(reactions["target_hash"]) <= set(casts["hash"])
+    assert not segments.files("queue/reaction_warpcast.ndjson")
+
+    # the search index ranks on the merged reaction counts
+    counts = reactions["target_hash"].value_counts()
+    main.main(["search", "gm", "-k", "1"])
+    assert "gm" in capsys.readouterr().out
+    args = ["search", "-k", "3", "--order-by", "reactions", "--format", "csv"]
+    main.main(args + ["--out", "top.csv"])
+    top = pd.read_csv("top.csv")
+    assert top["reactions"].tolist() == counts.head(3).tolist()
@@ -0,0 +1,61 @@
+import json
+import logging
+from typing import Any
+
+from src import metrics
+
+
+def test_registry_prometheus(tmp_path: Any) -> None:
+    registry = metrics.Metrics()
+    registry.inc("crawl_requests_total", host="a.xyz", status=200)
+    registry.inc("crawl_requests_total", 2, host="a.xyz", status=429)
+    registry.inc("crawl_retries_total", 2, host="a.xyz", status=429)
+    for seconds in [0.01, 0.2, 0.3, 12.0]:
+        registry.observe("crawl_request_seconds", seconds, host="a.xyz")
+    registry.set("crawl_progress_done", 5, stage='say "hi"')
+
+    assert registry.total("crawl_requests_total", host="a.xyz") == 3
+    text = registry.to_prometheus()
+    assert 'crawl_requests_total{host="a.xyz",status="429"} 2' in text
+    assert 'crawl_request_seconds_bucket{host="a.xyz",le="0.25"} 2' in text
+    assert 'crawl_request_seconds_bucket{host="a.xyz",le="+Inf"} 4' in text
+    assert 'crawl_request_seconds_count{host="a.xyz"} 4' in text
+    assert 'crawl_progress_done{stage="say \\"hi\\""} 5' in text
+
+    summary = registry.summary()["a.xyz"]
+    assert summary["requests"] == 3
+    assert summary["retries"] == 2
+    assert summary["p50_s"] == 0.25
+
+    file_path = str(tmp_path / "metrics.prom")
+    registry.write_prometheus(file_path)
+    with open(file_path) as f:
+        assert f.read() == text
+
+
+def test_progress_events(tmp_path: Any) -> None:
+    log_file = str(tmp_path / "crawl.log")
+    metrics.setup_logging(logging.INFO, log_file)
+    progress = metrics.Progress("user_warpcast", total=10)
+    progress.advance(4, written=3)
+    progress.finish()
+    metrics.logger.handlers[0].flush()
+
+    with open(log_file) as f:
+        lines = [json.loads(line) for line in f]
+    assert lines[0]["event"] == "progress"
+    assert lines[0]["stage"] == "user_warpcast"
+    assert lines[0]["done"] == 4 and lines[0]["total"] == 10
+    assert lines[0]["written"] == 3
+    assert lines[0]["eta_s"] is not None
+    assert lines[1]["event"] == "stage_done"
+    assert metrics.registry.get("crawl_progress_done", stage="user_warpcast") == 4
+
+
+def test_event_without_setup(monkeypatch: Any, capsys: Any) -> None:
+    # e.g. an extract worker process: json on stderr, fields included
+    monkeypatch.setattr(metrics.logger, "handlers", [])
+    metrics.event("extract_failed", logging.WARNING, kind="cast", error="bad")
+    line = json.loads(capsys.readouterr().err)
+    assert line["event"] == "extract_failed" and line["level"] == "warning"
+    assert line["kind"] == "cast" and line["error"] == "bad"
@@ -0,0 +1,45 @@
+import asyncio
+import json
+from typing import Any
+
+from src import indexer, profiler
+
+
+@profiler.profile
+def build() -> int:
+    with profiler.stage("allocate"):
+        data = [0] * 1_000_000
+    return len(data)
+
+
+@profiler.profile
+async def fetch() -> int:
+    await asyncio.sleep(0)
+    return 1
+
+
+def test_profile_report(tmp_path: Any) -> None:
+    assert build() == 1_000_000  # no-op while the profiler is off
+    profiler.start("test")
+    with profiler.stage("run"):
+        build()
+        asyncio.run(fetch())
+        df = indexer.execute_query_df("SELECT range AS x FROM range(10)")
+    file_path = profiler.finish(str(tmp_path))
+    assert len(df) == 10
+    assert not profiler.enabled()
+
+    with open(file_path) as f:
+        report = json.load(f)
+    stages = {s["stage"]: s for s in report["stages"]}
+    assert set(stages) == {"run", "run/build", "run/build/allocate", "run/fetch"}
+    # ~8MB list, seen by the stage and everything above it
+    assert stages["run/build/allocate"]["peak_mb"] > 7
+    assert stages["run"]["peak_mb"] >= stages["run/build/allocate"]["peak_mb"]
+
+    [query] = report["queries"]
+    assert query["stage"] == "run"
+    assert query["backend"] == "duckdb"
+    assert query["rows"] == 10
+    assert "Total Time" in query["plan"]
+    assert query["execution_s"] is not None
@@ -0,0 +1,63 @@
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from src import search
+
+
+def make_casts() -> pd.DataFrame:
+    return pd.DataFrame(
+        [
+            ["0x1", 100, 1, None, "gm farcaster frens"],
+            ["0x2", 300, 2, "ethereum", "gas is high on ethereum today"],
+            ["0x3", 200, 1, "ethereum", "ethereum gas, high again"],
+            ["0x4", 400, 3, None, "High gas? just use a rollup"],
+            ["0x5", 500, 2, "purple", "gm"],
+        ],
+        columns=search.DOC_COLUMNS,
+    )
+
+
+def test_postings_roundtrip() -> None:
+    doc_ids = np.array([0, 3, 4, 100, 70000], dtype=np.int64)
+    decoded = search.decode_postings(search.encode_postings(doc_ids))
+    assert decoded.tolist() == doc_ids.tolist()
+    assert search.parse_query('gm "High gas" ') == (
+        ["gm", "high", "gas"],
+        [["high", "gas"]],
+    )
+
+
+def test_search_index(tmp_path: Any) -> None:
+    root = str(tmp_path / "search")
+    index = search.SearchIndex(root)
+    df = make_casts()
+    assert index.add(df.iloc[:3]) == 3
+    assert index.add(df) == 2  # already indexed casts are skipped
+    assert len(index) == 5
+
+    # reloaded from disk, newest first
+    index = search.SearchIndex(root)
+    assert index.search("gas high")["hash"].tolist() == ["0x4", "0x2", "0x3"]
+    assert index.search('"high gas"')["hash"].tolist() == ["0x4"]
+    assert index.search("gm", author_fid=2)["hash"].tolist() == ["0x5"]
+    assert index.search("gas", channel_id="ethereum", k=1)["hash"].tolist() == ["0x2"]
+    assert index.search("gas", t_from=200, t_until=400)["hash"].tolist() == [
+        "0x2",
+        "0x3",
+    ]
+    assert index.search("", channel_id="purple")["hash"].tolist() == ["0x5"]
+    assert index.search("nothing").empty
+
+    index.set_reaction_counts({"0x3": 5, "0x4": 1})
+    top = index.search("gas", order_by="reactions")
+    assert top["hash"].tolist() == ["0x3", "0x4", "0x2"]
+
+    index.compact()
+    assert len(index.segments) == 1
+    assert index.search("gas", order_by="reactions")["hash"].tolist() == [
+        "0x3",
+        "0x4",
+        "0x2",
+    ]
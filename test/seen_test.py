@@ -0,0 +1,62 @@
+from typing import Any
+
+from src import indexer, seen
+
+
+def test_bloom_filter() -> None:
+    bloom = seen.BloomFilter(10_000)
+    keys = [f"0x{i:x}" for i in range(10_000)]
+    bloom.add(keys)
+    assert bloom.contains(keys).all()
+    others = [f"other{i}" for i in range(10_000)]
+    assert bloom.contains(others).mean() < 0.03
+
+
+def test_seen_set(tmp_path: Any) -> None:
+    file_path = str(tmp_path / "seen.sqlite")
+    s = seen.SeenSet(file_path)
+    assert s.unseen("cast", ["a", "b", "a", "c"]) == [0, 1, 3]
+    s.add("cast", ["a", "b", "c"])
+    assert s.unseen("cast", ["c", "d", "a", "e"]) == [1, 3]
+    assert s.unseen("reaction", ["a"]) == [0]  # kinds are separate
+    assert s.stats["cast"] == {"new": 5, "duplicate": 3, "false_positive": 0}
+
+    # growing past the capacity rebuilds a bigger filter
+    keys = [str(i) for i in range(seen.MIN_CAPACITY + 10)]
+    s.add("cast", keys)
+    assert s.filters["cast"].capacity > seen.MIN_CAPACITY
+    assert s.unseen("cast", keys[-5:] + ["new"]) == [5]
+    s.close()
+
+    # the filter saved on close is used, a crashed run's keys still count
+    s = seen.SeenSet(file_path)
+    assert s.unseen("cast", ["a", "zz"]) == [1]
+    s.add("cast", ["zz"])
+    s.con.close()  # no close(), the saved filter is stale now
+    s = seen.SeenSet(file_path)
+    assert s.unseen("cast", ["zz", "a", "yy"]) == [2]
+    assert len(s) == len(keys) + 4
+
+
+def test_append_drops_duplicates(tmp_path: Any, monkeypatch: Any) -> None:
+    monkeypatch.setattr(indexer.BatchFetcher, "seen_file", str(tmp_path / "s.sqlite"))
+    monkeypatch.setattr(indexer.BatchFetcher, "seen_keys", None)
+    out = str(tmp_path / "q.ndjson")
+    items = [{"hash": h} for h in ["a", "b", "a"]]
+    written = indexer.BatchFetcher.append("cast", out, ["a", "b", "a"], items)
+    assert written == (2, 1)
+    lines = b'{"hash": "b"}\n{"hash": "c"}\n'
+    written = indexer.BatchFetcher.append("cast", out, ["b", "c"], lines=lines)
+    assert written == (1, 1)
+    with open(out) as f:
+        assert f.read() == '{"hash": "a"}\n{"hash": "b"}\n{"hash": "c"}\n'
+    assert indexer.BatchFetcher.dedupe_stats("cast") == {
+        "duplicates": 2,
+        "dup_rate": 0.4,
+    }
+    indexer.BatchFetcher.close_seen_set()
+
+    # off: everything is appended
+    monkeypatch.setattr(indexer.BatchFetcher, "seen_file", "")
+    assert indexer.BatchFetcher.append("cast", out, ["a"], [{"hash": "a"}]) == (1, 0)
+    assert indexer.BatchFetcher.dedupe_stats("cast") == {}
@@ -0,0 +1,82 @@
+import os
+from typing import Any
+
+import pandas as pd
+
+from src import indexer, segments
+
+
+def lines(start: int, stop: int) -> bytes:
+    return b"".join(
+        b'{"hash": "0x%d", "timestamp": %d}\n' % (i, i) for i in range(start, stop)
+    )
+
+
+def test_append_seal_consume(tmp_path: Any) -> None:
+    queue = str(tmp_path / "q.ndjson")
+    segments.append(queue, lines(0, 10))
+    assert segments.seal(queue) == [segments.segment_path(queue, 1)]
+    assert not os.path.exists(queue)
+    segments.append(queue, lines(10, 15))
+    assert segments.read(queue) == lines(0, 15)
+
+    pending = segments.seal(queue)
+    assert len(pending) == 2 and all(p.endswith(".zst") for p in pending)
+    segments.consume(pending[:1])
+    assert segments.pending(queue) == pending[1:]
+    assert segments.read(queue, consumed=False) == lines(10, 15)
+    assert segments.read(queue) == lines(0, 15)  # consumed ones are still there
+    assert segments.prune(queue) == 1
+    assert segments.read(queue) == lines(10, 15)
+    assert segments.seal(str(tmp_path / "empty.ndjson")) == []
+
+
+def test_torn_line_and_half_sealed(tmp_path: Any) -> None:
+    queue = str(tmp_path / "q.ndjson")
+    with open(queue, "wb") as f:  # a crash in the middle of a line
+        f.write(lines(0, 3) + b'{"hash": "0x3", "tim')
+    assert segments.read(queue) == lines(0, 3)
+    segments.append(queue, lines(3, 5))
+    assert segments.read(queue) == lines(0, 5)
+
+    # a crash after the move into the segment dir, before the compressed copy
+    os.makedirs(segments.segment_dir(queue))
+    os.replace(queue, os.path.join(segments.segment_dir(queue), "000000000001.ndjson"))
+    assert segments.read(queue) == lines(0, 5)
+    with open(f"{queue}.compacting", "wb") as f:  # the old daemon rotation
+        f.write(lines(5, 7))
+    assert segments.seal(queue) == [
+        segments.segment_path(queue, 1),
+        segments.segment_path(queue, 2),
+    ]
+    assert segments.read(queue) == lines(0, 7)
+
+
+def test_rotation_by_size(tmp_path: Any, monkeypatch: Any) -> None:
+    monkeypatch.setattr(segments, "SEGMENT_BYTES", 1000)
+    queue = str(tmp_path / "q.ndjson")
+    for i in range(0, 200, 10):
+        indexer.json_append(
+            queue, [{"hash": f"0x{j}", "timestamp": j} for j in range(i, i + 10)]
+        )
+    assert len(segments.pending(queue)) > 1
+    assert os.path.getsize(segments.pending(queue)[0]) < 1000  # compressed
+    df = indexer.read_ndjson(queue)
+    assert list(df["timestamp"]) == list(range(200))
+    assert sorted(indexer.get_property("timestamp", queue)) == list(range(1, 200))
+
+
+def test_merge_reads_pending_only(tmp_path: Any) -> None:
+    queue, data_file = str(tmp_path / "q.ndjson"), str(tmp_path / "casts.parquet")
+    segments.append(queue, lines(0, 10))
+    pending = segments.seal(queue)
+    df = indexer.Merger.cast(pending, data_file)
+    df.to_parquet(data_file, index=False)
+    segments.consume(pending)
+
+    segments.append(queue, lines(5, 20))
+    pending = segments.seal(queue)
+    assert indexer.read_ndjson(pending)["timestamp"].tolist() == list(range(5, 20))
+    df = indexer.Merger.cast(pending, data_file)
+    assert sorted(df["timestamp"]) == list(range(20))
+    assert isinstance(df, pd.DataFrame)
@@ -0,0 +1,60 @@
+from typing import Any
+
+import numpy as np
+
+from src import sketch
+
+
+def test_hyperloglog() -> None:
+    rng = np.random.default_rng(0)
+    a = sketch.HyperLogLog().add(np.arange(0, 60000))
+    b = sketch.HyperLogLog().add(np.arange(40000, 100000))
+    assert abs(a.count() - 60000) / 60000 < 0.03
+    assert abs(a.merge(b).count() - 100000) / 100000 < 0.03
+
+    small = sketch.HyperLogLog().add([f"0x{i}" for i in range(100)] + [None])
+    assert abs(small.count() - 100) <= 2
+
+    dup = sketch.HyperLogLog().add(rng.integers(0, 500, 100000))
+    assert abs(dup.count() - 500) <= 10
+
+
+def test_count_min_and_space_saving(tmp_path: Any) -> None:
+    rng = np.random.default_rng(1)
+    values = rng.zipf(1.5, 50000)
+    values = values[values < 10**6]
+    keys, counts = np.unique(values, return_counts=True)
+
+    cm = sketch.CountMinSketch(width=2048, depth=4).add(values)
+    estimates = cm.estimate(keys)
+    assert (estimates >= counts).all()
+    assert (estimates - counts).max() <= np.e / 2048 * len(values)
+
+    exact = dict(zip(keys.tolist(), counts.tolist()))
+    half = len(values) // 2
+    a = sketch.SpaceSaving(50)
+    a.add(values[:half].tolist())
+    b = sketch.SpaceSaving.from_counts(
+        dict(zip(*np.unique(values[half:], return_counts=True))), k=50
+    )
+    merged = a.merge(b)
+    for key, count, error in merged.top(10):
+        assert count - error <= exact[key] <= count
+    top_exact = sorted(exact, key=exact.get, reverse=True)[:3]  # type: ignore
+    assert [key for key, _, _ in merged.top(3)] == top_exact
+
+    day = sketch.DaySketches()
+    day.hlls["fid"] = sketch.HyperLogLog().add(values)
+    day.cms["fid"] = cm
+    day.sss["fid"] = merged
+    day.counts["rows"] = len(values)
+    path = str(tmp_path / "2023-07-01.npz")
+    day.save(path)
+    loaded = sketch.DaySketches.load(path)
+    assert loaded.hlls["fid"].count() == day.hlls["fid"].count()
+    assert loaded.sss["fid"].top(5) == merged.top(5)
+    assert (loaded.cms["fid"].table == cm.table).all()
+
+    both = loaded.merge(day)
+    assert both.counts["rows"] == 2 * len(values)
+    assert both.hlls["fid"].count() == day.hlls["fid"].count()
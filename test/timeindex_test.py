@@ -0,0 +1,62 @@
+import json
+import os
+from typing import Any
+
+import pandas as pd
+
+from src import indexer, timeindex
+
+
+def make_casts(n: int) -> pd.DataFrame:
+    # written out of order, the index sorts
+    ts = [1_000 + (i * 7919) % n for i in range(n)]
+    return pd.DataFrame({"hash": [f"0x{t}" for t in ts], "timestamp": ts})
+
+
+def test_write_and_range(tmp_path: Any) -> None:
+    file_path = str(tmp_path / "casts.parquet")
+    index = timeindex.write(make_casts(1000), file_path, row_group_size=100)
+
+    assert index["rows"] == 1000 and index["complete"]
+    assert index["min"] == 1_000 and index["max"] == 1_999
+    assert len(index["row_groups"]) == 10
+    assert timeindex.row_groups(index, 1_250, 1_350) == [2, 3]
+    assert timeindex.row_groups(index, 5_000) == []
+
+    df = timeindex.read_range(file_path, 1_250, 1_350, columns=["hash"])
+    assert list(df.columns) == ["hash"]
+    assert sorted(df["hash"]) == sorted(f"0x{t}" for t in range(1_250, 1_350))
+    assert len(timeindex.read_range(file_path, 5_000)) == 0
+    assert len(timeindex.read_range(file_path)) == 1000
+    assert len(timeindex.read_range(str(tmp_path / "missing.parquet"))) == 0
+
+    assert timeindex.high_watermark(file_path) == 1_999
+    assert indexer.QueueProducer.cast_warpcast(file_path) == 1_999
+    hashes = indexer.QueueProducer.reaction_warpcast(1_990, 2_000, file_path)
+    assert sorted(hashes) == [(f"0x{t}", None) for t in range(1_990, 2_000)]
+
+
+def test_stale_index_is_rebuilt(tmp_path: Any) -> None:
+    # a parquet written without the index (or rewritten behind its back)
+    file_path = str(tmp_path / "casts.parquet")
+    timeindex.write(make_casts(10), file_path)
+    make_casts(50).to_parquet(file_path, index=False)
+
+    assert timeindex.high_watermark(file_path) == 1_049
+    with open(timeindex.index_path(file_path)) as f:
+        assert json.load(f)["rows"] == 50
+
+    os.remove(timeindex.index_path(file_path))
+    assert len(timeindex.read_range(file_path, 1_010, 1_020)) == 10
+    assert os.path.exists(timeindex.index_path(file_path))
+
+
+def test_write_empty(tmp_path: Any) -> None:
+    # an empty merge neither fails nor replaces what's stored
+    file_path = str(tmp_path / "casts.parquet")
+    assert timeindex.write(pd.DataFrame(), file_path) == {}
+    assert not os.path.exists(file_path)
+
+    timeindex.write(make_casts(10), file_path)
+    assert timeindex.write(pd.DataFrame(), file_path)["rows"] == 10
+    assert len(timeindex.read_range(file_path)) == 10
@@ -0,0 +1,100 @@
+import json
+from typing import Any, Dict, List
+
+import pandas as pd
+
+from src import user_store
+
+
+def warpcast(fid: int, **fields: Any) -> Dict[str, Any]:
+    user = {
+        "fid": fid,
+        "username": f"user{fid}",
+        "display_name": f"User {fid}",
+        "pfp_url": None,
+        "bio_text": "gm",
+        "following_count": fid * 2,
+        "follower_count": fid * 3,
+        "location_id": f"place{fid % 3}",
+        "location_description": None,
+        "verified": fid % 2 == 0,
+        "is_active": True,
+        "inviter_fid": None,
+        "onchain_collections": [f"c{fid % 2}", "c9"] if fid % 4 else [],
+    }
+    return {**user, **fields}
+
+
+def searchcaster(fid: int, **fields: Any) -> Dict[str, Any]:
+    user = {
+        "fid": fid,
+        "generated_farcaster_address": f"0x{fid:040x}",
+        "address": None if fid % 3 else f"0x{fid:040d}",
+        "registered_at": 1_000 * fid,
+    }
+    return {**user, **fields}
+
+
+def write_ndjson(file_path: str, records: List[Dict[str, Any]]) -> None:
+    with open(file_path, "w") as f:
+        f.writelines(json.dumps(r) + "\n" for r in records)
+
+
+def test_schema() -> None:
+    assert user_store.schema().names == ["fid"] + list(user_store.COLUMNS)
+    assert user_store.schema("user_searchcaster").names == [
+        "fid",
+        "generated_farcaster_address",
+        "address",
+        "registered_at",
+    ]
+
+
+def test_upsert_and_get() -> None:
+    store = user_store.UserStore()
+    store.upsert("user_warpcast", pd.DataFrame([warpcast(i) for i in range(1, 6)]))
+    # only complete users are visible
+    assert len(store) == 0 and store.get(1) is None
+
+    store.upsert("user_searchcaster", pd.DataFrame([searchcaster(i) for i in [1, 2]]))
+    assert len(store) == 2
+    assert store.get(1) == {**warpcast(1), **searchcaster(1)}
+    assert store.get(3) is None and store.get(10_000) is None
+
+    # the last record of a fid wins, other sources' columns are untouched
+    records = [warpcast(2, username="old"), warpcast(2, bio_text=None, verified=None)]
+    store.upsert("user_warpcast", pd.DataFrame(records))
+    user = store.get(2)
+    assert user is not None
+    assert user["username"] == "user2" and user["bio_text"] is None
+    assert user["verified"] is None
+    assert user["address"] == searchcaster(2)["address"]
+
+
+def test_growth_and_round_trip(tmp_path: Any) -> None:
+    store = user_store.UserStore()
+    fids = list(range(1, 3000, 7))
+    store.upsert("user_warpcast", pd.DataFrame([warpcast(i) for i in fids]))
+    store.upsert("user_searchcaster", pd.DataFrame([searchcaster(i) for i in fids]))
+    assert store.capacity > max(fids) and len(store) == len(fids)
+
+    file_path = str(tmp_path / "users.parquet")
+    store.write_parquet(file_path)
+    loaded = user_store.UserStore.from_parquet(file_path)
+    assert loaded.to_arrow().equals(store.to_arrow())
+    assert [f.name for f in loaded.to_arrow().schema] == ["fid"] + list(
+        user_store.COLUMNS
+    )
+    assert len(user_store.UserStore.from_parquet(str(tmp_path / "missing"))) == 0
+
+
+def test_read_queue(tmp_path: Any) -> None:
+    # all null columns and extra fields don't trip the reader
+    file_path = str(tmp_path / "w.ndjson")
+    write_ndjson(file_path, [warpcast(i, extra=1) for i in range(1, 4)])
+    table = user_store.read_queue(file_path, "user_warpcast")
+    assert table.schema == user_store.schema("user_warpcast")
+    assert table.num_rows == 3
+
+    open(file_path, "w").close()
+    assert user_store.read_queue(file_path, "user_warpcast").num_rows == 0